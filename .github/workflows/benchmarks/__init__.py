@@ -0,0 +1,4 @@
+"""Benchmarks for the gitflow package, and the local fixtures they share with the tests.
+
+Nothing here is imported by the workflow; run the modules from ``.github/workflows``.
+"""
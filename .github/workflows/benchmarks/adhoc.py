@@ -0,0 +1,717 @@
+"""Ad-hoc benchmarks for the gitflow package.
+
+Run from ``.github/workflows``::
+
+    python -m benchmarks.adhoc dependencies --size 10000
+    python -m benchmarks.adhoc dispatch --size 200
+    python -m benchmarks.adhoc bulk_dispatch --size 100
+    python -m benchmarks.adhoc rate_limit --size 100
+    python -m benchmarks.adhoc flow_init --size 20
+    python -m benchmarks.adhoc network --size 200
+    python -m benchmarks.adhoc worktrees --size 2000
+    python -m benchmarks.adhoc orchestrate --size 16
+    python -m benchmarks.adhoc worker --size 20
+    python -m benchmarks.adhoc cold_start --size 20
+    python -m benchmarks.adhoc tracing --size 20000
+    python -m benchmarks.adhoc streaming --size 100
+    python -m benchmarks.adhoc snapshot --size 100000
+    python -m benchmarks.adhoc batch --size 20
+    python -m benchmarks.adhoc changelog --size 100000
+    python -m benchmarks.adhoc validation --size 2000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import requests
+
+from gitflow import tracing
+from gitflow.batch import run_batch
+from gitflow.changelog import Changelog
+from gitflow.dependencies import DependencyGraph, get_downstream_dependencies
+from gitflow.dispatch import RateLimiter, RepositoryDispatcher
+from gitflow.engine import GitFlowEngine
+from gitflow.gitflow import finish_feature_branch, git_flow_init, start_feature_branch
+from gitflow.orchestrator import FAILED, OK, SKIPPED, orchestrate
+from gitflow.run import GitSession
+from gitflow.snapshot import load_graph
+from gitflow.validation import DEFAULT_BRANCHES, PayloadError, validate_event
+from gitflow.worktrees import WorktreePool
+
+from .fixtures import (add_commits, gitflow_repository, isolated_env, release_clones, synthetic_repository,
+                       synthetic_tree, timeit)
+from .stubserver import StubDispatchServer
+
+
+def _legacy_get_upstream_dependencies(repo, dependencies, depth=-1):
+    # Recursive implementation that predates DependencyGraph, kept as a baseline.
+    upstream = dependencies.get(repo, [])
+    for dep in dependencies.get(repo, []):
+        if depth > 0:
+            depth -= 1
+            if depth == 0:
+                return upstream
+            else:
+                upstream.extend(_legacy_get_upstream_dependencies(dep, dependencies, depth))
+        else:
+            upstream.extend(_legacy_get_upstream_dependencies(dep, dependencies))
+    return upstream
+
+
+def _legacy_get_downstream_dependencies(repo, dependencies, depth=-1):
+    # Recursive implementation that predates DependencyGraph, kept as a baseline.
+    downstream = []
+    for repo_name, deps in dependencies.items():
+        if repo in deps:
+            downstream.append(repo_name)
+            if depth > 0:
+                depth -= 1
+                if depth == 0:
+                    return downstream
+                else:
+                    downstream.extend(_legacy_get_downstream_dependencies(repo_name, dependencies, depth))
+            else:
+                downstream.extend(_legacy_get_downstream_dependencies(repo_name, dependencies))
+    return downstream
+
+
+def bench_dependencies(nodes=10000, queries=20, seed=0):
+    """Downstream closure queries, legacy recursion vs. wrappers vs. one shared index.
+
+    The legacy upstream query extends the list it is iterating over, so it does not
+    terminate in reasonable time on graphs of this size and is left out of the
+    comparison; the indexed upstream closure of the root is timed on its own.
+    """
+    dependencies = synthetic_tree(nodes, seed=seed)
+    rng = random.Random(seed)
+    targets = [rng.choice(list(dependencies)) for _ in range(queries)]
+    root = next(iter(dependencies))
+
+    def legacy():
+        for target in targets:
+            _legacy_get_downstream_dependencies(target, dependencies)
+
+    def wrappers():
+        for target in targets:
+            get_downstream_dependencies(target, dependencies)
+
+    def indexed():
+        graph = DependencyGraph(dependencies)
+        for target in targets:
+            graph.downstream(target)
+
+    graph = DependencyGraph(dependencies)
+    return {
+        "nodes": nodes,
+        "queries": queries,
+        "legacy_s": timeit(legacy),
+        "wrappers_s": timeit(wrappers),
+        "indexed_s": timeit(indexed),
+        "build_s": timeit(DependencyGraph, dependencies),
+        "upstream_root_s": timeit(graph.upstream, root),
+    }
+
+
+def bench_dispatch(count=200):
+    """Sequential dispatches against a local stub server, one-shot requests vs. a pooled session."""
+    payload = {"inputs": {"feature_name": "bench"}}
+    with StubDispatchServer() as server:
+        url = f"{server.url}/repos/owner/repo/dispatches"
+
+        def unpooled():
+            for _ in range(count):
+                requests.post(url, json={"event_type": "bench", "client_payload": payload}).raise_for_status()
+
+        unpooled_s = timeit(unpooled)
+        unpooled_connections = server.connections
+
+        def pooled():
+            with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+                for _ in range(count):
+                    dispatcher.trigger("owner/repo", "bench", payload)
+
+        pooled_s = timeit(pooled)
+        pooled_connections = server.connections - unpooled_connections
+
+    return {
+        "requests": count,
+        "unpooled_s": unpooled_s,
+        "unpooled_conns": unpooled_connections,
+        "pooled_s": pooled_s,
+        "pooled_conns": pooled_connections,
+    }
+
+
+def bench_bulk_dispatch(count=100, latency=0.02, concurrencies=(1, 2, 4, 8, 16)):
+    """Bulk dispatch throughput against a stub server with fixed per-request latency."""
+    events = [("owner/repo-%d" % i, "bench", None) for i in range(count)]
+    result = {"requests": count, "latency_s": latency}
+    with StubDispatchServer(latency=latency) as server:
+        for concurrency in concurrencies:
+            with RepositoryDispatcher("token", api_url=server.url, pool_size=concurrency) as dispatcher:
+                elapsed = timeit(dispatcher.trigger_many, events, concurrency)
+            result["x%d_per_s" % concurrency] = count / elapsed
+    return result
+
+
+def bench_rate_limit(count=100, quota=20, window=0.5, concurrency=8):
+    """Bulk dispatch into a stub server whose quota runs out, with and without retries."""
+    events = [("owner/repo-%d" % i, "bench", None) for i in range(count)]
+    result = {"requests": count, "quota_per_s": quota / window}
+    for label, options in (("naive", {"max_retries": 0, "rate_limiter": RateLimiter(low_watermark=0)}),
+                           ("retry", {"max_retries": 10, "backoff": 0.05, "rate_limiter": RateLimiter()})):
+        with StubDispatchServer(quota=quota, window=window, retry_after=None) as server:
+            with RepositoryDispatcher("token", api_url=server.url, pool_size=concurrency, **options) as dispatcher:
+                start = time.perf_counter()
+                results = dispatcher.trigger_many(events, concurrency)
+                elapsed = time.perf_counter() - start
+        result[label + "_failed"] = sum(1 for outcome in results if not outcome.ok)
+        result[label + "_rejected"] = server.rejected
+        result[label + "_per_s"] = (count - result[label + "_failed"]) / elapsed
+    return result
+
+
+def bench_flow_init(repeats=20):
+    """Repeated ``git_flow_init`` on an initialized repository vs. always running ``git flow init -d``."""
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        session = gitflow_repository(os.path.join(directory, "repo"), env)
+        result = {"repeats": repeats}
+
+        def checked():
+            for _ in range(repeats):
+                git_flow_init(GitSession(session.cwd, env))
+
+        spawns = session.spawns
+        result["checked_cold_s"] = timeit(checked)
+
+        def checked_warm():
+            for _ in range(repeats):
+                git_flow_init(session)
+
+        result["checked_warm_s"] = timeit(checked_warm)
+        result["warm_spawns_per_call"] = (session.spawns - spawns) / repeats
+        session.close()
+        if shutil.which("git-flow"):
+            def full():
+                for _ in range(repeats):
+                    subprocess.run(["git", "flow", "init", "-d", "-f"], cwd=session.cwd, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+
+            result["full_init_s"] = timeit(full)
+        else:
+            result["full_init_s"] = "n/a (git-flow not installed)"
+    return result
+
+
+# Sits between git and upload-pack/receive-pack on the remote side, passing everything
+# through and appending "<bytes to the remote> <bytes from the remote>" to a log file.
+_RELAY = """
+import os, subprocess, sys, threading
+log, command = sys.argv[1], sys.argv[2:]
+child = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+counts = [0, 0]
+def pump(source, target, index):
+    while True:
+        chunk = source.read1(65536)
+        if not chunk:
+            break
+        counts[index] += len(chunk)
+        target.write(chunk)
+        target.flush()
+    target.close()
+upstream = threading.Thread(target=pump, args=(sys.stdin.buffer, child.stdin, 0), daemon=True)
+upstream.start()
+pump(child.stdout, sys.stdout.buffer, 1)
+child.wait()
+with open(log, "a") as f:
+    f.write("%d %d\\n" % tuple(counts))
+# git may keep our stdin open until we exit; don't wait for the reader thread
+os._exit(child.returncode)
+"""
+
+
+class _LegacyEngine(GitFlowEngine):
+    """The engine with git-flow's network traffic: a full fetch and one push per branch, plus ``--tags``."""
+
+    def fetch(self, branches, error_class, optional=(), tips_only=False):
+        if self.has_remote and not self._fetched:
+            self._run(["fetch", "-q", self.remote], "fetching from %s" % self.remote)
+            self._fetched.add(None)
+
+    def _publish(self, updates, description, error_class):
+        self._apply([update for update in updates if update[1] != update[2]], description)
+        for ref, new, old in updates:
+            if ref.startswith("refs/heads/"):
+                branch = ref[len("refs/heads/"):]
+                self._run(["push", self.remote, ":%s" % branch if new is None else branch], "pushing %s" % branch)
+        if any(ref.startswith("refs/tags/") for ref, _, _ in updates):
+            self._run(["push", self.remote, "--tags"], "pushing tags")
+
+    def _set_upstream(self, branch):
+        self._run(["branch", "--set-upstream-to", "%s/%s" % (self.remote, branch), branch], "tracking")
+
+
+def _busy_remote(path, env, branches, tags):
+    """Bare gitflow remote with ``branches`` unrelated feature branches and ``tags`` tags."""
+    session = gitflow_repository(path + ".seed", env)
+    blob = session.run(["hash-object", "-w", "--stdin"], input=os.urandom(4096)).stdout.decode().strip()
+    lines = []
+    for index in range(branches):
+        tree = session.run(["mktree"], input=b"100644 blob %s\tfile-%d\n" % (blob.encode(), index)).stdout
+        commit = session.run(["commit-tree", tree.decode().strip(), "-p", "develop", "-m", "work %d" % index])
+        lines.append("create refs/heads/feature/other-%d %s" % (index, commit.stdout.decode().strip()))
+        if index < tags:
+            lines.append("create refs/tags/v0.%d %s" % (index, commit.stdout.decode().strip()))
+    session.run(["update-ref", "--stdin"], input=("\n".join(lines) + "\n").encode())
+    session.run(["clone", "-q", "--bare", session.cwd, path])
+    return session
+
+
+def _advance(session, remote, branches):
+    """Add one commit to each of the unrelated branches on the remote, as other people would."""
+    lines = []
+    for index in range(branches):
+        ref = "refs/heads/feature/other-%d" % index
+        commit = session.run(["commit-tree", "%s^{tree}" % ref, "-p", ref, "-m", "more work"]).stdout.decode()
+        lines.append("update %s %s" % (ref, commit.strip()))
+    session.run(["update-ref", "--stdin"], input=("\n".join(lines) + "\n").encode())
+    session.run(["push", "-q", "--force", remote, "refs/heads/feature/*:refs/heads/feature/*"])
+
+
+def bench_network(branches=200, tags=100):
+    """Round trips and bytes exchanged with a local bare remote for a feature and a release, old vs. new traffic.
+
+    The remote carries ``branches`` unrelated feature branches (and ``tags`` tags) that
+    others keep pushing to; git talks to it through a relay that counts connections
+    and bytes in each direction.
+    """
+    result = {"branches": branches, "tags": tags}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        seed = _busy_remote(os.path.join(directory, "template.git"), env, branches, tags)
+        relay = os.path.join(directory, "relay.py")
+        with open(relay, "w") as f:
+            f.write(_RELAY)
+        for name, engine_class in (("legacy", _LegacyEngine), ("engine", GitFlowEngine)):
+            remote = os.path.join(directory, name + ".git")
+            shutil.copytree(os.path.join(directory, "template.git"), remote)
+            GitSession(directory, env).run(["clone", "-q", remote, os.path.join(directory, name)])
+            session = GitSession(os.path.join(directory, name), env)
+            log = os.path.join(directory, name + ".log")
+            for key, program in (("uploadpack", "git-upload-pack"), ("receivepack", "git-receive-pack")):
+                session.run(["config", "remote.origin.%s" % key, "%s %s %s %s" % (sys.executable, relay, log, program)])
+            for key in ("gitflow.branch.master", "gitflow.branch.develop", "gitflow.prefix.feature",
+                        "gitflow.prefix.release", "gitflow.prefix.versiontag"):
+                value = seed.run(["config", key]).stdout.decode().strip()
+                session.run(["config", key, value])
+            for key in ("gitflow.prefix.bugfix", "gitflow.prefix.hotfix", "gitflow.prefix.support"):
+                session.run(["config", key, key.rpartition(".")[2] + "/"])
+            session.run(["branch", "develop", "origin/develop"])
+
+            elapsed = time.perf_counter()
+            engine_class(session).start_feature("x")
+            elapsed = time.perf_counter() - elapsed
+            _advance(seed, remote, branches)
+            session.run(["checkout", "-q", "feature/x"])
+            session.run(["commit", "-q", "--allow-empty", "-m", "feature work"])
+            start = time.perf_counter()
+            engine_class(session).finish_feature("x")
+            elapsed += time.perf_counter() - start
+            _advance(seed, remote, branches)
+            start = time.perf_counter()
+            engine_class(session).start_release("1.0")
+            engine_class(session).finish_release("1.0")
+            result[name + "_s"] = elapsed + time.perf_counter() - start
+            with open(log) as f:
+                counts = [tuple(map(int, line.split())) for line in f]
+            result[name + "_trips"] = len(counts)
+            result[name + "_sent"] = sum(sent for sent, _ in counts)
+            result[name + "_received"] = sum(received for _, received in counts)
+    return result
+
+
+def _disk_usage(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.lstat(os.path.join(root, name)).st_size
+    return total
+
+
+def bench_worktrees(files=2000, operations=20):
+    """``operations`` checkouts of develop: a fresh clone each vs. a recycled worktree from a pool."""
+    result = {"files": files, "operations": operations}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        seed = gitflow_repository(os.path.join(directory, "seed"), env)
+        blob = seed.run(["hash-object", "-w", "--stdin"], input=os.urandom(2048)).stdout.decode().strip()
+        listing = "".join("100644 blob %s\tfile-%d\n" % (blob, index) for index in range(files))
+        tree = seed.run(["mktree"], input=listing.encode()).stdout.decode().strip()
+        commit = seed.run(["commit-tree", tree, "-p", "develop", "-m", "files"]).stdout.decode().strip()
+        seed.run(["update-ref", "refs/heads/develop", commit])
+        remote = os.path.join(directory, "origin.git")
+        seed.run(["clone", "-q", "--bare", seed.cwd, remote])
+        clones = os.path.join(directory, "clones")
+        os.mkdir(clones)
+
+        def clone():
+            for index in range(operations):
+                # no hardlinks, like cloning from the real remote
+                GitSession(clones, env).run(["clone", "-q", "--no-local", "-b", "develop", remote, str(index)])
+
+        result["clone_s"] = timeit(clone)
+        result["clone_bytes"] = _disk_usage(clones)
+        GitSession(directory, env).run(["clone", "-q", remote, os.path.join(directory, "work")])
+        with WorktreePool(os.path.join(directory, "work"), size=4, env=env) as pool:
+            def pooled():
+                for _ in range(operations):
+                    with pool.checkout("develop") as session:
+                        session.run(["checkout", "-q", "--detach", "origin/develop"])
+
+            result["pool_s"] = timeit(pooled)
+            result["pool_bytes"] = _disk_usage(pool.directory)
+            result["pool_created"] = pool.created
+    return result
+
+
+def bench_orchestrate(repos=16, processes=(1, 4)):
+    """``finish_release`` across a dependency tree of ``repos`` local repositories, by number of processes.
+
+    One repository halfway down the tree conflicts, so its dependants are skipped.
+    """
+    dependencies = synthetic_tree(repos)
+    root = next(iter(dependencies))
+    failing = "repo-%05d" % (repos // 2)
+    result = {"repos": repos}
+    for count in processes:
+        with tempfile.TemporaryDirectory() as directory:
+            env = isolated_env(directory)
+            clones = release_clones(directory, env, dependencies, conflicting=(failing,))
+            start = time.perf_counter()
+            results = orchestrate("finish_release", root, dependencies, clones, "1.0", upstream_scope=-1,
+                                  processes=count, env=env)
+            result["processes_%d_s" % count] = time.perf_counter() - start
+        for status in (OK, FAILED, SKIPPED):
+            result[status] = sum(1 for outcome in results if outcome.status == status)
+    return result
+
+
+_MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def bench_worker(events=20):
+    """``start_feature`` events through ``main.py``: one process per event vs. one worker draining a queue."""
+    result = {"events": events}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        seed = gitflow_repository(os.path.join(directory, "seed"), env)
+        seed.run(["clone", "-q", "--bare", seed.cwd, os.path.join(directory, "origin.git")])
+        workspace = os.path.join(directory, "work")
+        seed.run(["clone", "-q", os.path.join(directory, "origin.git"), workspace])
+        env.update({"GH_TOKEN": "unused", "GITHUB_WORKSPACE": workspace, "GITHUB_REPOSITORY": "owner/repo",
+                    "GITHUB_EVENT_NAME": "repository_dispatch"})
+        queue = os.path.join(directory, "queue")
+        os.mkdir(queue)
+
+        def event(name):
+            return {"action": "start_feature", "client_payload": {"inputs": {"feature_name": name}}}
+
+        def cold():
+            for index in range(events):
+                path = os.path.join(directory, "event.json")
+                with open(path, "w") as f:
+                    json.dump(event("cold-%d" % index), f)
+                subprocess.run([sys.executable, _MAIN], env=dict(env, GITHUB_EVENT_PATH=path), check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        def drain():
+            subprocess.run([sys.executable, _MAIN, "worker", "--queue-dir", queue, "--drain"], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        result["cold_per_event_s"] = timeit(cold) / events
+        startup = timeit(drain)
+        for index in range(events):
+            with open(os.path.join(queue, "%04d.json" % index), "w") as f:
+                json.dump(event("warm-%d" % index), f)
+        result["worker_startup_s"] = startup
+        result["warm_per_event_s"] = (timeit(drain) - startup) / events
+        result["failed_events"] = len(os.listdir(os.path.join(queue, "failed")))
+    return result
+
+
+def _import_time(statement, repeats):
+    """Median import time of ``python -X importtime -c <statement>`` next to ``main.py``, in seconds.
+
+    Adds up the cumulative times of the top-level imports, so it includes the
+    interpreter's own start-up imports; subtract the time for ``pass``.
+    """
+    totals = []
+    for _ in range(repeats):
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=os.path.dirname(_MAIN),
+                                stderr=subprocess.PIPE, check=True).stderr.decode()
+        total = 0
+        for line in stderr.splitlines():
+            fields = line.split("|")
+            # nested imports are indented by two more spaces per level
+            if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith("  "):
+                total += int(fields[1])
+        totals.append(total / 1e6)
+    return sorted(totals)[len(totals) // 2]
+
+
+def bench_cold_start(repeats=20):
+    """Import time of ``main.py``, and of the handlers an event loads, beyond the interpreter's own.
+
+    For the per-module breakdown run ``python -X importtime -c 'import main'``.
+    """
+    baseline = _import_time("pass", repeats)
+    result = {"repeats": repeats, "python_s": baseline}
+    for key, statement in (("import_main_s", "import main"),
+                           ("one_action_s", "import main; main.router.handler('start_feature')"),
+                           ("all_actions_s", "import main; [main.router.handler(action) for action in main.ROUTES]")):
+        result[key] = _import_time(statement, repeats) - baseline
+    return result
+
+
+def bench_tracing(lookups=20000, commands=200):
+    """Cost of the tracing hooks: ref lookups (the cheapest traced call) and git commands, tracing off vs. on."""
+    result = {"lookups": lookups, "commands": commands}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        session = gitflow_repository(os.path.join(directory, "repo"), env)
+        session.rev_parse("refs/heads/develop")
+
+        def lookup():
+            for _ in range(lookups):
+                session.rev_parse("refs/heads/develop")
+
+        def command():
+            for _ in range(commands):
+                session.run(["rev-parse", "HEAD"])
+
+        for state, path in (("off", None), ("on", os.path.join(directory, "trace.jsonl"))):
+            if path:
+                tracing.enable(path)
+            result["lookup_%s_us" % state] = timeit(lookup) / lookups * 1e6
+            result["command_%s_ms" % state] = timeit(command) / commands * 1e3
+            tracing.disable()
+        result["span_records"] = sum(1 for _ in open(os.path.join(directory, "trace.jsonl")))
+        session.close()
+    return result
+
+
+def bench_streaming(megabytes=100):
+    """Peak Python memory and time for a command printing ``megabytes`` MB: buffered vs. streamed.
+
+    The output starts with a conflict message, so streaming with ``stop_on`` gives up after the first line.
+    """
+    result = {"megabytes": megabytes}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        session = gitflow_repository(os.path.join(directory, "repo"), env)
+        content = b"CONFLICT (content): Merge conflict in file.txt\n" + b"x" * 79 + b"\n"
+        content += (b"y" * 79 + b"\n") * (megabytes * 1024 * 1024 // 80)
+        blob = session.run(["hash-object", "-w", "--stdin"], input=content).stdout.decode().strip()
+        del content
+        for name, function in (("run", lambda: session.run(["cat-file", "-p", blob])),
+                               ("stream", lambda: session.stream(["cat-file", "-p", blob])),
+                               ("stop", lambda: session.stream(["cat-file", "-p", blob], check=False,
+                                                               stop_on=("conflict",)))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            function()
+            result["%s_s" % name] = time.perf_counter() - start
+            result["%s_peak_mb" % name] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+            tracemalloc.stop()
+    return result
+
+
+def bench_snapshot(nodes=100000, queries=20, seed=0):
+    """Loading a dependency manifest of ``nodes`` repositories: JSON into a dict-based graph vs. a mapped snapshot.
+
+    Memory is what the loaded graph holds on the Python heap; the snapshot's pages
+    are file-backed and shared between processes mapping the same file.
+    """
+    dependencies = synthetic_tree(nodes, seed=seed)
+    rng = random.Random(seed)
+    targets = [rng.choice(list(dependencies)) for _ in range(queries)]
+    result = {"nodes": nodes, "queries": queries}
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = os.path.join(directory, "dependencies.json")
+        with open(manifest, "w") as f:
+            json.dump(dependencies, f)
+        del dependencies
+
+        def from_json():
+            with open(manifest) as f:
+                return DependencyGraph(json.load(f))
+
+        start = time.perf_counter()
+        load_graph(manifest).close()
+        result["snapshot_build_s"] = time.perf_counter() - start
+        result["snapshot_kb"] = os.path.getsize(manifest + ".graph") // 1024
+        result["manifest_kb"] = os.path.getsize(manifest) // 1024
+        for name, load in (("dict", from_json), ("mapped", lambda: load_graph(manifest))):
+            tracemalloc.start()
+            start = time.perf_counter()
+            graph = load()
+            result["%s_load_s" % name] = time.perf_counter() - start
+            result["%s_heap_kb" % name] = tracemalloc.get_traced_memory()[0] // 1024
+            tracemalloc.stop()
+            start = time.perf_counter()
+            for target in targets:
+                graph.downstream(target)
+                graph.upstream(target)
+            result["%s_queries_s" % name] = time.perf_counter() - start
+            del graph
+    return result
+
+
+def bench_batch(features=20):
+    """Starting and finishing ``features`` features against a local bare remote: one run each vs. one batch.
+
+    A run each is what one dispatch per feature costs beyond runner boot: a fresh
+    session, ``git_flow_init`` and the operation, with its own fetch and push.
+    """
+    result = {"features": features}
+    names = ["sprint-%d" % index for index in range(features)]
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        seed = gitflow_repository(os.path.join(directory, "seed"), env)
+        config = [line.split(" ", 1) for line in seed.run(["config", "--get-regexp", "^gitflow"]).stdout.decode()
+                  .splitlines()]
+        for mode in ("single", "batch"):
+            remote = os.path.join(directory, mode + ".git")
+            seed.run(["clone", "-q", "--bare", seed.cwd, remote])
+            work = os.path.join(directory, mode)
+            seed.run(["clone", "-q", remote, work])
+            setup = GitSession(work, env)
+            for key, value in config:
+                setup.run(["config", key, value])
+            round_trips = 0
+            for step, operation, single in (("start", "start_feature", start_feature_branch),
+                                            ("finish", "finish_feature", finish_feature_branch)):
+                if step == "finish":
+                    add_commits(setup, ["refs/heads/feature/%s" % name for name in names])
+                tracer = tracing.enable()
+                start = time.perf_counter()
+                if mode == "single":
+                    for name in names:
+                        session = GitSession(work, env)
+                        git_flow_init(session)
+                        single(name, session)
+                else:
+                    session = GitSession(work, env)
+                    git_flow_init(session)
+                    run_batch(operation, names, session)
+                result["%s_%s_s" % (mode, step)] = time.perf_counter() - start
+                tracing.disable()
+                round_trips += sum(tracer.totals.get(key, [0])[0] for key in ("git fetch", "git push"))
+            result["%s_round_trips" % mode] = round_trips
+            result["%s_merged" % mode] = len(setup.run(["rev-list", "--merges", "origin/develop"]).stdout.splitlines())
+    return result
+
+
+def bench_changelog(commits=100000, tags=20):
+    """Release notes on a history of ``commits`` commits with ``tags`` version tags.
+
+    ``history_s`` is a plain walk of the whole history for comparison; the full
+    changelog is timed with an empty per-tag cache and again with a filled one.
+    """
+    result = {"commits": commits, "tags": tags}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        session = synthetic_repository(os.path.join(directory, "repo.git"), env, commits, 0, tags, 100)
+        session.run(["config", "gitflow.prefix.versiontag", "v"])
+        changelog = Changelog(GitFlowEngine(session))
+        result["history_s"] = timeit(session.run, ["log", "--format=%h %s", "develop"])
+        start = time.perf_counter()
+        summary = changelog.release_notes("develop")
+        result["release_notes_s"] = time.perf_counter() - start
+        result["release_commits"] = summary.count
+        result["changelog_cold_s"] = timeit(changelog.render_all)
+        result["changelog_warm_s"] = timeit(changelog.render_all)
+    return result
+
+
+def bench_validation(branches=2000):
+    """Rejecting a finish of a missing feature against a remote with ``branches`` branches and tags.
+
+    ``run_s`` is how long the run took to fail before: git flow setup, then the operation
+    fetching and failing. ``check_s`` is the check that now runs first.
+    """
+    result = {"branches": branches}
+    event = {"action": "finish_feature", "client_payload": {"inputs": {"feature_name": "missing"}}}
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        remote = synthetic_repository(os.path.join(directory, "origin.git"), env, 100, branches, branches, 10)
+        remote.run(["clone", "-q", "--depth", "1", remote.cwd, os.path.join(directory, "work")])
+        session = GitSession(os.path.join(directory, "work"), env)
+        for key, value in DEFAULT_BRANCHES.items():
+            kind = "branch" if key in ("master", "develop") else "prefix"
+            session.run(["config", "gitflow.%s.%s" % (kind, key), value])
+        start = time.perf_counter()
+        try:
+            git_flow_init(session)
+            finish_feature_branch("missing", session)
+        except Exception:
+            pass
+        result["run_s"] = time.perf_counter() - start
+        result["run_spawns"] = session.spawns
+        session = GitSession(session.cwd, env)
+        start = time.perf_counter()
+        try:
+            validate_event(event, session)
+        except PayloadError as error:
+            result["problems"] = len(error.problems)
+        result["check_s"] = time.perf_counter() - start
+        result["check_spawns"] = session.spawns
+        event["client_payload"]["inputs"]["feature_name"] = "bench-0"
+        result["accepted_s"] = timeit(validate_event, event, session)
+    return result
+
+
+BENCHMARKS = {
+    "dependencies": bench_dependencies,
+    "dispatch": bench_dispatch,
+    "bulk_dispatch": bench_bulk_dispatch,
+    "rate_limit": bench_rate_limit,
+    "flow_init": bench_flow_init,
+    "network": bench_network,
+    "worktrees": bench_worktrees,
+    "orchestrate": bench_orchestrate,
+    "worker": bench_worker,
+    "cold_start": bench_cold_start,
+    "tracing": bench_tracing,
+    "streaming": bench_streaming,
+    "snapshot": bench_snapshot,
+    "batch": bench_batch,
+    "changelog": bench_changelog,
+    "validation": bench_validation,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--size", type=int, help="problem size; each benchmark has its own default")
+    args = parser.parse_args(argv)
+    # the package logs every git and HTTP call (and every expected failure) which would dominate the timings
+    logging.getLogger().setLevel(logging.CRITICAL)
+    benchmark = BENCHMARKS[args.benchmark]
+    result = benchmark() if args.size is None else benchmark(args.size)
+    for key, value in result.items():
+        print("%-16s %s" % (key, "%.4f" % value if isinstance(value, float) else value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Synthetic repositories and timing helpers shared by the benchmarks and the tests.
+
+Everything is local: repositories are created in a caller-provided directory with an
+environment (:func:`isolated_env`) that ignores the user's git config, so nothing
+touches the network or the developer's setup::
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        remote = synthetic_repository(os.path.join(directory, "origin.git"), env, commits=100)
+"""
+import os
+import random
+import time
+
+from gitflow.run import GitSession
+
+
+# the gitflow config main.py sets up
+GITFLOW_CONFIG = {
+    "gitflow.branch.master": "main",
+    "gitflow.branch.develop": "develop",
+    "gitflow.prefix.feature": "feature/",
+    "gitflow.prefix.bugfix": "bugfix/",
+    "gitflow.prefix.release": "release/",
+    "gitflow.prefix.hotfix": "hotfix/",
+    "gitflow.prefix.support": "support/",
+    "gitflow.prefix.versiontag": "v",
+}
+
+
+def isolated_env(directory):
+    """Environment for git that ignores the user's config and has a commit identity."""
+    env = dict(os.environ)
+    env.update({
+        "GIT_CONFIG_GLOBAL": os.path.join(directory, "gitconfig"),
+        "GIT_CONFIG_NOSYSTEM": "1",
+        "GIT_AUTHOR_NAME": "bench",
+        "GIT_AUTHOR_EMAIL": "bench@example.com",
+        "GIT_COMMITTER_NAME": "bench",
+        "GIT_COMMITTER_EMAIL": "bench@example.com",
+    })
+    return env
+
+
+def gitflow_repository(path, env):
+    """Local repository with main/develop branches and :data:`GITFLOW_CONFIG`."""
+    session = GitSession(os.path.dirname(path), env)
+    session.run(["init", "-q", "-b", "main", path])
+    session = GitSession(path, env)
+    session.run(["commit", "-q", "--allow-empty", "-m", "Initial commit"])
+    session.run(["branch", "develop"])
+    for key, value in GITFLOW_CONFIG.items():
+        session.run(["config", key, value])
+    return session
+
+
+def add_commits(session, refs):
+    """Give each of ``refs`` one commit adding a file of its own and push them, as work on them would."""
+    lines = []
+    for index, ref in enumerate(refs):
+        blob = session.run(["hash-object", "-w", "--stdin"], input=ref.encode()).stdout.decode().strip()
+        tree = session.run(["mktree"], input=b"100644 blob %s\tfile-%d\n" % (blob.encode(), index)).stdout
+        commit = session.run(["commit-tree", tree.decode().strip(), "-p", ref, "-m", "work on %s" % ref])
+        lines.append("update %s %s" % (ref, commit.stdout.decode().strip()))
+    session.run(["update-ref", "--stdin"], input=("\n".join(lines) + "\n").encode())
+    session.run(["push", "-q", "origin"] + ["%s:%s" % (ref, ref) for ref in refs])
+
+
+def release_clones(directory, env, repos, conflicting=()):
+    """A bare remote and a clone with a started ``release/1.0`` per repository, under ``directory``.
+
+    Repositories in ``conflicting`` have a commit on main that conflicts with the release.
+    """
+    os.makedirs(os.path.join(directory, "seeds"))
+    for repo in repos:
+        seed = gitflow_repository(os.path.join(directory, "seeds", repo), env)
+        for branch in ("release/1.0", "main") if repo in conflicting else ("release/1.0",):
+            blob = seed.run(["hash-object", "-w", "--stdin"], input=branch.encode()).stdout.decode().strip()
+            tree = seed.run(["mktree"], input=b"100644 blob %s\tVERSION\n" % blob.encode()).stdout.decode()
+            commit = seed.run(["commit-tree", tree.strip(), "-p", "develop", "-m", "Bump version"])
+            seed.run(["update-ref", "refs/heads/%s" % branch, commit.stdout.decode().strip()])
+        remote = os.path.join(directory, "remotes", repo + ".git")
+        seed.run(["clone", "-q", "--bare", seed.cwd, remote])
+        seed.run(["clone", "-q", remote, os.path.join(directory, "clones", repo)])
+    # every clone picks the gitflow config up from the isolated global config
+    session = GitSession(directory, env)
+    for key, value in GITFLOW_CONFIG.items():
+        session.run(["config", "--global", key, value])
+    return os.path.join(directory, "clones")
+
+
+def _fast_import_stream(commits, branches, tags, files, seed=0):
+    """``git fast-import`` input for a gitflow repository of the given size.
+
+    develop gets ``commits`` commits on top of one adding ``files`` files, each changing
+    one file; main points halfway up develop, with ``tags`` annotated version tags
+    spread over its history; ``feature/bench-<i>`` branches fork off develop at random
+    points and add a file of their own, so finishing them never conflicts.
+    """
+    rng = random.Random(seed)
+    out = []
+    when = 1700000000
+
+    def data(text):
+        raw = text.encode()
+        out.append(b"data %d\n%s\n" % (len(raw), raw))
+
+    def commit(ref, mark, parent, message, changes):
+        nonlocal when
+        when += 60
+        out.append(b"commit %s\nmark :%d\ncommitter bench <bench@example.com> %d +0000\n" % (ref.encode(), mark, when))
+        data(message)
+        if parent:
+            out.append(b"from :%d\n" % parent)
+        for path, content in changes:
+            out.append(b"M 100644 inline %s\n" % path.encode())
+            data(content)
+
+    commit("refs/heads/develop", 1, None, "Initial commit",
+           [("src/file-%05d.txt" % index, "file %d\n" % index) for index in range(max(files, 1))])
+    for mark in range(2, commits + 2):
+        index = rng.randrange(max(files, 1))
+        commit("refs/heads/develop", mark, mark - 1, "Change %d" % mark,
+               [("src/file-%05d.txt" % index, "file %d, revision %d\n" % (index, mark))])
+    tip = commits + 1
+    middle = max(1, tip // 2)
+    out.append(b"reset refs/heads/main\nfrom :%d\n\n" % middle)
+    for index in range(tags):
+        out.append(b"tag v0.%d.0\nfrom :%d\ntagger bench <bench@example.com> %d +0000\n"
+                   % (index, 1 + (middle - 1) * index // max(tags, 1), when))
+        data("Release 0.%d.0" % index)
+    for index in range(branches):
+        commit("refs/heads/feature/bench-%d" % index, tip + 1 + index, rng.randint(1, tip), "Feature %d" % index,
+               [("features/bench-%d.txt" % index, "feature %d\n" % index)])
+    return b"".join(out)
+
+
+def synthetic_repository(path, env, commits=1000, branches=20, tags=20, files=500, seed=0):
+    """Create a bare gitflow repository at ``path`` (see :func:`_fast_import_stream`)."""
+    session = GitSession(os.path.dirname(path), env)
+    session.run(["init", "-q", "--bare", "-b", "main", path])
+    session = GitSession(path, env)
+    session.run(["fast-import", "--quiet"], input=_fast_import_stream(commits, branches, tags, files, seed))
+    session.run(["symbolic-ref", "HEAD", "refs/heads/main"])
+    return session
+
+
+def synthetic_tree(nodes, seed=0):
+    """Random dependency tree of ``nodes`` repositories.
+
+    A tree (rather than a general DAG) keeps the legacy recursive functions from
+    going exponential on shared dependencies, so both sides can be timed.
+    """
+    rng = random.Random(seed)
+    names = ["repo-%05d" % i for i in range(nodes)]
+    dependencies = {name: [] for name in names}
+    for i in range(1, nodes):
+        dependencies[names[rng.randrange(i)]].append(names[i])
+    return dependencies
+
+
+def timeit(fn, *args):
+    """Seconds one call of ``fn(*args)`` takes."""
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def measure(timings, name, function, *args):
+    """Time one call of ``function(*args)`` and append the seconds to ``timings[name]``."""
+    timings.setdefault(name, []).append(timeit(function, *args))
+
+
+def commit_files(session, ref, files, message="Change files"):
+    """Commit ``{path: content}`` (top-level files only) on top of ``ref`` without a working tree.
+
+    :param ref: Full ref name to move to the new commit; it is created if it does not exist.
+    :return: Object id of the new commit.
+    """
+    parent = session.rev_parse(ref)
+    entries = {}
+    if parent is not None:
+        for line in session.run(["ls-tree", parent]).stdout.decode().splitlines():
+            info, _, path = line.partition("\t")
+            entries[path] = info
+    for path, content in files.items():
+        blob = session.run(["hash-object", "-w", "--stdin"], input=content.encode()).stdout.decode().strip()
+        entries[path] = "100644 blob %s" % blob
+    listing = "".join("%s\t%s\n" % (info, path) for path, info in sorted(entries.items()))
+    tree = session.run(["mktree"], input=listing.encode()).stdout.decode().strip()
+    args = ["commit-tree", tree, "-m", message] + (["-p", parent] if parent else [])
+    commit = session.run(args).stdout.decode().strip()
+    session.run(["update-ref", ref, commit])
+    return commit
@@ -0,0 +1,129 @@
+"""Local stand-in for the GitHub repository dispatch endpoint.
+
+Used by the benchmarks and the tests (and handy when poking at the dispatch client by hand)
+so that nothing has to talk to the real API::
+
+    with StubDispatchServer() as server:
+        RepositoryDispatcher("token", api_url=server.url).trigger("owner/repo", "start_feature")
+"""
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_DISPATCH_PATH = re.compile(r"^/repos/(?P<repository>[^/]+/[^/]+)/dispatches$")
+
+
+class _DispatchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        match = _DISPATCH_PATH.match(self.path)
+        repository = match.group("repository") if match else None
+        with self.server.lock:
+            self.server.requests.append((repository, body))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        status, headers = self.server.respond(repository, body, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_response(404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class StubDispatchServer(ThreadingHTTPServer):
+    """Threaded HTTP/1.1 server that accepts ``POST /repos/OWNER/REPO/dispatches``.
+
+    Args:
+        statuses (dict, optional): Status code to answer per repository. A list of codes is answered
+            in turn, repeating the last one. Defaults to 204 for all.
+        token (str, optional): If given, requests with a different token get a 401.
+        latency (float, optional): Seconds to wait before answering each request. Defaults to 0.
+        quota (int, optional): If given, requests allowed per ``window`` before answering 403 with
+            ``X-RateLimit-Remaining: 0``, like the primary rate limit.
+        window (float, optional): Length of a quota window in seconds. Defaults to 1.
+        retry_after (int, optional): ``Retry-After`` seconds sent with 429 responses. Defaults to None.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, statuses=None, token=None, latency=0, quota=None, window=1.0, retry_after=None):
+        super().__init__(("127.0.0.1", 0), _DispatchHandler)
+        self.statuses = {repository: list(codes) if isinstance(codes, (list, tuple)) else [codes]
+                         for repository, codes in (statuses or {}).items()}
+        self.token = token
+        self.latency = latency
+        self.quota = quota
+        self.window = window
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.rejected = 0
+        self._window_start = time.time()
+        self._window_used = 0
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def respond(self, repository, body, headers):
+        """Status code and extra headers to answer a dispatch request with."""
+        response_headers = {}
+        with self.lock:
+            if self.quota is not None:
+                now = time.time()
+                if now - self._window_start >= self.window:
+                    self._window_start = now
+                    self._window_used = 0
+                reset = self._window_start + self.window
+                remaining = max(self.quota - self._window_used, 0)
+                response_headers["X-RateLimit-Limit"] = str(self.quota)
+                response_headers["X-RateLimit-Reset"] = "%.3f" % reset
+                if remaining == 0:
+                    self.rejected += 1
+                    response_headers["X-RateLimit-Remaining"] = "0"
+                    return 403, response_headers
+                self._window_used += 1
+                response_headers["X-RateLimit-Remaining"] = str(remaining - 1)
+            codes = self.statuses.get(repository, [204])
+            status = codes.pop(0) if len(codes) > 1 else codes[0]
+        if repository is None:
+            return 404, response_headers
+        if self.token is not None and headers.get("Authorization") != f"token {self.token}":
+            return 401, response_headers
+        if status == 429:
+            with self.lock:
+                self.rejected += 1
+            if self.retry_after is not None:
+                response_headers["Retry-After"] = str(self.retry_after)
+        return status, response_headers
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
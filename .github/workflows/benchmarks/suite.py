@@ -0,0 +1,157 @@
+"""Regression benchmarks for the gitflow operations and dependency queries.
+
+Everything runs against synthetic local repositories, so nothing touches the network.
+Run from ``.github/workflows``::
+
+    python -m benchmarks.suite run --commits 5000 --files 2000 --output new.json
+    python -m benchmarks.suite compare old.json new.json --threshold 0.2
+
+``compare`` exits with status 1 if any benchmark got slower by more than the threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from gitflow.dependencies import ClosureCache, DependencyGraph, get_downstream_dependencies, get_release_waves, \
+    get_upstream_dependencies
+from gitflow.gitflow import (finish_feature_branch, finish_hotfix_branch, finish_release_branch, git_configure,
+                      git_configure_many, git_flow_init, git_flow_initialized, next_release_version,
+                      start_feature_branch, start_hotfix_branch, start_release_branch)
+from gitflow.run import GitSession
+from .fixtures import GITFLOW_CONFIG, isolated_env, measure, synthetic_repository, synthetic_tree
+
+def bench_operations(directory, env, repeats, commits, branches, tags, files):
+    """Time each public operation of :mod:`gitflow.gitflow` ``repeats`` times on a clone of a synthetic repository."""
+    remote = os.path.join(directory, "origin.git")
+    synthetic_repository(remote, env, commits, max(branches, repeats), tags, files)
+    work = os.path.join(directory, "work")
+    GitSession(directory, env).run(["clone", "-q", remote, work])
+    git_configure_many(GITFLOW_CONFIG, GitSession(work, env))
+
+    timings = {}
+    for index in range(repeats):
+        # a fresh session each time, like a one-shot run of main.py
+        def session():
+            return GitSession(work, env)
+
+        measure(timings, "git_flow_initialized", git_flow_initialized, session())
+        measure(timings, "git_flow_init", git_flow_init, session())
+        measure(timings, "git_configure", git_configure, "bench.run", str(index), session())
+        measure(timings, "git_configure_many", git_configure_many,
+                 dict(GITFLOW_CONFIG, **{"bench.run": "x%d" % index}), session())
+        measure(timings, "next_release_version", next_release_version, "minor", session())
+        measure(timings, "start_feature_branch", start_feature_branch, "suite-%d" % index, session())
+        measure(timings, "finish_feature_branch", finish_feature_branch, "bench-%d" % index, session())
+        measure(timings, "start_release_branch", start_release_branch, "99.%d.0" % index, session())
+        measure(timings, "finish_release_branch", finish_release_branch, "99.%d.0" % index, session())
+        measure(timings, "start_hotfix_branch", start_hotfix_branch, "99.%d.1" % index, session())
+        measure(timings, "finish_hotfix_branch", finish_hotfix_branch, "99.%d.1" % index, session())
+    return timings
+
+
+def bench_dependency_queries(repeats, nodes):
+    """Time graph construction and the closure and wave queries on a synthetic tree of ``nodes`` repositories."""
+    dependencies = synthetic_tree(nodes)
+    names = list(dependencies)
+    root, leaf = names[0], names[-1]
+    graph = DependencyGraph(dependencies)
+    cache = ClosureCache(graph)
+    timings = {}
+    for _ in range(repeats):
+        measure(timings, "DependencyGraph", DependencyGraph, dependencies)
+        measure(timings, "get_upstream_dependencies", get_upstream_dependencies, root, graph)
+        measure(timings, "get_downstream_dependencies", get_downstream_dependencies, leaf, graph)
+        measure(timings, "get_release_waves", get_release_waves, root, graph, -1, 0)
+        measure(timings, "ClosureCache.upstream", cache.upstream, root)
+    return timings
+
+
+def run(repeats=5, commits=1000, branches=20, tags=20, files=500, nodes=10000):
+    """All benchmarks; returns the JSON-serialisable results document."""
+    with tempfile.TemporaryDirectory() as directory:
+        env = isolated_env(directory)
+        timings = bench_operations(directory, env, repeats, commits, branches, tags, files)
+    timings.update(bench_dependency_queries(repeats, nodes))
+    git_version = subprocess.run(["git", "--version"], stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+    return {
+        "parameters": {"repeats": repeats, "commits": commits, "branches": branches, "tags": tags, "files": files,
+                       "nodes": nodes},
+        "environment": {"python": platform.python_version(), "git": git_version, "platform": platform.platform()},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": {name: {"median": sorted(values)[len(values) // 2], "min": min(values), "max": max(values),
+                           "runs": len(values)}
+                    for name, values in timings.items()},
+    }
+
+
+def compare(baseline, current, threshold=0.2, statistic="median"):
+    """``[(name, baseline, current, change)]`` for benchmarks in both documents, and the names that regressed.
+
+    ``change`` is the relative change of ``statistic``; a benchmark regressed if it grew by more than ``threshold``.
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(baseline["results"]) & set(current["results"])):
+        before = baseline["results"][name][statistic]
+        after = current["results"][name][statistic]
+        change = (after - before) / before if before else 0.0
+        rows.append((name, before, after, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--commits", type=int, default=1000)
+    run_parser.add_argument("--branches", type=int, default=20)
+    run_parser.add_argument("--tags", type=int, default=20)
+    run_parser.add_argument("--files", type=int, default=500)
+    run_parser.add_argument("--nodes", type=int, default=10000, help="repositories in the dependency tree")
+    run_parser.add_argument("--output", help="results file; defaults to stdout")
+    compare_parser = commands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2,
+                                help="relative slowdown that counts as a regression (default: 0.2)")
+    compare_parser.add_argument("--statistic", choices=("median", "min", "max"), default="median")
+    args = parser.parse_args(argv)
+    # the package logs every git call at DEBUG, which would dominate the timings
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    if args.command == "run":
+        results = run(args.repeats, args.commits, args.branches, args.tags, args.files, args.nodes)
+        text = json.dumps(results, indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    if baseline.get("parameters") != current.get("parameters"):
+        print("warning: the runs used different parameters: %s vs. %s"
+              % (baseline.get("parameters"), current.get("parameters")), file=sys.stderr)
+    rows, regressions = compare(baseline, current, args.threshold, args.statistic)
+    print("%-30s %12s %12s %9s" % ("benchmark", "baseline ms", "current ms", "change"))
+    for name, before, after, change in rows:
+        print("%-30s %12.3f %12.3f %+8.1f%%%s" % (name, before * 1000, after * 1000, change * 100,
+                                                  "  REGRESSION" if name in regressions else ""))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,21 @@
 import logging
 
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+_console_handler = None
 
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)
-console_handler.setFormatter(formatter)
 
-logger.addHandler(console_handler)
+def configure_logging(level=logging.DEBUG):
+    """Log everything from ``level`` up to stderr, as the action does.
+
+    Importing the package sets nothing up; ``main.py`` calls this when it runs.
+    Calling it again only changes the level.
+    """
+    global _console_handler
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _console_handler is None:
+        _console_handler = logging.StreamHandler()
+        _console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        root.addHandler(_console_handler)
+    _console_handler.setLevel(level)
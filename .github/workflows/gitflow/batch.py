@@ -0,0 +1,80 @@
+"""One gitflow operation on many branches, with one fetch and one push for all of them.
+
+Closing out a sprint finishes a dozen features; doing it in one run shares the
+process, the git flow setup and the traffic with the remote. Each target succeeds or
+fails on its own: one that conflicts is reported and left alone, the others go on.
+All the branch and tag changes that succeeded are then pushed together atomically, so
+if the remote rejects that push none of them is kept::
+
+    results = run_batch("finish_feature", ["login", "search", "billing"])
+    failed = [result for result in results if not result.ok]
+"""
+from collections import namedtuple
+
+from . import logger, tracing
+from .engine import _MERGE_ERRORS, GitFlowEngine
+
+OPERATIONS = ("start_feature", "finish_feature", "start_release", "finish_release", "start_hotfix", "finish_hotfix")
+
+
+class BatchResult(namedtuple("BatchResult", ["name", "error"])):
+    """Outcome of the operation on one target; ``error`` is a message or None."""
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class BatchError(Exception):
+    """Raised by callers that treat any failed target as a failure of the whole batch."""
+
+    def __init__(self, message, results=()):
+        self.message = message
+        self.results = list(results)
+
+
+def _message(error):
+    return "%s: %s" % (type(error).__name__, getattr(error, "message", None) or error)
+
+
+def run_batch(operation, names, session=None, remote="origin"):
+    """Run ``operation`` on each of ``names`` (branch names without prefix), in order.
+
+    :param operation: One of :data:`OPERATIONS`, e.g. ``"finish_feature"``.
+    :param session: :class:`~gitflow.run.GitSession` to run git in; defaults to the shared one.
+    :return: A :class:`BatchResult` per name, in the same order.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unknown operation: %s" % operation)
+    engine = GitFlowEngine(session, remote)
+    kind = operation.partition("_")[2]
+    error_class = _MERGE_ERRORS[kind]
+    errors = {}
+    with tracing.span("batch", operation=operation, targets=len(names)):
+        if engine.has_remote:
+            # one fetch up front; the operations then find every branch already fetched
+            base = [engine.master if operation == "start_hotfix" else engine.develop]
+            if operation in ("finish_release", "finish_hotfix"):
+                base.append(engine.master)
+            engine.fetch(base, error_class, optional=[engine.prefix(kind) + name for name in names],
+                         tips_only=operation.startswith("start_"))
+        engine.begin_batch()
+        try:
+            for name in names:
+                try:
+                    getattr(engine, operation)(name)
+                except Exception as error:
+                    logger.error("%s %s failed: %s", operation, name, _message(error))
+                    errors[name] = _message(error)
+        finally:
+            try:
+                engine.end_batch(error_class)
+            except Exception as error:
+                # nothing was kept, so the targets that went through failed as well
+                logger.error("Pushing the %s batch failed: %s", operation, _message(error))
+                for name in names:
+                    errors.setdefault(name, _message(error))
+    results = [BatchResult(name, errors.get(name)) for name in names]
+    for result in results:
+        logger.info("%s %s: %s", operation, result.name, "ok" if result.ok else result.error)
+    return results
@@ -0,0 +1,166 @@
+"""Release notes from the commits since the previous version tag.
+
+Commit subjects are read in a single pass over one ``git log`` of just the new range
+(previous version tag to the release), streamed rather than collected, and sorted by
+their conventional-commit type (``feat:``, ``fix(scope):``, ``perf!:`` ...). Summaries
+of tagged releases are kept on disk in the repository's git directory, so a full
+changelog only ever walks the commits of releases it has not seen before::
+
+    changelog = Changelog()
+    print(changelog.release_notes("release/1.4.0").render())
+    print(changelog.render_all())
+
+Finishing a release or hotfix puts its notes into the tag annotation.
+"""
+import json
+import os
+import re
+import subprocess
+from collections import namedtuple
+from urllib.parse import quote
+
+from . import tracing
+
+SECTIONS = (("feat", "Features"), ("fix", "Bug fixes"), ("perf", "Performance"))
+OTHER = "Other changes"
+_SUBJECT = re.compile(r"^(?P<kind>\w+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?: (?P<text>.+)$")
+_FORMAT = "%h%x1f%s"
+
+
+def parse_subject(subject):
+    """``(section, entry, breaking)`` for a commit subject; unconventional subjects go under :data:`OTHER`."""
+    match = _SUBJECT.match(subject)
+    if match is None:
+        return OTHER, subject, False
+    kind = match.group("kind").lower()
+    section = dict(SECTIONS).get(kind, OTHER)
+    text = match.group("text")
+    if match.group("scope"):
+        text = "%s: %s" % (match.group("scope"), text)
+    return section, text, bool(match.group("breaking"))
+
+
+class ReleaseSummary(namedtuple("ReleaseSummary", ["previous", "commit", "count", "sections", "breaking"])):
+    """Commits between ``previous`` (a tag, or None for the start of history) and ``commit``.
+
+    ``sections`` maps section titles to ``"<entry> (<short sha>)"`` lines, oldest
+    first; ``breaking`` lists the entries marked with ``!``.
+    """
+
+    def render(self, limit=50):
+        """Plain-text notes, listing at most ``limit`` entries per section."""
+        lines = []
+        titles = [title for _, title in SECTIONS] + [OTHER]
+        if self.breaking:
+            titles.insert(0, "Breaking changes")
+        for title in titles:
+            entries = self.breaking if title == "Breaking changes" else self.sections.get(title, [])
+            if not entries:
+                continue
+            lines.append("%s:" % title)
+            lines.extend("- %s" % entry for entry in entries[:limit])
+            if len(entries) > limit:
+                lines.append("- ... and %d more" % (len(entries) - limit))
+        return "\n".join(lines)
+
+
+class Changelog:
+    """Release notes for the repository of ``engine``.
+
+    :param engine: :class:`~gitflow.engine.GitFlowEngine` whose session and ``versiontag``
+        prefix to use; defaults to one on the shared session.
+    :param cache_dir: Where to keep per-tag summaries; defaults to ``<git dir>/gitflow-changelog``.
+    """
+
+    def __init__(self, engine=None, cache_dir=None):
+        if engine is None:
+            from .engine import GitFlowEngine
+            engine = GitFlowEngine()
+        self.engine = engine
+        self.session = engine.session
+        self.cache_dir = cache_dir or os.path.join(engine.git_dir, "gitflow-changelog")
+
+    @property
+    def prefix(self):
+        return self.engine.prefix("versiontag")
+
+    def previous_tag(self, commit):
+        """Closest version tag reachable from ``commit`` (including one on ``commit`` itself), or None.
+
+        The remote's version tags are fetched first, so a clone without tags finds it as well.
+        """
+        self.engine.fetch_tags()
+        result = self.session.run(["describe", "--tags", "--abbrev=0", "--match", "%s*" % self.prefix, commit],
+                                  check=False)
+        if result.returncode != 0:
+            return None
+        return result.stdout.decode().strip() or None
+
+    def summarize(self, start, end):
+        """:class:`ReleaseSummary` of the non-merge commits in ``start..end``; all of ``end``'s if ``start`` is None."""
+        sections = {}
+        breaking = []
+        count = 0
+        args = ["log", "--no-merges", "--reverse", "--format=%s" % _FORMAT, end if start is None else
+                "%s..%s" % (start, end)]
+        with tracing.span("git", command=" ".join(args)) as span:
+            process = self.session.popen(args, stdout=subprocess.PIPE)
+            for line in process.stdout:
+                sha, _, subject = line.decode(errors="replace").rstrip("\n").partition("\x1f")
+                section, text, is_breaking = parse_subject(subject)
+                entry = "%s (%s)" % (text, sha)
+                sections.setdefault(section, []).append(entry)
+                if is_breaking:
+                    breaking.append(entry)
+                count += 1
+            process.stdout.close()
+            span.set(returncode=process.wait(), commits=count)
+        if process.returncode != 0:
+            raise ValueError("Cannot read the commits of %s" % (end if start is None else "%s..%s" % (start, end)))
+        commit = self.session.rev_parse("%s^{commit}" % end)
+        return ReleaseSummary(start, commit, count, sections, breaking)
+
+    def release_notes(self, commit):
+        """:class:`ReleaseSummary` of what ``commit`` (e.g. a release branch) adds since the previous version tag."""
+        return self.summarize(self.previous_tag(commit), commit)
+
+    def _cache_path(self, tag):
+        return os.path.join(self.cache_dir, quote(tag, safe="") + ".json")
+
+    def tag_summary(self, tag):
+        """:class:`ReleaseSummary` of version tag ``tag`` since the one before it, from the cache if possible."""
+        commit = self.session.rev_parse("refs/tags/%s^{commit}" % tag)
+        if commit is None:
+            raise ValueError("Tag '%s' does not exist" % tag)
+        path = self._cache_path(tag)
+        try:
+            with open(path) as f:
+                summary = ReleaseSummary(**json.load(f))
+            # a tag that was moved gets summarized again
+            if summary.commit == commit:
+                return summary
+        except (OSError, ValueError, TypeError):
+            pass
+        parent = self.session.rev_parse("%s^" % commit)
+        summary = self.summarize(self.previous_tag(parent) if parent else None, commit)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temporary = "%s.%d" % (path, os.getpid())
+        with open(temporary, "w") as f:
+            json.dump(summary._asdict(), f)
+        os.replace(temporary, path)
+        return summary
+
+    def tags(self):
+        """Version tags, newest version first."""
+        self.engine.fetch_tags()
+        output = self.session.run(["for-each-ref", "--sort=-v:refname", "--format=%(refname:lstrip=2)",
+                                   "refs/tags/%s*" % self.prefix]).stdout.decode()
+        return output.split()
+
+    def render_all(self, limit=50):
+        """Changelog of every version tag, newest first."""
+        parts = []
+        for tag in self.tags():
+            summary = self.tag_summary(tag)
+            parts.append("%s\n\n%s" % (tag, summary.render(limit) or "No changes."))
+        return "\n\n".join(parts)
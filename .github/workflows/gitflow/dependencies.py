@@ -1,3 +1,311 @@
+from collections import OrderedDict, deque, namedtuple
+
+
+class DependencyCycleError(Exception):
+    """Raised if the repositories to be scheduled depend on each other in a cycle."""
+
+    def __init__(self, cycle):
+        self.cycle = cycle
+        self.message = "Dependency cycle detected: %s" % " -> ".join(cycle)
+        super().__init__(self.message)
+
+
+class DependencyGraph:
+    """Precomputed index over a ``{repo: [upstream repos]}`` dependency mapping.
+
+    Repository names are interned to integer ids once, and forward (upstream) and
+    reverse (downstream) adjacency lists are built from the mapping in a single
+    pass. Closure queries are then a breadth-first walk over the relevant index,
+    which is O(V+E) per query regardless of how the mapping was laid out.
+
+    :example:
+        >>> example_dependencies = {
+        ...     'A': ['B'],
+        ...     'B': ['C'],
+        ...     'C': ['D'],
+        ...     'D': []
+        ... }
+        >>> graph = DependencyGraph(example_dependencies)
+        >>> graph.upstream('A')
+        ['B', 'C', 'D']
+        >>> graph.downstream('D', 2)
+        ['C', 'B']
+        >>> 'A' in graph, 'E' in graph
+        (True, False)
+
+    :param dependencies: Mapping of repository name to the repositories it depends on.
+    """
+
+    def __init__(self, dependencies):
+        self._ids = {}
+        self._names = []
+        self._forward = []
+        self._reverse = []
+        for repo, deps in dependencies.items():
+            src = self._intern(repo)
+            for dep in deps:
+                dst = self._intern(dep)
+                self._forward[src].append(dst)
+                self._reverse[dst].append(src)
+
+    def _intern(self, repo):
+        node = self._ids.get(repo)
+        if node is None:
+            node = len(self._names)
+            self._ids[repo] = node
+            self._names.append(repo)
+            self._forward.append([])
+            self._reverse.append([])
+        return node
+
+    def __contains__(self, repo):
+        return repo in self._ids
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def repos(self):
+        """All repository names in the graph, in interning order."""
+        return list(self._names)
+
+    def add_edge(self, repo, dependency):
+        """Record that ``repo`` depends on ``dependency``; no-op if it already does."""
+        src = self._intern(repo)
+        dst = self._intern(dependency)
+        if dst not in self._forward[src]:
+            self._forward[src].append(dst)
+            self._reverse[dst].append(src)
+
+    def remove_edge(self, repo, dependency):
+        """Forget that ``repo`` depends on ``dependency``; no-op if it does not."""
+        src = self._ids.get(repo)
+        dst = self._ids.get(dependency)
+        if src is None or dst is None:
+            return
+        self._forward[src] = [node for node in self._forward[src] if node != dst]
+        self._reverse[dst] = [node for node in self._reverse[dst] if node != src]
+
+    def _closure_ids(self, start, adjacency, depth):
+        if depth == 0:
+            return []
+        seen = {start}
+        result = []
+        frontier = deque([(start, 0)])
+        while frontier:
+            node, level = frontier.popleft()
+            if 0 <= depth <= level:
+                continue
+            for neighbour in adjacency[node]:
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    result.append(neighbour)
+                    frontier.append((neighbour, level + 1))
+        return result
+
+    def _closure(self, repo, adjacency, depth):
+        start = self._ids.get(repo)
+        if start is None:
+            return []
+        return [self._names[node] for node in self._closure_ids(start, adjacency, depth)]
+
+    def upstream(self, repo, depth=-1):
+        """Repositories ``repo`` depends on, directly or transitively.
+
+        :param repo: Repository name.
+        :param depth: Number of levels to follow; negative for no limit, ``0`` for none.
+        :return: Repository names in breadth-first order, without duplicates.
+        """
+        return self._closure(repo, self._forward, depth)
+
+    def downstream(self, repo, depth=-1):
+        """Repositories that depend on ``repo``, directly or transitively.
+
+        :param repo: Repository name.
+        :param depth: Number of levels to follow; negative for no limit, ``0`` for none.
+        :return: Repository names in breadth-first order, without duplicates.
+        """
+        return self._closure(repo, self._reverse, depth)
+
+    def waves(self, repos):
+        """Split ``repos`` into topologically ordered waves, dependencies first.
+
+        Repositories within a wave do not depend on each other (within ``repos``),
+        so each wave can be released in parallel once the previous one is done.
+        Names that are not in the graph have no known dependencies and go first.
+
+        :example:
+            >>> graph = DependencyGraph({'app': ['lib', 'cli'], 'cli': ['lib'], 'lib': ['core'], 'core': []})
+            >>> graph.waves(['app', 'cli', 'lib', 'core'])
+            [['core'], ['lib'], ['cli'], ['app']]
+            >>> graph.waves(['app', 'cli', 'core'])
+            [['cli', 'core'], ['app']]
+
+        :param repos: Repository names to schedule.
+        :return: List of waves, each a list of repository names.
+        :raises DependencyCycleError: If the repositories depend on each other in a cycle.
+        """
+        unknown = []
+        members = set()
+        for repo in repos:
+            node = self._ids.get(repo)
+            if node is None:
+                unknown.append(repo)
+            else:
+                members.add(node)
+        pending = {node: sum(1 for dep in set(self._forward[node]) if dep in members) for node in members}
+        wave = sorted(node for node, count in pending.items() if count == 0)
+        result = [unknown + [self._names[node] for node in wave]] if unknown or wave else []
+        while wave:
+            following = []
+            for node in wave:
+                del pending[node]
+                for dependant in set(self._reverse[node]):
+                    if dependant in pending:
+                        pending[dependant] -= 1
+                        if pending[dependant] == 0:
+                            following.append(dependant)
+            wave = sorted(following)
+            if wave:
+                result.append([self._names[node] for node in wave])
+        if pending:
+            raise DependencyCycleError(self._find_cycle(pending))
+        return result
+
+    def _find_cycle(self, remaining):
+        # Every remaining node still waits on a remaining dependency, so following
+        # those edges from any of them must eventually revisit a node.
+        node = min(remaining)
+        path = []
+        position = {}
+        while node not in position:
+            position[node] = len(path)
+            path.append(node)
+            node = next(dep for dep in self._forward[node] if dep in remaining)
+        cycle = path[position[node]:] + [node]
+        return [self._names[node] for node in cycle]
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "invalidations", "size", "maxsize"])
+
+
+class ClosureCache:
+    """LRU cache of closure queries over a :class:`DependencyGraph`.
+
+    Entries are keyed by ``(repo, direction, depth)``. Edge edits must go through
+    :meth:`add_edge` and :meth:`remove_edge` so that only the entries whose closure
+    could have used that edge are dropped; the rest of the cache stays warm.
+
+    :example:
+        >>> cache = ClosureCache(DependencyGraph({'A': ['B'], 'B': ['C'], 'D': []}), maxsize=8)
+        >>> cache.upstream('A'), cache.upstream('A'), cache.downstream('D')
+        (['B', 'C'], ['B', 'C'], [])
+        >>> cache.add_edge('C', 'D')
+        >>> cache.upstream('A'), cache.downstream('D')
+        (['B', 'C', 'D'], ['C', 'B', 'A'])
+        >>> cache.cache_info()
+        CacheInfo(hits=1, misses=4, evictions=0, invalidations=2, size=2, maxsize=8)
+
+    :param graph: The graph to query; a plain dependency mapping is indexed first.
+    :param maxsize: Maximum number of cached closures; ``None`` for unbounded.
+    """
+
+    UPSTREAM = "upstream"
+    DOWNSTREAM = "downstream"
+
+    def __init__(self, graph, maxsize=1024):
+        self.graph = _as_graph(graph)
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._keys_by_node = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _lookup(self, repo, direction, depth):
+        if depth < 0:
+            depth = -1
+        key = (repo, direction, depth)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return list(entry[0])
+        self.misses += 1
+        graph = self.graph
+        start = graph._ids.get(repo)
+        if start is None:
+            return []
+        adjacency = graph._forward if direction == self.UPSTREAM else graph._reverse
+        ids = graph._closure_ids(start, adjacency, depth)
+        nodes = frozenset(ids).union((start,))
+        result = [graph._names[node] for node in ids]
+        self._entries[key] = (result, nodes)
+        for node in nodes:
+            self._keys_by_node.setdefault(node, set()).add(key)
+        if self.maxsize is not None:
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return list(result)
+
+    def _drop(self, key):
+        _, nodes = self._entries.pop(key)
+        for node in nodes:
+            keys = self._keys_by_node[node]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_node[node]
+
+    def _invalidate(self, direction, source, target=None):
+        # Entries that reached ``source`` may now reach (or no longer reach) ``target``.
+        keys = self._keys_by_node.get(source, ())
+        stale = [key for key in keys
+                 if key[1] == direction and (target is None or target in self._entries[key][1])]
+        for key in stale:
+            self._drop(key)
+        self.invalidations += len(stale)
+
+    def upstream(self, repo, depth=-1):
+        """Cached :meth:`DependencyGraph.upstream`."""
+        return self._lookup(repo, self.UPSTREAM, depth)
+
+    def downstream(self, repo, depth=-1):
+        """Cached :meth:`DependencyGraph.downstream`."""
+        return self._lookup(repo, self.DOWNSTREAM, depth)
+
+    def add_edge(self, repo, dependency):
+        """Add an edge to the graph and invalidate the closures it can extend."""
+        self.graph.add_edge(repo, dependency)
+        ids = self.graph._ids
+        self._invalidate(self.UPSTREAM, ids[repo])
+        self._invalidate(self.DOWNSTREAM, ids[dependency])
+
+    def remove_edge(self, repo, dependency):
+        """Remove an edge from the graph and invalidate the closures that contained it."""
+        ids = self.graph._ids
+        if repo not in ids or dependency not in ids:
+            return
+        self.graph.remove_edge(repo, dependency)
+        self._invalidate(self.UPSTREAM, ids[repo], ids[dependency])
+        self._invalidate(self.DOWNSTREAM, ids[dependency], ids[repo])
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_node.clear()
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions, self.invalidations,
+                         len(self._entries), self.maxsize)
+
+
+def _as_graph(dependencies):
+    if isinstance(dependencies, (DependencyGraph, ClosureCache)):
+        return dependencies
+    return DependencyGraph(dependencies)
+
+
 def get_upstream_dependencies(repo, dependencies, depth=-1):
     """
     :example:
@@ -7,7 +315,7 @@ def get_upstream_dependencies(repo, dependencies, depth=-1):
         ...     'C': ['D'],
         ...     'D': []
         ... }
-        >>> get_upstream_dependencies('B', dependencies, -1)
+        >>> get_upstream_dependencies('B', example_dependencies, -1)
         ['C', 'D']
 
     :example:
@@ -22,21 +330,12 @@ def get_upstream_dependencies(repo, dependencies, depth=-1):
 
 
     :param repo:
-    :param dependencies:
-    :param depth:
+    :param dependencies: Mapping of repository to its dependencies, or a prebuilt :class:`DependencyGraph`
+        or :class:`ClosureCache`.
+    :param depth: Number of levels to follow; negative for no limit, ``0`` for none.
     :return:
     """
-    upstream = dependencies.get(repo, [])
-    for dep in dependencies.get(repo, []):
-        if depth > 0:
-            depth -= 1
-            if depth == 0:
-                return upstream
-            else:
-                upstream.extend(get_upstream_dependencies(dep, dependencies, depth))
-        else:
-            upstream.extend(get_upstream_dependencies(dep, dependencies))
-    return upstream
+    return _as_graph(dependencies).upstream(repo, depth)
 
 
 def get_downstream_dependencies(repo, dependencies, depth=-1):
@@ -48,7 +347,7 @@ def get_downstream_dependencies(repo, dependencies, depth=-1):
         ...     'C': ['D'],
         ...     'D': []
         ... }
-        >>> get_downstream_dependencies('B', dependencies)
+        >>> get_downstream_dependencies('B', example_dependencies)
         ['A']
 
     :example:
@@ -58,7 +357,7 @@ def get_downstream_dependencies(repo, dependencies, depth=-1):
         ...     'C': ['D'],
         ...     'D': []
         ... }
-        >>> get_downstream_dependencies('A', dependencies)
+        >>> get_downstream_dependencies('A', example_dependencies)
         []
 
     :example:
@@ -68,7 +367,7 @@ def get_downstream_dependencies(repo, dependencies, depth=-1):
         ...     'C': ['D'],
         ...     'D': []
         ... }
-        >>> get_downstream_dependencies('C', dependencies)
+        >>> get_downstream_dependencies('C', example_dependencies)
         ['B', 'A']
 
     :example:
@@ -78,26 +377,52 @@ def get_downstream_dependencies(repo, dependencies, depth=-1):
         ...     'C': ['D'],
         ...     'D': []
         ... }
-        >>> get_downstream_dependencies('C', dependencies, 1)
+        >>> get_downstream_dependencies('C', example_dependencies, 1)
         ['B']
 
     :param repo:
-    :param dependencies:
+    :param dependencies: Mapping of repository to its dependencies, or a prebuilt :class:`DependencyGraph`
+        or :class:`ClosureCache`.
+    :param depth: Number of levels to follow; negative for no limit, ``0`` for none.
     :return:
     """
-    downstream = []
-    for repo_name, deps in dependencies.items():
-        if repo in deps:
-            downstream.append(repo_name)
-            if depth > 0:
-                depth -= 1
-                if depth == 0:
-                    return downstream
-                else:
-                    downstream.extend(get_downstream_dependencies(repo_name, dependencies, depth))
-            else:
-                downstream.extend(get_downstream_dependencies(repo_name, dependencies))
-    return downstream
+    return _as_graph(dependencies).downstream(repo, depth)
+
+
+def get_release_waves(repo, dependencies, upstream_scope=0, downstream_scope=0):
+    """Schedule ``repo`` and the repositories within its scopes into release waves.
+
+    :example:
+        >>> example_dependencies = {
+        ...     'A': ['B'],
+        ...     'B': ['C'],
+        ...     'C': ['D'],
+        ...     'D': []
+        ... }
+        >>> get_release_waves('C', example_dependencies, upstream_scope=1, downstream_scope=-1)
+        [['D'], ['C'], ['B'], ['A']]
+        >>> get_release_waves('C', example_dependencies)
+        [['C']]
+        >>> try:
+        ...     get_release_waves('A', {'A': ['B'], 'B': ['A']}, upstream_scope=-1)
+        ... except DependencyCycleError as error:
+        ...     print(error.message)
+        Dependency cycle detected: A -> B -> A
+
+    :param repo:
+    :param dependencies: Mapping of repository to its dependencies, or a prebuilt :class:`DependencyGraph`
+        or :class:`ClosureCache`.
+    :param upstream_scope: Levels of dependencies to include; negative for all.
+    :param downstream_scope: Levels of dependants to include; negative for all.
+    :return: List of waves, each a list of repository names that can be released in parallel.
+    """
+    graph = _as_graph(dependencies)
+    scope = [repo]
+    scope.extend(graph.upstream(repo, upstream_scope))
+    scope.extend(graph.downstream(repo, downstream_scope))
+    if isinstance(graph, ClosureCache):
+        graph = graph.graph
+    return graph.waves(scope)
 
 
 if __name__ == '__main__':
@@ -1,8 +1,22 @@
+import atexit
+import contextvars
 import requests
 import logging
+import random
+import threading
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
+
+from . import tracing
 
 logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+
 
 class DispatchTriggerError(Exception):
     """Custom exception for errors encountered while triggering a repository dispatch event."""
@@ -24,37 +38,242 @@ class EventTypeNotFoundError(DispatchTriggerError):
     pass
 
 
-def trigger_repository_dispatch(repository, event_type, access_token, payload=None):
-    """Helper function for triggering a repository dispatch event.
+class RateLimitExceededError(DispatchTriggerError):
+    """Custom exception for errors encountered when the API rate limit is still exceeded after retrying."""
+    pass
+
+
+class RateLimiter:
+    """Thread-safe token bucket shared by every request of one or more dispatchers.
+
+    Besides the configured rate, it follows what the API reports: ``Retry-After`` and an
+    exhausted ``X-RateLimit-Remaining`` pause all callers until the given time, and once the
+    remaining quota drops below ``low_watermark`` requests are spread evenly until the reset.
 
     Args:
-        repository (str): The repository in the format 'OWNER/REPO'.
-        event_type (str): The type of event to trigger.
-        access_token (str): The GitHub API access token.
-        payload (dict, optional): The payload to send with the event. Defaults to None.
+        rate (float, optional): Sustained requests per second. Defaults to None (no fixed limit).
+        burst (int, optional): Requests that may go out back to back before ``rate`` applies. Defaults to 1.
+        low_watermark (int, optional): Remaining quota below which requests are paced. Defaults to 100.
+    """
 
-    Returns:
-        None
+    def __init__(self, rate=None, burst=1, low_watermark=100):
+        self.rate = rate
+        self.burst = burst
+        self.low_watermark = low_watermark
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+        self._paced_interval = 0.0
 
-    Raises:
-        InvalidTokenError: If the access token is invalid.
-        RepositoryNotFoundError: If the repository cannot be found.
-        EventTypeNotFoundError: If the event type is not recognized.
-        DispatchTriggerError: If any other error is encountered while triggering the event.
+    def _interval(self):
+        return max(1.0 / self.rate if self.rate else 0.0, self._paced_interval)
+
+    def acquire(self):
+        """Block until the caller may send its next request."""
+        with self._lock:
+            now = time.monotonic()
+            interval = self._interval()
+            start = max(now, self._blocked_until, self._next_slot - interval * (self.burst - 1))
+            self._next_slot = max(self._next_slot, start) + interval
+        if start > now:
+            time.sleep(start - now)
+
+    def block_for(self, seconds):
+        """Hold back every caller for ``seconds`` from now."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def update(self, headers):
+        """Adjust pacing from the ``X-RateLimit-*`` headers of a response."""
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining = int(remaining)
+            until_reset = max(float(reset) - time.time(), 0.0)
+        except ValueError:
+            return
+        if remaining <= 0:
+            self.block_for(until_reset)
+        with self._lock:
+            if 0 < remaining < self.low_watermark:
+                self._paced_interval = until_reset / remaining
+            else:
+                self._paced_interval = 0.0
+
+
+def _retry_after(headers):
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_rate_limited(response):
+    if response.status_code == 429:
+        return True
+    return response.status_code == 403 and (
+            "Retry-After" in response.headers or response.headers.get("X-RateLimit-Remaining") == "0")
+
+
+class DispatchResult(namedtuple("DispatchResult", ["repository", "event_type", "error"])):
+    """Outcome of one dispatch in a bulk call; ``error`` is the raised ``DispatchTriggerError`` or None."""
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class RepositoryDispatcher:
+    """Reusable client for triggering repository dispatch events.
+
+    Owns a pooled ``requests.Session`` so that consecutive dispatches to the API host
+    reuse open keep-alive connections instead of paying a TCP and TLS handshake each.
+
+    Args:
+        access_token (str): The GitHub API access token.
+        api_url (str, optional): Base URL of the API. Defaults to ``GITHUB_API_URL``.
+        pool_size (int, optional): Maximum number of pooled connections per host. Defaults to 10.
+        keep_alive (bool, optional): Whether to keep connections open between requests. Defaults to True.
+        timeout (float or tuple, optional): ``requests`` connect/read timeout in seconds. Defaults to (5, 30).
+        rate_limiter (RateLimiter, optional): Limiter to share with other dispatchers. Defaults to a new one.
+        max_retries (int, optional): Retries for rate-limited (403/429) and 5xx responses. Defaults to 5.
+        backoff (float, optional): Base delay in seconds for jittered exponential backoff. Defaults to 1.
+        max_backoff (float, optional): Upper bound for a single backoff delay in seconds. Defaults to 60.
     """
-    url = f"https://api.github.com/repos/{repository}/dispatches"
-    headers = {
-        "Accept": "application/vnd.github+json",
-        "Authorization": f"token {access_token}"
-    }
-    data = {"event_type": event_type}
-    if payload:
-        data["client_payload"] = payload
 
+    def __init__(self, access_token, api_url=GITHUB_API_URL, pool_size=10, keep_alive=True, timeout=(5, 30),
+                 rate_limiter=None, max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.api_url = api_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"token {access_token}",
+        })
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def trigger(self, repository, event_type, payload=None):
+        """Trigger a repository dispatch event.
+
+        Args:
+            repository (str): The repository in the format 'OWNER/REPO'.
+            event_type (str): The type of event to trigger.
+            payload (dict, optional): The payload to send with the event. Defaults to None.
+
+        Returns:
+            None
+
+        Raises:
+            InvalidTokenError: If the access token is invalid.
+            RepositoryNotFoundError: If the repository cannot be found.
+            EventTypeNotFoundError: If the event type is not recognized.
+            DispatchTriggerError: If any other error is encountered while triggering the event.
+        """
+        url = f"{self.api_url}/repos/{repository}/dispatches"
+        data = {"event_type": event_type}
+        if payload:
+            data["client_payload"] = payload
+
+        with tracing.span("repository_dispatch", repository=repository, event_type=event_type):
+            self._post(url, data, repository, event_type)
+        logger.info(f"Repository dispatch event '{event_type}' triggered successfully for repository '{repository}'.")
+
+    def _post(self, url, data, repository, event_type):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with tracing.span("http", command=f"POST {url}", attempt=attempt) as span:
+                try:
+                    response = self.session.post(url, json=data, timeout=self.timeout)
+                except requests.exceptions.RequestException as error:
+                    raise DispatchTriggerError(
+                        f"An error occurred while triggering the repository dispatch event '{event_type}': {error}")
+                span.set(status=response.status_code, request_bytes=len(response.request.body or b""),
+                         response_bytes=len(response.content))
+            self.rate_limiter.update(response.headers)
+            rate_limited = _is_rate_limited(response)
+            if attempt == self.max_retries or not (rate_limited or response.status_code >= 500):
+                break
+            delay = _retry_after(response.headers)
+            if delay is not None:
+                # the server told everyone to back off, not just this request
+                self.rate_limiter.block_for(delay)
+            elif not (response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers):
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+            logger.warning(f"Repository dispatch event '{event_type}' for repository '{repository}' "
+                           f"got HTTP {response.status_code}, retrying ({attempt + 1}/{self.max_retries}).")
+        _raise_for_dispatch_status(response, repository, event_type)
+
+    def trigger_result(self, repository, event_type, payload=None):
+        """Trigger a repository dispatch event, returning its outcome instead of raising.
+
+        Args:
+            repository (str): The repository in the format 'OWNER/REPO'.
+            event_type (str): The type of event to trigger.
+            payload (dict, optional): The payload to send with the event. Defaults to None.
+
+        Returns:
+            DispatchResult: The result, with the ``DispatchTriggerError`` raised if the dispatch failed.
+        """
+        try:
+            self.trigger(repository, event_type, payload)
+        except DispatchTriggerError as error:
+            logger.error(f"Repository dispatch event '{event_type}' failed for repository '{repository}': {error}")
+            return DispatchResult(repository, event_type, error)
+        return DispatchResult(repository, event_type, None)
+
+    def trigger_many(self, events, concurrency=None):
+        """Trigger many repository dispatch events concurrently.
+
+        A failing dispatch does not stop the others; its error is returned in its result instead.
+
+        Args:
+            events (iterable): ``(repository, event_type, payload)`` tuples.
+            concurrency (int, optional): Maximum number of requests in flight. Defaults to the pool size,
+                since going above it opens connections that the pool then throws away.
+
+        Returns:
+            list[DispatchResult]: One result per event, in the order the events were given.
+        """
+        events = list(events)
+        if not events:
+            return []
+        workers = min(concurrency or self.pool_size, len(events))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch") as executor:
+            # each worker runs in a copy of this context, so their spans nest under the caller's
+            context = contextvars.copy_context()
+            return list(executor.map(lambda event: context.copy().run(self.trigger_result, *event), events))
+
+
+def _raise_for_dispatch_status(response, repository, event_type):
     try:
-        response = requests.post(url, headers=headers, json=data)
         response.raise_for_status()
-        logger.info(f"Repository dispatch event '{event_type}' triggered successfully for repository '{repository}'.")
     except requests.exceptions.HTTPError as error:
         if response.status_code == 401:
             raise InvalidTokenError("The access token is invalid.")
@@ -62,6 +281,188 @@ def trigger_repository_dispatch(repository, event_type, access_token, payload=No
             raise RepositoryNotFoundError(f"The repository '{repository}' cannot be found.")
         elif response.status_code == 422:
             raise EventTypeNotFoundError(f"The event type '{event_type}' is not recognized.")
+        elif _is_rate_limited(response):
+            raise RateLimitExceededError(
+                f"Rate limit exceeded while triggering the repository dispatch event '{event_type}'.")
         else:
             raise DispatchTriggerError(
                 f"An error occurred while triggering the repository dispatch event '{event_type}': {error}")
+
+
+def replace_payload(pending, incoming):
+    """Merge policy that keeps only the most recent ``client_payload``."""
+    return incoming
+
+
+def update_payload(pending, incoming):
+    """Merge policy that shallow-merges payloads, later keys winning."""
+    merged = dict(pending or {})
+    merged.update(incoming or {})
+    return merged
+
+
+class DispatchCoalescer:
+    """Merges repeated dispatches of the same event to the same repository.
+
+    The first :meth:`submit` for a ``(repository, event_type)`` pair opens a window of
+    ``window`` seconds; further submits for that pair inside the window are folded into the
+    pending event with ``merge`` instead of being sent, and one dispatch goes out when the
+    window closes.
+
+    Args:
+        dispatcher (RepositoryDispatcher): Dispatcher used to send the merged events.
+        window (float, optional): Seconds to hold an event open for merging. Defaults to 5.
+        merge (callable, optional): ``merge(pending_payload, incoming_payload)`` returning the payload to
+            keep. Defaults to :func:`update_payload`.
+    """
+
+    def __init__(self, dispatcher, window=5.0, merge=update_payload):
+        self.dispatcher = dispatcher
+        self.window = window
+        self.merge = merge
+        self.submitted = 0
+        self.coalesced = 0
+        self.dispatched = 0
+        self.results = []
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, repository, event_type, payload=None):
+        """Queue a dispatch event, merging it into a pending one for the same repository and event type."""
+        key = (repository, event_type)
+        with self._lock:
+            self.submitted += 1
+            if key in self._pending:
+                self._pending[key] = self.merge(self._pending[key], payload)
+                self.coalesced += 1
+                logger.info(f"Coalesced repository dispatch event '{event_type}' for repository '{repository}'.")
+                return
+            self._pending[key] = payload
+            timer = threading.Timer(self.window, self._flush_key, args=(key,))
+            timer.daemon = True
+            self._timers[key] = timer
+        timer.start()
+
+    def _take(self, keys):
+        with self._lock:
+            events = []
+            for key in keys:
+                if key in self._pending:
+                    self._timers.pop(key).cancel()
+                    events.append(key + (self._pending.pop(key),))
+            self.dispatched += len(events)
+            return events
+
+    def _flush_key(self, key):
+        for event in self._take([key]):
+            result = self.dispatcher.trigger_result(*event)
+            with self._lock:
+                self.results.append(result)
+
+    def flush(self):
+        """Send every pending event now, without waiting for its window to close.
+
+        Returns:
+            list[DispatchResult]: One result per event sent.
+        """
+        with self._lock:
+            keys = list(self._pending)
+        results = self.dispatcher.trigger_many(self._take(keys))
+        with self._lock:
+            self.results.extend(results)
+        return results
+
+    def close(self):
+        """Send every pending event now; used on exit so nothing submitted is lost."""
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {"submitted": self.submitted, "coalesced": self.coalesced,
+                    "dispatched": self.dispatched, "pending": len(self._pending)}
+
+
+_dispatchers = {}
+
+
+def get_dispatcher(access_token):
+    """Return the shared :class:`RepositoryDispatcher` for ``access_token``, creating it on first use."""
+    dispatcher = _dispatchers.get(access_token)
+    if dispatcher is None:
+        dispatcher = _dispatchers[access_token] = RepositoryDispatcher(access_token)
+    return dispatcher
+
+
+_coalescers = {}
+
+
+def get_coalescer(access_token, window=5.0):
+    """Return the shared :class:`DispatchCoalescer` for ``access_token``, creating it on first use.
+
+    It sends through :func:`get_dispatcher`'s dispatcher, and whatever is still pending
+    when the interpreter exits is sent then. ``window`` only applies when it is created.
+    """
+    coalescer = _coalescers.get(access_token)
+    if coalescer is None:
+        coalescer = _coalescers[access_token] = DispatchCoalescer(get_dispatcher(access_token), window)
+        atexit.register(coalescer.close)
+    return coalescer
+
+
+def trigger_repository_dispatch(repository, event_type, access_token, payload=None, validate=False,
+                                coalesce=False):
+    """Helper function for triggering a repository dispatch event.
+
+    Consecutive calls with the same token share one pooled :class:`RepositoryDispatcher`.
+
+    Args:
+        repository (str): The repository in the format 'OWNER/REPO'.
+        event_type (str): The type of event to trigger.
+        access_token (str): The GitHub API access token.
+        payload (dict, optional): The payload to send with the event. Defaults to None.
+        validate (bool, optional): Whether to check first that the gitflow event can succeed in
+            ``repository``, with one ``git ls-remote``. Defaults to False.
+        coalesce (bool, optional): Whether to hand the event to the shared coalescer (see
+            :func:`get_coalescer`) instead of sending it now, so that repeats within its window are
+            merged into one dispatch. Its errors are then in the coalescer's ``results``, not raised.
+            Defaults to False.
+
+    Returns:
+        None
+
+    Raises:
+        PayloadError: If ``validate`` is set and the event cannot succeed; nothing is sent then.
+        InvalidTokenError: If the access token is invalid.
+        RepositoryNotFoundError: If the repository cannot be found.
+        EventTypeNotFoundError: If the event type is not recognized.
+        DispatchTriggerError: If any other error is encountered while triggering the event.
+    """
+    if validate:
+        # Imported here so that senders not validating never load the git helpers
+        from .validation import validate_dispatch
+        validate_dispatch(repository, event_type, payload, access_token)
+    if coalesce:
+        get_coalescer(access_token).submit(repository, event_type, payload)
+    else:
+        get_dispatcher(access_token).trigger(repository, event_type, payload)
+
+
+def trigger_repository_dispatches(events, access_token, concurrency=None):
+    """Helper function for triggering many repository dispatch events concurrently.
+
+    Args:
+        events (iterable): ``(repository, event_type, payload)`` tuples.
+        access_token (str): The GitHub API access token.
+        concurrency (int, optional): Maximum number of requests in flight. Defaults to the pool size.
+
+    Returns:
+        list[DispatchResult]: One result per event, in the order the events were given.
+    """
+    return get_dispatcher(access_token).trigger_many(events, concurrency)
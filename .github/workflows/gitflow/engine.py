@@ -0,0 +1,610 @@
+"""Git flow operations implemented on git plumbing.
+
+This does what the git-flow shell scripts do for ``init``, ``start``, ``track`` and
+``finish`` of features, releases and hotfixes, without needing git-flow installed and with far
+fewer processes: merges are computed with ``git merge-tree --write-tree`` and
+``git commit-tree``, tags are written with ``git mktag``, and all branch and tag
+changes of an operation are applied in one ``git update-ref --stdin`` transaction.
+Nothing needs a working tree, so the engine also runs inside bare repositories.
+
+Talking to the remote costs two round trips per operation: one fetch of just the
+branches involved, and one ``git push --atomic`` of the resulting object ids, made
+before anything changes locally so a rejected push leaves the clone untouched.
+"""
+import os
+import re
+import subprocess
+
+from . import logger
+from .gitflow import (GITFLOW_PREFIXES, BranchAlreadyExistsError, FeatureBranchMergeError, GitFlowInitError,
+                      GitNotInstalledError, HotfixBranchMergeError, ReleaseBranchMergeError, TagAlreadyExistsError,
+                      git_configure_many, git_flow_initialized)
+from .run import get_session
+
+DEFAULT_PREFIXES = {
+    "feature": "feature/",
+    "bugfix": "bugfix/",
+    "release": "release/",
+    "hotfix": "hotfix/",
+    "support": "support/",
+    "versiontag": "",
+}
+
+_MERGE_ERRORS = {
+    "feature": FeatureBranchMergeError,
+    "release": ReleaseBranchMergeError,
+    "hotfix": HotfixBranchMergeError,
+}
+
+
+def _recovery_steps(branch, command, base="develop"):
+    message = "\t- git checkout %s\n" % base
+    message += "\t- git pull origin %s\n" % base
+    message += "\t- git checkout %s\n" % branch
+    message += "\t- git merge %s\n" % base
+    message += "\t- Resolve any conflicts (commit the changes) and then run: %s\n" % command
+    return message
+
+
+def _merge_tree(engine, target, source):
+    """``git merge-tree`` of two commits, stopped at its first conflict message.
+
+    The output is the tree, the conflicting paths and, after an empty line, the
+    messages; with one line per conflicting path, only the end of a huge list is kept.
+    """
+    args = ["merge-tree", "--write-tree", "--name-only", target, source]
+    result = engine._stream(args, limit=8192, stop_on=("conflict",))
+    if result.returncode == 0 and result.stdout_tail.dropped:
+        # so many files were merged that their messages pushed the tree out of the tail
+        result = engine._stream(args[:3] + ["--no-messages"] + args[3:], limit=8192)
+    return result
+
+
+def _conflicts(result):
+    """``(paths, count)`` of the conflicting paths of a :func:`_merge_tree` that conflicted.
+
+    ``paths`` are the last ones only if the start of the output was dropped; ``count``
+    is the full number.
+    """
+    output = result.stdout.decode(errors="replace")
+    end = output.find("\n\n")
+    if end < 0:
+        # the messages alone filled the tail
+        return [], 0
+    # the first line is the tree, or a partial path if the start was dropped
+    paths = output[:end].split("\n")[1:]
+    messages = output[end + 1:].count("\n")
+    return paths, result.stdout_tail.lines - messages - 1
+
+
+class GitFlowEngine:
+    """Git flow on plumbing commands for the repository of ``session``.
+
+    Branch names and prefixes come from the ``gitflow.*`` config, like git-flow's own.
+    Every public operation stages its ref changes and applies them atomically at the
+    end, so a failed merge leaves all branches as they were.
+
+    :param session: :class:`~gitflow.run.GitSession` to run git in; defaults to the shared one.
+    :param remote: Name of the remote to track and push to.
+    """
+
+    def __init__(self, session=None, remote="origin"):
+        self.session = session or get_session()
+        self.remote = remote
+        self._config = None
+        self._fetched = set()
+        self._bare = None
+        self._shallow = None
+        self._git_dir = None
+        self._deferred = None
+        self._upstreams = []
+
+    # -- helpers -------------------------------------------------------------------------
+
+    @staticmethod
+    def _log_failure(error, description):
+        logger.error("Error %s", description)
+        logger.error("Return code: %d", error.returncode)
+        logger.error("Stdout:\n%s", error.stdout.decode().strip())
+        logger.error("Stderr:\n%s", error.stderr.decode().strip())
+
+    def _run(self, args, description, input=None):
+        try:
+            return self.session.run(args, input=input)
+        except subprocess.CalledProcessError as error:
+            self._log_failure(error, description)
+            raise error
+
+    def _stream(self, args, limit=65536, stop_on=()):
+        """Run a command whose output is only diagnostics, keeping a bounded tail of it.
+
+        :param stop_on: :data:`~gitflow.run.FAILURE_SIGNATURES` the caller fails on anyway; git is
+            stopped as soon as one of them shows up.
+        """
+        result = self.session.stream(args, check=False, limit=limit, stop_on=stop_on)
+        if "git_not_found" in result.signatures:
+            raise GitNotInstalledError("Command 'git' not found; install git and make sure it is on PATH.")
+        return result
+
+    def _output(self, args, description, input=None):
+        return self._run(args, description, input).stdout.decode().strip()
+
+    @property
+    def config(self):
+        """``gitflow.*`` config, plus the URL of the remote if it is configured."""
+        if self._config is None:
+            pattern = r"^(gitflow\.|remote\.%s\.url$)" % self.remote
+            result = self.session.run(["config", "--get-regexp", pattern], check=False)
+            self._config = {}
+            for line in result.stdout.decode().splitlines():
+                key, _, value = line.partition(" ")
+                self._config[key] = value
+        return self._config
+
+    @property
+    def has_remote(self):
+        return "remote.%s.url" % self.remote in self.config
+
+    @property
+    def master(self):
+        return self.config.get("gitflow.branch.master", "master")
+
+    @property
+    def develop(self):
+        return self.config.get("gitflow.branch.develop", "develop")
+
+    def prefix(self, kind):
+        return self.config.get("gitflow.prefix.%s" % kind, DEFAULT_PREFIXES[kind])
+
+    def _local(self, branch):
+        return self.session.rev_parse("refs/heads/%s" % branch)
+
+    def _remote(self, branch):
+        return self.session.rev_parse("refs/remotes/%s/%s" % (self.remote, branch))
+
+    def _is_ancestor(self, ancestor, descendant):
+        result = self.session.run(["merge-base", "--is-ancestor", ancestor, descendant], check=False)
+        return result.returncode == 0
+
+    def _inspect(self):
+        if self._bare is None:
+            bare, shallow, git_dir = self._output(
+                ["rev-parse", "--is-bare-repository", "--is-shallow-repository", "--path-format=absolute",
+                 "--git-common-dir"], "inspecting repository").splitlines()
+            self._bare = bare == "true"
+            self._shallow = shallow == "true"
+            self._git_dir = git_dir
+
+    @property
+    def bare(self):
+        self._inspect()
+        return self._bare
+
+    @property
+    def shallow(self):
+        self._inspect()
+        return self._shallow
+
+    @property
+    def git_dir(self):
+        self._inspect()
+        return self._git_dir
+
+    def fetch(self, branches, error_class, optional=(), tips_only=False):
+        """Fetch just the named branches from the remote, in one round trip.
+
+        A branch that does not exist locally must exist on the remote; branches that do
+        exist locally and those in ``optional`` are fetched only if the remote has them.
+        Remote-tracking refs of the fetched branches that are gone on the remote are
+        pruned. A shallow clone stays shallow when ``tips_only`` (enough to start a
+        branch), otherwise it is unshallowed so that merge bases can be found.
+        """
+        if not self.has_remote:
+            return
+        refspecs = []
+        for branch in branches:
+            if branch not in self._fetched:
+                if self._local(branch) is None:
+                    refspecs.append("+refs/heads/%s:refs/remotes/%s/%s" % (branch, self.remote, branch))
+                else:
+                    optional = tuple(optional) + (branch,)
+        for branch in optional:
+            if branch not in self._fetched:
+                # a glob never fails when nothing matches, at the price of also fetching
+                # branches that merely share the prefix
+                refspecs.append("+refs/heads/%s*:refs/remotes/%s/%s*" % (branch, self.remote, branch))
+        if not refspecs:
+            return
+        args = ["fetch", "-q", "--no-tags", "--prune"]
+        if self.shallow and not tips_only:
+            args.append("--unshallow")
+        result = self._stream(args + [self.remote] + refspecs)
+        if result.returncode != 0:
+            missing = re.search(r"couldn't find remote ref refs/heads/(\S+)", result.stderr.decode())
+            if missing:
+                raise error_class("Branch '%s' does not exist on %s." % (missing.group(1), self.remote))
+            self._log_failure(result, "fetching from %s" % self.remote)
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        if self.shallow and not tips_only:
+            self._shallow = False
+        self._fetched.update(branches)
+        self._fetched.update(optional)
+
+    def fetch_tags(self):
+        """Fetch the version tags from the remote, once.
+
+        A clone made without tags (as CI checkouts are) would otherwise find no previous
+        version. A shallow clone is unshallowed, since tags are of no use without the
+        history between them. Local tags that are not on the remote are kept.
+
+        :raises TagAlreadyExistsError: If a local version tag differs from the remote's; it is left as it is.
+        """
+        refspec = "refs/tags/%s*:refs/tags/%s*" % (self.prefix("versiontag"), self.prefix("versiontag"))
+        if not self.has_remote or refspec in self._fetched:
+            return
+        # not quiet: git only reports tags it refuses to overwrite when it is not
+        args = ["fetch", "--no-tags"]
+        if self.shallow:
+            args.append("--unshallow")
+        result = self._stream(args + [self.remote, refspec])
+        if result.returncode != 0:
+            self._log_failure(result, "fetching tags from %s" % self.remote)
+            if "tag_exists" in result.signatures:
+                tags = re.findall(r"\[rejected\]\s+(\S+)\s+->", result.stderr.decode())
+                which = "Tag %s differs" % ", ".join("'%s'" % tag for tag in tags) if tags else "Version tags differ"
+                raise TagAlreadyExistsError("%s from %s. Delete the local tag and run the action again."
+                                            % (which, self.remote))
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        if self.shallow:
+            self._shallow = False
+        self._fetched.add(refspec)
+
+    def _require_local(self, branch, error_class, recovery=""):
+        """Object id of ``branch``, or of its remote-tracking branch if only that exists.
+
+        Like git-flow, refuse to go on if the local branch is behind or has diverged from the remote.
+        """
+        local = self._local(branch)
+        remote = self._remote(branch)
+        if local is None:
+            if remote is None:
+                raise error_class("Branch '%s' does not exist locally or on %s." % (branch, self.remote))
+            return remote
+        if remote is not None and local != remote and not self._is_ancestor(remote, local):
+            message = "Branches '%s' and '%s/%s' have diverged." % (branch, self.remote, branch)
+            if self._is_ancestor(local, remote):
+                message += " And branch '%s' may be fast-forwarded.\n" % branch
+            else:
+                message += " Branches need merging first.\n"
+            if recovery:
+                message += "Resolve the conflict by running the following commands:\n" + recovery
+            raise error_class(message)
+        return local
+
+    def _merge(self, target, source, message, error_class, branch, recovery, no_ff=True):
+        """Commit merging ``source`` into ``target`` (both object ids) without touching a working tree."""
+        if self._is_ancestor(source, target):
+            return target
+        if not no_ff and self._is_ancestor(target, source):
+            return source
+        result = _merge_tree(self, target, source)
+        if result.stopped == "conflict" or result.returncode == 1:
+            conflicts, count = _conflicts(result)
+            message = "There are merge conflicts"
+            if conflicts:
+                message += " in: %s" % ", ".join(conflicts)
+            if count > len(conflicts):
+                message += " and %d more files" % (count - len(conflicts))
+            message += ".\n"
+            message += "Resolve the conflict by running the following commands:\n"
+            message += recovery
+            raise error_class(message)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+        tree = result.stdout.decode().split("\n", 1)[0]
+        return self._output(["commit-tree", tree, "-p", target, "-p", source, "-m", message],
+                            "committing merge into %s" % branch)
+
+    def _tag(self, name, commit, message):
+        tagger = self._output(["var", "GIT_COMMITTER_IDENT"], "reading committer identity")
+        content = "object %s\ntype commit\ntag %s\ntagger %s\n\n%s\n" % (commit, name, tagger, message)
+        return self._output(["mktag"], "creating tag %s" % name, input=content.encode())
+
+    def _apply(self, updates, description):
+        """Apply ``[(ref, new, old)]`` in one transaction and bring a checked-out branch along."""
+        lines = ["start"]
+        for ref, new, old in updates:
+            if new is None:
+                lines.append("delete %s %s" % (ref, old))
+            elif old is None:
+                lines.append("create %s %s" % (ref, new))
+            else:
+                lines.append("update %s %s %s" % (ref, new, old))
+        lines += ["prepare", "commit", ""]
+        head = None
+        if not self.bare:
+            head = self.session.run(["symbolic-ref", "-q", "HEAD"], check=False).stdout.decode().strip()
+        self._run(["update-ref", "--stdin"], description, input="\n".join(lines).encode())
+        for ref, new, old in updates:
+            if ref != head or new == old:
+                continue
+            if new is None:
+                # the checked-out branch is gone; git-flow leaves you on develop
+                new = self._local(self.develop)
+                self._run(["symbolic-ref", "HEAD", "refs/heads/%s" % self.develop], "switching to develop")
+            self._run(["read-tree", "-m", "-u", old, new], "updating working tree")
+
+    def _push(self, refspecs, error_class):
+        # an atomic push that has one ref rejected updates nothing, so there is no need to wait for the rest
+        result = self._stream(["push", "--atomic", "--porcelain", self.remote] + refspecs,
+                              stop_on=("tag_exists", "diverged"))
+        if result.returncode == 0:
+            return
+        for line in result.stdout.decode().splitlines():
+            fields = line.split("\t")
+            if len(fields) < 3 or fields[0] != "!":
+                continue
+            ref = fields[1].rpartition(":")[2]
+            if ref.startswith("refs/tags/") and "already exists" in fields[2]:
+                raise TagAlreadyExistsError("Tag '%s' already exists on %s." % (ref[len("refs/tags/"):], self.remote))
+            if "fetch first" in fields[2] or "non-fast-forward" in fields[2]:
+                raise error_class("Branch '%s' was updated on %s in the meantime; run the action again."
+                                  % (ref[len("refs/heads/"):], self.remote))
+        self._log_failure(result, "pushing to %s" % self.remote)
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+
+    def _refspecs(self, updates):
+        # only refs that differ from the remote, by object id, so nothing else the clone has is pushed
+        refspecs = []
+        for ref, new, old in updates:
+            if ref.startswith("refs/tags/"):
+                refspecs.append("%s:%s" % (new, ref))
+                continue
+            remote = self._remote(ref[len("refs/heads/"):])
+            if new == remote:
+                continue
+            refspecs.append(":%s" % ref if new is None else "%s:%s" % (new, ref))
+        return refspecs
+
+    def _publish(self, updates, description, error_class):
+        """Push ``[(ref, new, old)]`` in one atomic push, then apply them locally.
+
+        git moves the remote-tracking refs along with the push. If the push is rejected,
+        no local ref has been touched. Inside a batch (see :meth:`begin_batch`) the
+        updates are only applied locally and pushed by :meth:`end_batch`.
+        """
+        if self._deferred is not None:
+            for ref, new, old in updates:
+                self._deferred.setdefault(ref, old)
+        elif self.has_remote:
+            refspecs = self._refspecs(updates)
+            if refspecs:
+                self._push(refspecs, error_class)
+        self._apply([update for update in updates if update[1] != update[2]], description)
+
+    def begin_batch(self):
+        """Apply the operations that follow to the local refs only, until :meth:`end_batch` pushes them all."""
+        self._deferred = {}
+        self._upstreams = []
+
+    def end_batch(self, error_class):
+        """Push everything changed since :meth:`begin_batch` in one atomic push.
+
+        If the push is rejected, the local refs are put back to where they were when
+        the batch began and ``error_class`` (or :class:`TagAlreadyExistsError`) is raised.
+        Branches started in the batch only get their upstream configured once pushed.
+        """
+        deferred, self._deferred = self._deferred, None
+        upstreams, self._upstreams = self._upstreams, []
+        if deferred and self.has_remote:
+            updates = [(ref, self.session.rev_parse(ref), old) for ref, old in deferred.items()]
+            refspecs = self._refspecs([update for update in updates if update[1] != update[2]])
+            if refspecs:
+                try:
+                    self._push(refspecs, error_class)
+                except Exception:
+                    self._apply([(ref, old, new) for ref, new, old in updates if new != old], "rolling back batch")
+                    raise
+        for branch in upstreams:
+            self._set_upstream(branch)
+
+    def _set_upstream(self, branch):
+        git_configure_many({"branch.%s.remote" % branch: self.remote,
+                            "branch.%s.merge" % branch: "refs/heads/%s" % branch},
+                           self.session, os.path.join(self.git_dir, "config"))
+
+    # -- operations ----------------------------------------------------------------------
+
+    def init(self):
+        """Equivalent of ``git flow init -d``: default config and master/develop branches.
+
+        :return: True if anything had to be set up.
+        """
+        if git_flow_initialized(self.session):
+            return False
+        self.fetch([], GitFlowInitError, optional=("main", "master", self.develop), tips_only=True)
+        config = {}
+        if "gitflow.branch.master" not in self.config:
+            candidates = [name for name in ("main", "master") if self._local(name) or self._remote(name)]
+            config["gitflow.branch.master"] = candidates[0] if candidates else "master"
+        if "gitflow.branch.develop" not in self.config:
+            config["gitflow.branch.develop"] = "develop"
+        for kind in GITFLOW_PREFIXES:
+            if "gitflow.prefix.%s" % kind not in self.config:
+                config["gitflow.prefix.%s" % kind] = DEFAULT_PREFIXES[kind]
+        if config:
+            git_configure_many(config, self.session, os.path.join(self.git_dir, "config"))
+            self._config = None
+        if self.master == self.develop:
+            raise GitFlowInitError("Production and development branches cannot be the same: %s" % self.master)
+
+        updates = []
+        master = self._local(self.master) or self._remote(self.master)
+        if master is None:
+            raise GitFlowInitError("Branch '%s' does not exist; create an initial commit first." % self.master)
+        if self._local(self.master) is None:
+            updates.append(("refs/heads/%s" % self.master, master, None))
+        if self._local(self.develop) is None:
+            updates.append(("refs/heads/%s" % self.develop, self._remote(self.develop) or master, None))
+        if updates:
+            # a develop branch created here from master is published right away, like git-flow does
+            self._publish(updates, "creating gitflow branches", GitFlowInitError)
+        return True
+
+    def track(self, kind, name):
+        """Create the local ``<prefix><name>`` branch from the remote one, unless it already exists."""
+        branch = self.prefix(kind) + name
+        local = self._local(branch)
+        if local is not None:
+            return local
+        error_class = _MERGE_ERRORS[kind]
+        self.fetch([branch], error_class)
+        remote = self._remote(branch)
+        if remote is None:
+            raise error_class("Branch '%s' does not exist on %s." % (branch, self.remote))
+        self._apply([("refs/heads/%s" % branch, remote, None)], "tracking %s" % branch)
+        return remote
+
+    def _start(self, kind, name, base_branch):
+        branch = self.prefix(kind) + name
+        self.fetch([base_branch], GitFlowInitError, optional=(branch,), tips_only=True)
+        if self._local(branch) or self._remote(branch):
+            raise BranchAlreadyExistsError("Branch '%s' already exists. Pick another name." % branch)
+        base = self._local(base_branch) or self._remote(base_branch)
+        if base is None:
+            raise GitFlowInitError("Branch '%s' does not exist; run git flow init first." % base_branch)
+        updates = [("refs/heads/%s" % branch, base, None)]
+        if self._local(base_branch) is None:
+            updates.append(("refs/heads/%s" % base_branch, base, None))
+        self._publish(updates, "creating %s" % branch, BranchAlreadyExistsError)
+        if self.has_remote and self._deferred is not None:
+            # a batch that is rolled back must not leave tracking config behind
+            self._upstreams.append(branch)
+        elif self.has_remote:
+            self._set_upstream(branch)
+        return branch
+
+    def branches(self, operation, name):
+        """Branches that ``operation`` (e.g. ``"finish_release"``) on ``name`` writes.
+
+        Remote-tracking refs count: starting a branch fetches its base. Two operations
+        sharing a branch must not run at once; see :class:`~gitflow.worktrees.BranchLocks`.
+        """
+        kind = operation.partition("_")[2]
+        branches = [self.master if operation == "start_hotfix" else self.develop, self.prefix(kind) + name]
+        if operation in ("finish_release", "finish_hotfix"):
+            branches.append(self.master)
+        return branches
+
+    def latest_version(self):
+        """Highest version tag (without the version tag prefix), or None if there is none.
+
+        With a remote, its tags count rather than the local ones: CI checkouts fetch no tags.
+        """
+        prefix = self.prefix("versiontag")
+        pattern = "refs/tags/%s*" % prefix
+        if self.has_remote:
+            output = self._output(["ls-remote", "--tags", "--refs", "--sort=-v:refname", self.remote, pattern],
+                                  "listing version tags on %s" % self.remote)
+            tag = output.partition("\n")[0].partition("\t")[2][len("refs/tags/"):]
+        else:
+            tag = self._output(["for-each-ref", "--sort=-v:refname", "--count=1", "--format=%(refname:lstrip=2)",
+                                pattern], "listing version tags")
+        return tag[len(prefix):] if tag else None
+
+    def next_version(self, bump):
+        """Version after :meth:`latest_version`, with its ``bump`` (major, minor or patch) part incremented."""
+        parts = ["major", "minor", "patch"]
+        if bump not in parts:
+            raise ValueError("Unknown version bump: %s" % bump)
+        numbers = [int(number) for number in re.findall(r"\d+", self.latest_version() or "")[:3]]
+        numbers += [0] * (3 - len(numbers))
+        index = parts.index(bump)
+        return ".".join(str(number) for number in numbers[:index] + [numbers[index] + 1] + [0] * (2 - index))
+
+    def _check_unique(self, kind, name):
+        # git-flow allows one release and one hotfix at a time, and never reuses a tag
+        tag = self.prefix("versiontag") + name
+        if self.session.rev_parse("refs/tags/%s" % tag):
+            raise TagAlreadyExistsError("Tag '%s' already exists. Pick another name." % tag)
+        existing = self._output(["for-each-ref", "--count=1", "--format=%(refname:lstrip=2)",
+                                 "refs/heads/%s" % self.prefix(kind)], "listing %s branches" % kind)
+        if existing:
+            raise BranchAlreadyExistsError("There is an existing %s branch '%s'. Finish that one first."
+                                           % (kind, existing))
+
+    def start_feature(self, name):
+        """Create ``feature/<name>`` from develop and publish it."""
+        self._start("feature", name, self.develop)
+
+    def start_release(self, name):
+        """Create ``release/<name>`` from develop and publish it."""
+        self._check_unique("release", name)
+        self._start("release", name, self.develop)
+
+    def start_hotfix(self, name):
+        """Create ``hotfix/<name>`` from master and publish it."""
+        self._check_unique("hotfix", name)
+        self._start("hotfix", name, self.master)
+
+    def finish_feature(self, name):
+        """Merge ``feature/<name>`` into develop and delete it, locally and on the remote."""
+        branch = self.prefix("feature") + name
+        command = "git flow feature finish %s" % name
+        self.fetch([self.develop, branch], FeatureBranchMergeError)
+        feature = self.track("feature", name)
+        recovery = _recovery_steps(branch, command)
+        develop = self._require_local(self.develop, FeatureBranchMergeError, recovery)
+        # like git-flow, a single-commit feature is fast-forwarded, anything longer gets a merge commit
+        single = self._output(["rev-list", "--count", "%s..%s" % (develop, feature)], "counting commits") == "1"
+        merged = self._merge(develop, feature, "Merge branch '%s' into %s" % (branch, self.develop),
+                             FeatureBranchMergeError, branch, recovery, no_ff=not single)
+        self._publish([("refs/heads/%s" % self.develop, merged, self._local(self.develop)),
+                       ("refs/heads/%s" % branch, None, feature)], "finishing %s" % branch, FeatureBranchMergeError)
+
+    def _finish_tagged(self, kind, name, message, notes=True):
+        """Merge ``<kind>/<name>`` into master, tag it, merge the tag back into develop and delete the branch.
+
+        With ``notes``, the changes since the previous version tag are added to the tag message.
+        """
+        error_class = _MERGE_ERRORS[kind]
+        branch = self.prefix(kind) + name
+        tag = self.prefix("versiontag") + name
+        command = "git flow %s finish %s" % (kind, name)
+        if self.session.rev_parse("refs/tags/%s" % tag):
+            raise TagAlreadyExistsError("Tag '%s' already exists." % tag)
+        self.fetch([self.master, self.develop, branch], error_class)
+        source = self.track(kind, name)
+        recovery = _recovery_steps(branch, command, self.master if kind == "hotfix" else self.develop)
+        master = self._require_local(self.master, error_class, recovery)
+        develop = self._require_local(self.develop, error_class, recovery)
+        if notes:
+            # imported here because the changelog builds on the engine
+            from .changelog import Changelog
+            summary = Changelog(self).release_notes(source)
+            if summary.count:
+                message += "\n\n" + summary.render()
+
+        merged_master = self._merge(master, source, "Merge branch '%s' into %s" % (branch, self.master),
+                                    error_class, branch, recovery)
+        tag_object = self._tag(tag, merged_master, message)
+        merged_develop = self._merge(develop, merged_master, "Merge tag '%s' into %s" % (tag, self.develop),
+                                     error_class, branch, recovery)
+        self._publish([("refs/heads/%s" % self.master, merged_master, self._local(self.master)),
+                       ("refs/tags/%s" % tag, tag_object, None),
+                       ("refs/heads/%s" % self.develop, merged_develop, self._local(self.develop)),
+                       ("refs/heads/%s" % branch, None, source)], "finishing %s" % branch, error_class)
+
+    def finish_release(self, name, message=None, notes=True):
+        """Merge ``release/<name>`` into master, tag it, merge the tag back into develop and delete the branch.
+
+        The tag message is ``message`` followed, with ``notes``, by the release notes.
+        """
+        self._finish_tagged("release", name, message or "Release %s" % name, notes)
+
+    def finish_hotfix(self, name, message=None, notes=True):
+        """Merge ``hotfix/<name>`` into master, tag it, merge the tag back into develop and delete the branch.
+
+        The tag message is ``message`` followed, with ``notes``, by the release notes.
+        """
+        self._finish_tagged("hotfix", name, message or "Hotfix %s" % name, notes)
@@ -7,9 +7,14 @@
 # - https://nvie.com/posts/a-successful-git-branching-model/
 # - https://medium.com/android-news/gitflow-with-github-c675aa4f606a
 
+import os
+import re
 import subprocess
+import threading
 
 from . import logger
+from .tracing import traced
+from .run import get_session
 
 
 class UnknownException(Exception):
@@ -47,21 +52,59 @@ class GitFlowInitError(RunCommandError):
     pass
 
 
-def git_flow_init():
+GITFLOW_PREFIXES = ("feature", "bugfix", "release", "hotfix", "support", "versiontag")
+
+
+def git_flow_initialized(session=None):
+    """Whether git flow is already initialized in the session's repository.
+
+    Mirrors git-flow's own check: master and develop branch names configured, distinct
+    and existing locally, and every branch prefix configured. The config is read with a
+    single ``git config --get-regexp`` and the branches are looked up through the
+    session's long-lived ``cat-file`` process.
+    """
+    session = session or get_session()
+    result = session.run(["config", "--get-regexp", r"^gitflow\.(branch|prefix)\."], check=False)
+    if result.returncode not in (0, 1):
+        return False
+    config = {}
+    for line in result.stdout.decode().splitlines():
+        key, _, value = line.partition(" ")
+        config[key] = value
+    master = config.get("gitflow.branch.master")
+    develop = config.get("gitflow.branch.develop")
+    if not master or not develop or master == develop:
+        return False
+    if any("gitflow.prefix.%s" % prefix not in config for prefix in GITFLOW_PREFIXES):
+        return False
+    try:
+        return session.ref_exists("refs/heads/%s" % master) and session.ref_exists("refs/heads/%s" % develop)
+    except subprocess.CalledProcessError:
+        return False
+
+
+def _engine(session):
+    # imported here because the engine builds on the errors and config helpers of this module
+    from .engine import GitFlowEngine
+    return GitFlowEngine(session or get_session())
+
+
+@traced
+def git_flow_init(session=None):
+    """Set up git flow like ``git flow init -d`` unless the repository is already initialized.
+
+    :return: True if anything had to be set up, False if it was not needed.
+    """
+    session = session or get_session()
+    if git_flow_initialized(session):
+        logger.info("Git flow already initialized")
+        return False
     logger.info("Initializing git flow")
     try:
-        result = subprocess.run(
-            ["git", "flow", "init", "-d"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
+        return _engine(session).init()
     except subprocess.CalledProcessError as error:
         logger.error("Error initializing git flow")
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
+        raise GitFlowInitError(error.stderr.decode().strip())
 
 
 class GitConfigError(Exception):
@@ -69,15 +112,12 @@ class GitConfigError(Exception):
         self.message = message
 
 
-def git_configure(key, value):
+@traced
+def git_configure(key, value, session=None):
+    session = session or get_session()
     logger.info(f"Configuring git {key} to {value}")
     try:
-        _ = subprocess.run(
-            ["git", "config", "--global", key, value],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
+        _ = session.run(["config", "--global", key, value])
     except subprocess.CalledProcessError as error:
         logger.error(f"Error configuring git key: {key} to value: {value}")
         logger.error("Return code: %d", error.returncode)
@@ -86,6 +126,201 @@ def git_configure(key, value):
         raise GitConfigError(f"Error configuring git key: {key} to value: {value}")
 
 
+_config_locks = {}
+_config_locks_guard = threading.Lock()
+
+
+def _config_lock(path):
+    # the .lock file keeps other processes out; threads of this one wait for each other instead of failing
+    with _config_locks_guard:
+        return _config_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+_CONFIG_SECTION = re.compile(r'^\s*\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+_CONFIG_VARIABLE = re.compile(r'^\s*([A-Za-z][A-Za-z0-9-]*)\s*(?:=|$)')
+
+
+def _global_config_path(env):
+    # same lookup order git uses for --global writes
+    if env.get("GIT_CONFIG_GLOBAL"):
+        return env["GIT_CONFIG_GLOBAL"]
+    home_config = os.path.join(env.get("HOME", os.path.expanduser("~")), ".gitconfig")
+    xdg_home = env.get("XDG_CONFIG_HOME") or os.path.join(os.path.dirname(home_config), ".config")
+    xdg_config = os.path.join(xdg_home, "git", "config")
+    if not os.path.exists(home_config) and os.path.exists(xdg_config):
+        return xdg_config
+    return home_config
+
+
+def _split_config_key(key):
+    section, _, rest = key.partition(".")
+    subsection, _, name = rest.rpartition(".")
+    if not section or not name:
+        raise GitConfigError(f"Invalid git config key: {key}")
+    return section.lower(), subsection or None, name.lower()
+
+
+def _quote_config_value(value):
+    quoted = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
+    if quoted != quoted.strip() or "#" in quoted or ";" in quoted:
+        quoted = '"%s"' % quoted
+    return quoted
+
+
+def _scan_config_value(line, quoted=False):
+    """``(continues, quoted)``: whether ``line`` ends in a backslash that continues its value, and in quotes."""
+    escaped = False
+    for char in line.rstrip("\n").rstrip("\r"):
+        if escaped:
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char in "#;" and not quoted:
+            # a comment runs to the end of the line, backslashes and all
+            return False, quoted
+    return escaped, quoted
+
+
+def _edit_config_lines(lines, changes):
+    """Apply ``{(section, subsection, name): value}`` to the lines of a git config file."""
+    changes = dict(changes)
+    section_ends = {}
+    result = []
+    current = None
+    # quoting state of a value continued on the next line, and whether that value is being dropped
+    continued = None
+    dropping = False
+    for line in lines:
+        if continued is not None:
+            more, quoted = _scan_config_value(line, continued)
+            continued = quoted if more else None
+            if not dropping:
+                result.append(line)
+                section_ends[current] = len(result)
+            continue
+        header = _CONFIG_SECTION.match(line)
+        if header:
+            section, _, subsection = header.group(1).partition(".")
+            if header.group(2) is not None:
+                subsection = re.sub(r"\\(.)", r"\1", header.group(2))
+            current = (section.lower(), subsection or None)
+        elif current is not None:
+            variable = _CONFIG_VARIABLE.match(line)
+            if variable:
+                more, quoted = _scan_config_value(line[variable.end():])
+                continued = quoted if more else None
+                dropping = current + (variable.group(1).lower(),) in changes
+                if dropping:
+                    # drop the old value with its continuation lines; the new one is written at the end of the section
+                    continue
+        result.append(line)
+        if current is not None:
+            section_ends[current] = len(result)
+    insertions = {}
+    appended = []
+    for (section, subsection, name), value in changes.items():
+        entry = "\t%s = %s\n" % (name, _quote_config_value(value))
+        if (section, subsection) in section_ends:
+            insertions.setdefault(section_ends[(section, subsection)], []).append(entry)
+        else:
+            appended.append(((section, subsection), entry))
+    for position in sorted(insertions, reverse=True):
+        if result[position - 1] and not result[position - 1].endswith("\n"):
+            result[position - 1] += "\n"
+        result[position:position] = insertions[position]
+    if appended and result and not result[-1].endswith("\n"):
+        result[-1] += "\n"
+    written = set()
+    for (section, subsection), entry in appended:
+        if (section, subsection) not in written:
+            written.add((section, subsection))
+            if subsection is None:
+                result.append("[%s]\n" % section)
+            else:
+                result.append('[%s "%s"]\n' % (section, subsection.replace("\\", "\\\\").replace('"', '\\"')))
+            result.extend(e for key, e in appended if key == (section, subsection))
+    return result
+
+
+@traced
+def git_configure_many(mapping, session=None, path=None):
+    """Set several git config keys with a single write.
+
+    Keys that already have the requested value are skipped, and nothing is written if
+    all of them do. Otherwise the config file is rewritten the way git does it: the new
+    contents go to ``<file>.lock`` (created exclusively, so a concurrent git or caller
+    fails instead of racing) and are then renamed over the original. Callers in other
+    threads of this process wait for each other rather than fail.
+
+    :param mapping: ``{key: value}``, e.g. ``{"user.name": "github-actions[bot]"}``.
+    :param session: :class:`~gitflow.run.GitSession` to use; defaults to the shared one.
+    :param path: Config file to edit; defaults to the one ``git config --global`` writes.
+    :return: The keys that were changed.
+    :raises GitConfigError: If the config cannot be read, locked or written.
+    """
+    session = session or get_session()
+    path = path or _global_config_path(session.env)
+    with _config_lock(path):
+        return _configure_file(mapping, session, path)
+
+
+def _configure_file(mapping, session, path):
+    current = {}
+    if os.path.exists(path):
+        try:
+            result = session.run(["config", "--file", path, "--null", "--list"])
+        except subprocess.CalledProcessError as error:
+            logger.error(f"Error reading git config file: {path}")
+            logger.error("Return code: %d", error.returncode)
+            logger.error("Stderr:\n%s", error.stderr.decode().strip())
+            raise GitConfigError(f"Error reading git config file: {path}")
+        for entry in result.stdout.decode().split("\0"):
+            if entry:
+                key, _, value = entry.partition("\n")
+                current[_split_config_key(key)] = value
+    changes = {}
+    for key, value in mapping.items():
+        parts = _split_config_key(key)
+        if current.get(parts) != value:
+            changes[parts] = value
+            logger.info(f"Configuring git {key} to {value}")
+    if not changes:
+        return []
+
+    lock_path = path + ".lock"
+    try:
+        fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
+        raise GitConfigError(f"Could not lock git config file {path}: {lock_path} exists")
+    except OSError as error:
+        raise GitConfigError(f"Could not lock git config file {path}: {error}")
+    committed = False
+    try:
+        try:
+            with open(path, encoding="utf-8") as original:
+                lines = original.readlines()
+            os.fchmod(fd, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            lines = []
+        with os.fdopen(fd, "w", encoding="utf-8") as lock:
+            fd = None
+            lock.writelines(_edit_config_lines(lines, changes))
+            lock.flush()
+            os.fsync(lock.fileno())
+        os.replace(lock_path, path)
+        committed = True
+    except OSError as error:
+        raise GitConfigError(f"Error writing git config file {path}: {error}")
+    finally:
+        if not committed:
+            if fd is not None:
+                os.close(fd)
+            os.unlink(lock_path)
+    return [key for key in mapping if _split_config_key(key) in changes]
+
+
 # def git_configure_user(name, email):
 #     logger.info(f"Configuring git user name to {name}, and email to {email}")
 #     try:
@@ -123,35 +358,15 @@ def git_configure(key, value):
 #     FAST_FORWARD = "fast-forward"
 
 
-def start_feature_branch(feature_name):
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "feature", "start", feature_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error starting feature branch %s", feature_name)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
+class BranchAlreadyExistsError(Exception):
+    def __init__(self, message):
+        self.message = message
 
-    # push
-    try:
-        _ = subprocess.run(
-            ["git", "push", "--set-upstream", "origin", "feature/%s" % feature_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error pushing feature branch %s", feature_name)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
+
+@traced
+def start_feature_branch(feature_name, session=None):
+    logger.info("Starting feature branch feature/%s", feature_name)
+    _engine(session).start_feature(feature_name)
 
 
 class FeatureBranchMergeError(Exception):
@@ -159,88 +374,16 @@ class FeatureBranchMergeError(Exception):
         self.message = message
 
 
-def finish_feature_branch(feature_name):
-    feature_branch = "feature/%s" % feature_name
-    logger.info("Tracking feature branch %s", feature_branch)
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "feature", "track", feature_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error tracking feature branch %s", feature_branch)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        message = "Error tracking feature branch. \n"
-        message += "Make sure you have git and git flow installed and that you are in the root of a git repository."
-        raise FeatureBranchMergeError(message)
+@traced
+def finish_feature_branch(feature_name, session=None):
+    logger.info("Finishing feature branch feature/%s", feature_name)
+    _engine(session).finish_feature(feature_name)
 
-    logger.info("Running command: git flow feature finish %s", feature_name)
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "feature", "finish", feature_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error finishing feature branch %s", feature_branch)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        if b"have diverged" in error.stderr:
-            message = "Branches 'develop' and 'origin/develop' have diverged."
-            message += "Resolve the conflict by running the following commands:\n"
-            message += "\t- git checkout develop\n"
-            message += "\t- git pull origin develop\n"
-            message += "\t- git checkout %s\n" % feature_branch
-            message += "\t- git merge develop\n"
-            message += "\t- Resolve any conflicts (commit the changes) and then run: git flow feature finish %s\n" % feature_name
-            raise FeatureBranchMergeError(message)
-        if b"CONFLICT (content): Merge conflict in" in error.stdout:
-            message = "There are merge conflicts. Resolve the conflict by running the following commands:\n"
-            message += "\t- git checkout develop\n"
-            message += "\t- git pull origin develop\n"
-            message += "\t- git checkout %s\n" % feature_branch
-            message += "\t- git merge develop\n"
-            message += "\t- Resolve any conflicts (commit the changes) and then run: git flow feature finish %s\n" % feature_name
-            raise FeatureBranchMergeError(message)
-        else:
-            raise error
-
-
-def start_release_branch(release_name):
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "release", "start", release_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error starting release branch %s", release_name)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
 
-    # push
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "release", "publish", release_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error publishing release branch %s", release_name)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
+@traced
+def start_release_branch(release_name, session=None):
+    logger.info("Starting release branch release/%s", release_name)
+    _engine(session).start_release(release_name)
 
 
 class ReleaseBranchMergeError(Exception):
@@ -253,74 +396,30 @@ class TagAlreadyExistsError(Exception):
         self.message = message
 
 
-def finish_release_branch(release_name):
-    release_branch = "release/%s" % release_name
-    logger.info("Tracking release branch %s", release_branch)
-    try:
-        _ = subprocess.run(
-            ["git", "flow", "release", "track", release_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error tracking release branch %s", release_branch)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        message = "Error tracking release branch. \n"
-        message += "Make sure you have git and git flow installed and that you are in the root of a git repository."
-        raise FeatureBranchMergeError(message)
+@traced
+def finish_release_branch(release_name, session=None):
+    logger.info("Finishing release branch release/%s", release_name)
+    _engine(session).finish_release(release_name, "Release %s" % release_name)
 
-    logger.info("Running command: git flow release finish %s", release_name)
-    try:
-        _ = subprocess.run(
-            # https://github.com/microsoft/vscode-remote-release/issues/3682
-            ["git", "flow", "release", "finish", release_name,
-             "-m", "Release %s" % release_name,
-             # "-n",  # no tag
-             # "-k",  # keep branch
-             # "-F"
-             ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error finishing release branch %s", release_branch)
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        if b"have diverged" in error.stderr:
-            message = "Branches 'develop' and 'origin/develop' have diverged."
-            message += "Resolve the conflict by running the following commands:\n"
-            message += "\t- git checkout develop\n"
-            message += "\t- git pull origin develop\n"
-            message += "\t- git checkout %s\n" % release_branch
-            message += "\t- git merge develop\n"
-            message += "\t- Resolve any conflicts (commit the changes) and then run: git flow release finish %s\n" % release_name
-            raise ReleaseBranchMergeError(message)
-        if b"CONFLICT (content): Merge conflict in" in error.stdout:
-            message = "There are merge conflicts. Resolve the conflict by running the following commands:\n"
-            message += "\t- git checkout develop\n"
-            message += "\t- git pull origin develop\n"
-            message += "\t- git checkout %s\n" % release_branch
-            message += "\t- git merge develop\n"
-            message += "\t- Resolve any conflicts (commit the changes) and then run: git flow release finish %s\n" % release_name
-            raise ReleaseBranchMergeError(message)
-        else:
-            raise error
-    # push tags
-    try:
-        _ = subprocess.run(
-            ["git", "push", "origin", "--tags"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-    except subprocess.CalledProcessError as error:
-        logger.error("Error pushing tags")
-        logger.error("Return code: %d", error.returncode)
-        logger.error("Stdout:\n%s", error.stdout.decode().strip())
-        logger.error("Stderr:\n%s", error.stderr.decode().strip())
-        raise error
+
+@traced
+def next_release_version(bump, session=None):
+    """Version after the latest version tag with its ``bump`` (major, minor or patch) part incremented."""
+    return _engine(session).next_version(bump)
+
+
+@traced
+def start_hotfix_branch(hotfix_name, session=None):
+    logger.info("Starting hotfix branch hotfix/%s", hotfix_name)
+    _engine(session).start_hotfix(hotfix_name)
+
+
+class HotfixBranchMergeError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+@traced
+def finish_hotfix_branch(hotfix_name, session=None):
+    logger.info("Finishing hotfix branch hotfix/%s", hotfix_name)
+    _engine(session).finish_hotfix(hotfix_name, "Hotfix %s" % hotfix_name)
@@ -0,0 +1,69 @@
+"""Handlers for the ``repository_dispatch`` actions in ``main.py``'s routing table.
+
+Each is called with the payload's ``client_payload.inputs`` in the repository to act on.
+The feature actions' ``feature_name`` may name several features, as a JSON list or
+separated by commas; those are handled as one batch (see :mod:`gitflow.batch`) and a
+:class:`~gitflow.batch.BatchError` lists the ones that failed.
+"""
+from . import logger
+from .gitflow import (git_flow_init, start_feature_branch, finish_feature_branch, start_release_branch,
+                      finish_release_branch, start_hotfix_branch, finish_hotfix_branch, next_release_version)
+from .validation import parse_names
+
+
+def _run(operation, names, single):
+    if len(names) == 1:
+        single(names[0])
+        return
+    from .batch import BatchError, run_batch
+
+    results = run_batch(operation, names)
+    failed = [result for result in results if not result.ok]
+    if failed:
+        raise BatchError("%d of %d targets failed: %s" % (len(failed), len(results), "; ".join(
+            "%s (%s)" % (result.name, result.error) for result in failed)), results)
+
+
+def start_feature(inputs):
+    names = parse_names(inputs['feature_name'])
+    logger.info(f"Creating feature branches {', '.join('feature/' + name for name in names)} from develop")
+    git_flow_init()
+    _run("start_feature", names, start_feature_branch)
+
+
+def finish_feature(inputs):
+    names = parse_names(inputs['feature_name'])
+    logger.info(f"Merging {', '.join('feature/' + name for name in names)} into develop, then deleting them")
+    git_flow_init()
+    _run("finish_feature", names, finish_feature_branch)
+
+
+def start_release(inputs):
+    logger.info(f"Creating release branch release/{inputs['release_name']} from develop")
+    git_flow_init()
+    start_release_branch(inputs['release_name'])
+
+
+def finish_release(inputs):
+    logger.info(f"Merging release/{inputs['release_name']} into develop and main, then deleting release")
+    git_flow_init()
+    finish_release_branch(inputs['release_name'])
+
+
+def unstable_release(inputs):
+    git_flow_init()
+    release_name = next_release_version(inputs.get('bump') or 'minor')
+    logger.info(f"Creating release branch release/{release_name} from develop")
+    start_release_branch(release_name)
+
+
+def start_hotfix(inputs):
+    logger.info(f"Creating hotfix branch hotfix/{inputs['hotfix_name']} from main")
+    git_flow_init()
+    start_hotfix_branch(inputs['hotfix_name'])
+
+
+def finish_hotfix(inputs):
+    logger.info(f"Merging hotfix/{inputs['hotfix_name']} into main and develop, then deleting hotfix")
+    git_flow_init()
+    finish_hotfix_branch(inputs['hotfix_name'])
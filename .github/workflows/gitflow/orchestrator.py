@@ -0,0 +1,133 @@
+"""Run one gitflow operation across related repositories.
+
+The repositories come from the dependency graph: the one an action was triggered for
+plus its dependencies and dependants within the payload's ``upstream_scope`` and
+``downstream_scope``. Each repository is handled in its own process on a local
+clone, and starts as soon as everything it depends on within the scope is done, so
+a slow repository only holds up its own dependants::
+
+    results = orchestrate("finish_release", "org/app", dependencies, "/srv/clones",
+                          name="1.4.0", upstream_scope=-1)
+    failed = [result for result in results if result.status == FAILED]
+
+This is a library for a runner that holds clones of all the repositories; ``main.py``
+acts on a single checkout and does not use it, so the scopes in a dispatch payload are
+only checked there, not acted on.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .batch import OPERATIONS
+from .dependencies import ClosureCache, _as_graph, get_release_waves
+from .engine import GitFlowEngine
+from .run import GitSession
+
+# values of RepositoryResult.status
+OK = "ok"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class RepositoryResult(namedtuple("RepositoryResult", ["repository", "status", "error"])):
+    """Outcome of the operation on one repository.
+
+    ``status`` is :data:`OK`, :data:`FAILED`, or :data:`SKIPPED` if the operation did not
+    run because a dependency failed; ``error`` is a message, or None if it went through.
+    """
+
+    @property
+    def ok(self):
+        return self.status == OK
+
+
+def _run_operation(path, operation, name, env):
+    # runs in a worker process; exceptions are turned into messages here because the
+    # gitflow exceptions do not survive pickling
+    try:
+        with GitSession(path, env) as session:
+            getattr(GitFlowEngine(session), operation)(name)
+    except Exception as error:
+        return "%s: %s" % (type(error).__name__, getattr(error, "message", None) or error)
+    return None
+
+
+def _clone_path(clones, repository):
+    if isinstance(clones, str):
+        return os.path.join(clones, repository)
+    return clones[repository]
+
+
+def orchestrate(operation, repository, dependencies, clones, name, upstream_scope=0, downstream_scope=0,
+                processes=None, env=None):
+    """Run ``operation`` on ``repository`` and the repositories in its scopes, dependencies first.
+
+    A failure does not stop repositories that do not depend on the failed one; those
+    that do (directly or transitively) are :data:`SKIPPED`, with the reason as their error.
+
+    :param operation: One of :data:`~gitflow.batch.OPERATIONS`, e.g. ``"finish_release"``.
+    :param repository: Repository the action was triggered for.
+    :param dependencies: Mapping of repository to its dependencies, or a prebuilt
+        :class:`~gitflow.dependencies.DependencyGraph` or :class:`~gitflow.dependencies.ClosureCache`.
+    :param clones: Directory holding a clone per repository (at ``<clones>/<repository>``),
+        or a mapping of repository to clone path.
+    :param name: Feature or release name, or a mapping of repository to name.
+    :param upstream_scope: Levels of dependencies to include; negative for all.
+    :param downstream_scope: Levels of dependants to include; negative for all.
+    :param processes: Maximum number of worker processes; defaults to the number of CPUs.
+    :param env: Environment for git; defaults to the workers' ``os.environ``.
+    :return: List of :class:`RepositoryResult`, in release order.
+    :raises ValueError: If ``operation`` is not a gitflow operation.
+    :raises DependencyCycleError: If the repositories in scope depend on each other in a cycle.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unknown gitflow operation: %s" % operation)
+    graph = _as_graph(dependencies)
+    order = [repo for wave in get_release_waves(repository, graph, upstream_scope, downstream_scope) for repo in wave]
+    if isinstance(graph, ClosureCache):
+        graph = graph.graph
+    scope = set(order)
+    waiting_on = {repo: {dep for dep in graph.upstream(repo, 1) if dep in scope} for repo in order}
+    dependants = {repo: [] for repo in order}
+    for repo, deps in waiting_on.items():
+        for dep in deps:
+            dependants[dep].append(repo)
+
+    errors = {}
+    skipped = set()
+    submitted = set()
+    running = {}
+
+    def skip(failed):
+        for dependant in dependants[failed]:
+            if dependant not in errors:
+                errors[dependant] = "Dependency '%s' failed" % failed
+                skipped.add(dependant)
+                skip(dependant)
+
+    with ProcessPoolExecutor(processes) as executor:
+        def submit_ready():
+            for repo in order:
+                if repo not in submitted and repo not in errors and not waiting_on[repo]:
+                    submitted.add(repo)
+                    path = _clone_path(clones, repo)
+                    repo_name = name[repo] if isinstance(name, dict) else name
+                    running[executor.submit(_run_operation, path, operation, repo_name, env)] = repo
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                repo = running.pop(future)
+                try:
+                    errors[repo] = future.result()
+                except Exception as error:
+                    errors[repo] = "%s: %s" % (type(error).__name__, error)
+                if errors[repo] is None:
+                    for dependant in dependants[repo]:
+                        waiting_on[dependant].discard(repo)
+                else:
+                    skip(repo)
+            submit_ready()
+    return [RepositoryResult(repo, SKIPPED if repo in skipped else FAILED if errors[repo] else OK, errors[repo])
+            for repo in order]
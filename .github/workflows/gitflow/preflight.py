@@ -0,0 +1,206 @@
+"""Dry runs of the finish operations: which merges would conflict, and which branches have diverged.
+
+Nothing is changed, neither refs nor a working tree: merges are computed with
+``git merge-tree --write-tree`` and branch positions compared with ``git rev-list
+--left-right --count``. Many branches can be checked at once, after a single fetch,
+so a whole release can be triaged before anything is finished::
+
+    for report in preflight_many("finish_feature"):  # every feature branch
+        if not report.ok:
+            print(report.describe())
+
+From the command line, in the repository to check::
+
+    python -m gitflow.preflight finish_feature --all
+    python -m gitflow.preflight finish_release 1.4.0
+"""
+import argparse
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from .engine import _MERGE_ERRORS, GitFlowEngine, _conflicts, _merge_tree
+
+OPERATIONS = ("finish_feature", "finish_release", "finish_hotfix")
+
+
+class MergeCheck(namedtuple("MergeCheck", ["target", "source", "ahead", "behind", "conflicts", "conflict_count"])):
+    """One merge of ``source`` into ``target`` that the operation would make.
+
+    ``ahead`` counts the commits ``source`` would bring in, ``behind`` the commits of
+    ``target`` that ``source`` lacks. ``conflicts`` holds the conflicting paths (only the
+    last ones if there are very many; ``conflict_count`` has the full number).
+    """
+
+    @property
+    def fast_forward(self):
+        return self.behind == 0
+
+
+class Divergence(namedtuple("Divergence", ["branch", "ahead", "behind"])):
+    """A local branch that is ``behind`` its remote-tracking branch (and ``ahead`` of it)."""
+
+
+class PreflightReport(namedtuple("PreflightReport", ["operation", "name", "merges", "diverged", "error"])):
+    """Predicted outcome of ``operation`` on ``name``; ``error`` is set if it cannot run at all."""
+
+    @property
+    def ok(self):
+        return self.error is None and not self.diverged and not any(merge.conflict_count for merge in self.merges)
+
+    def describe(self):
+        """One line per problem, or a line saying everything merges cleanly."""
+        title = "%s %s" % (self.operation, self.name)
+        if self.error:
+            return "%s: %s" % (title, self.error)
+        lines = []
+        for branch in self.diverged:
+            lines.append("%s: branch '%s' is %d commits behind its remote (and %d ahead)"
+                         % (title, branch.branch, branch.behind, branch.ahead))
+        for merge in self.merges:
+            if merge.conflict_count:
+                more = merge.conflict_count - len(merge.conflicts)
+                lines.append("%s: merging %s into %s conflicts in %s%s" % (
+                    title, merge.source, merge.target, ", ".join(merge.conflicts),
+                    " and %d more files" % more if more else ""))
+        if not lines:
+            merges = ", ".join("%s into %s (%d commits)" % (merge.source, merge.target, merge.ahead)
+                               for merge in self.merges)
+            lines.append("%s: merges cleanly: %s" % (title, merges))
+        return "\n".join(lines)
+
+
+def _counts(engine, left, right):
+    """``(left only, right only)`` commit counts."""
+    output = engine._output(["rev-list", "--left-right", "--count", "%s...%s" % (left, right)], "counting commits")
+    left_only, right_only = output.split()
+    return int(left_only), int(right_only)
+
+
+def _divergence(engine, branch):
+    local = engine._local(branch)
+    remote = engine._remote(branch)
+    if local is None or remote is None or local == remote:
+        return None
+    ahead, behind = _counts(engine, local, remote)
+    return Divergence(branch, ahead, behind) if behind else None
+
+
+def _check_merge(engine, target_branch, target, source_branch, source):
+    """:class:`MergeCheck` of ``source`` into ``target``, plus the commit the merge would produce.
+
+    The commit is only created (as an unreferenced object) when it is needed to check a
+    later merge; None means the merge conflicts.
+    """
+    behind, ahead = _counts(engine, target, source)
+    if ahead == 0:
+        return MergeCheck(target_branch, source_branch, 0, behind, [], 0), target
+    if behind == 0:
+        return MergeCheck(target_branch, source_branch, ahead, 0, [], 0), source
+    result = _merge_tree(engine, target, source)
+    if result.stopped == "conflict" or result.returncode == 1:
+        conflicts, count = _conflicts(result)
+        # a conflict is a conflict even if its paths could not be kept
+        return MergeCheck(target_branch, source_branch, ahead, behind, conflicts, max(count, 1)), None
+    if result.returncode != 0:
+        engine._log_failure(result, "predicting merge of %s into %s" % (source_branch, target_branch))
+        result.check_returncode()
+    tree = result.stdout.decode().split("\n", 1)[0]
+    merged = engine._output(["commit-tree", tree, "-p", target, "-p", source, "-m", "preflight"],
+                            "creating merge commit")
+    return MergeCheck(target_branch, source_branch, ahead, behind, [], 0), merged
+
+
+def _tip(engine, branch):
+    return engine._local(branch) or engine._remote(branch)
+
+
+def _preflight(engine, operation, name):
+    kind = operation.partition("_")[2]
+    branch = engine.prefix(kind) + name
+    try:
+        source = _tip(engine, branch)
+        if source is None:
+            return PreflightReport(operation, name, [], [], "Branch '%s' does not exist locally or on %s."
+                                   % (branch, engine.remote))
+        if kind == "feature":
+            targets = [engine.develop]
+        else:
+            tag = engine.prefix("versiontag") + name
+            if engine.session.rev_parse("refs/tags/%s" % tag):
+                return PreflightReport(operation, name, [], [], "Tag '%s' already exists." % tag)
+            targets = [engine.master, engine.develop]
+        diverged = [divergence for divergence in (_divergence(engine, target) for target in targets) if divergence]
+        merges = []
+        source_branch = branch
+        for target_branch in targets:
+            target = _tip(engine, target_branch)
+            if target is None:
+                error = "Branch '%s' does not exist locally or on %s." % (target_branch, engine.remote)
+                return PreflightReport(operation, name, merges, diverged, error)
+            check, merged = _check_merge(engine, target_branch, target, source_branch, source)
+            merges.append(check)
+            if merged is not None:
+                # release and hotfix: develop gets what master would end up with
+                source_branch, source = target_branch, merged
+        return PreflightReport(operation, name, merges, diverged, None)
+    except Exception as error:
+        return PreflightReport(operation, name, [], [], getattr(error, "message", None) or str(error))
+
+
+def branch_names(engine, kind):
+    """Names of all ``kind`` (e.g. ``"feature"``) branches, local or remote-tracking, without prefix."""
+    prefix = engine.prefix(kind)
+    output = engine._output(["for-each-ref", "--format=%(refname)", "refs/heads/%s" % prefix,
+                             "refs/remotes/%s/%s" % (engine.remote, prefix)], "listing %s branches" % kind)
+    names = set()
+    for ref in output.splitlines():
+        names.add(ref.partition(prefix)[2])
+    return sorted(names)
+
+
+def preflight_many(operation, names=None, engine=None, fetch=True, threads=4):
+    """:class:`PreflightReport` for ``operation`` on each of ``names``, in order.
+
+    :param operation: One of :data:`OPERATIONS`.
+    :param names: Branch names without prefix; all branches of the operation's kind if None.
+    :param engine: :class:`~gitflow.engine.GitFlowEngine` to work with; defaults to one on the shared session.
+    :param fetch: Whether to bring the branches involved up to date first, in one fetch.
+    :param threads: Merges checked at the same time.
+    """
+    if operation not in OPERATIONS:
+        raise ValueError("Unknown operation: %s" % operation)
+    engine = engine or GitFlowEngine()
+    kind = operation.partition("_")[2]
+    if fetch and engine.has_remote:
+        base = [engine.develop] if kind == "feature" else [engine.master, engine.develop]
+        optional = [engine.prefix(kind)] if names is None else [engine.prefix(kind) + name for name in names]
+        engine.fetch(base, _MERGE_ERRORS[kind], optional=optional)
+    if names is None:
+        names = branch_names(engine, kind)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda name: _preflight(engine, operation, name), names))
+
+
+def preflight(operation, name, engine=None, fetch=True):
+    """:class:`PreflightReport` for ``operation`` (e.g. ``"finish_release"``) on ``name``."""
+    return preflight_many(operation, [name], engine, fetch, threads=1)[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("operation", choices=OPERATIONS)
+    parser.add_argument("names", nargs="*", help="branch names without prefix")
+    parser.add_argument("--all", action="store_true", help="check every branch of the operation's kind")
+    parser.add_argument("--no-fetch", action="store_true", help="use the remote-tracking branches as they are")
+    args = parser.parse_args(argv)
+    if not args.names and not args.all:
+        parser.error("give branch names or --all")
+    reports = preflight_many(args.operation, None if args.all else args.names, fetch=not args.no_fetch)
+    for report in reports:
+        print(report.describe())
+    return 0 if all(report.ok for report in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Table-driven routing of ``repository_dispatch`` actions to their handlers.
+
+Handlers are named by ``"module:function"`` strings and imported the first time their
+action is dispatched, so building the table costs nothing and an event only loads
+the code it needs::
+
+    router = ActionRouter({"start_feature": "gitflow.handlers:start_feature"})
+    router.dispatch(payload)  # imports gitflow.handlers, calls start_feature(inputs)
+"""
+import importlib
+
+from . import tracing
+
+
+class UnknownActionError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+class ActionRouter:
+    """Maps action names to handlers called with the payload's ``client_payload.inputs``.
+
+    :param routes: Initial ``{action: target}`` table; see :meth:`register`.
+    """
+
+    def __init__(self, routes=None):
+        self._targets = {}
+        self._handlers = {}
+        for action, target in (routes or {}).items():
+            self.register(action, target)
+
+    def __contains__(self, action):
+        return action in self._targets
+
+    @property
+    def actions(self):
+        return sorted(self._targets)
+
+    def register(self, action, target=None):
+        """Route ``action`` to ``target``, a callable or a ``"module:function"`` string.
+
+        Without ``target``, returns a decorator that registers the decorated function.
+        """
+        if target is None:
+            def decorator(function):
+                self.register(action, function)
+                return function
+            return decorator
+        if isinstance(target, str) and ":" not in target:
+            raise ValueError("Handler for %s must look like 'module:function', not %r" % (action, target))
+        self._targets[action] = target
+        self._handlers.pop(action, None)
+        return target
+
+    def handler(self, action):
+        """The callable for ``action``, importing its module if needed.
+
+        :raises UnknownActionError: If nothing is registered for ``action``.
+        """
+        handler = self._handlers.get(action)
+        if handler is None:
+            target = self._targets.get(action)
+            if target is None:
+                raise UnknownActionError("Unknown action '%s'. Known actions: %s" % (action, ", ".join(self.actions)))
+            if isinstance(target, str):
+                module, _, name = target.partition(":")
+                handler = getattr(importlib.import_module(module), name)
+            else:
+                handler = target
+            self._handlers[action] = handler
+        return handler
+
+    def dispatch(self, payload):
+        """Call the handler of ``payload['action']`` with the payload's inputs and return its result."""
+        inputs = payload.get('client_payload', {}).get('inputs', {})
+        handler = self.handler(payload['action'])
+        with tracing.span("action", action=payload['action']):
+            return handler(inputs)
@@ -1,5 +1,314 @@
+import os
+import re
+import selectors
 import subprocess
 import logging
+import threading
+from collections import deque
+
+from . import tracing
 
 logger = logging.getLogger(__name__)
 
+# Known ways for git and git-flow to fail, matched line by line against output as it arrives.
+FAILURE_SIGNATURES = {
+    # a branch that moved on the remote, as git-flow and a rejected push report it
+    "diverged": rb"have diverged|\[rejected\].*\((?:fetch first|non-fast-forward)\)",
+    "conflict": rb"^CONFLICT \(|Automatic merge failed|There are merge conflicts",
+    "git_not_found": rb"Command 'git' not found|git: (?:command )?not found",
+    "gitflow_not_installed": rb"'flow' is not a git command",
+    # a tag the remote already has, or a local one a fetch would have to overwrite
+    "tag_exists": rb"[Tt]ag '[^']*' already exists|refs/tags/\S+.*\(already exists\)|\(would clobber existing tag\)",
+}
+_SIGNATURES = re.compile(b"|".join(b"(?P<%s>%s)" % (name.encode(), pattern)
+                                   for name, pattern in FAILURE_SIGNATURES.items()), re.MULTILINE)
+# literal parts of the signatures; a plain substring search is some 40 times faster than
+# the regex, so output containing none of them is never matched against it
+_TRIGGERS = (b"diverged", b"[rejected]", b"CONFLICT", b"merge failed", b"merge conflicts", b"not found",
+             b"not a git command", b"already exists")
+# longest unterminated line kept for matching; anything before it is only counted
+_MAX_LINE = 4096
+
+
+class OutputTail:
+    """The last ``limit`` bytes written to it, plus how many bytes and lines went through."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.total = 0
+        self.lines = 0
+        self._chunks = deque()
+        self._size = 0
+
+    def write(self, data):
+        self.total += len(data)
+        self.lines += data.count(b"\n")
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._size > self.limit:
+            excess = self._size - self.limit
+            first = self._chunks[0]
+            if len(first) <= excess:
+                self._chunks.popleft()
+                self._size -= len(first)
+            else:
+                self._chunks[0] = first[excess:]
+                self._size -= excess
+
+    @property
+    def dropped(self):
+        """Bytes no longer held because the limit was reached."""
+        return self.total - self._size
+
+    def getvalue(self):
+        return b"".join(self._chunks)
+
+
+class StreamResult(subprocess.CompletedProcess):
+    """:class:`subprocess.CompletedProcess` of :meth:`GitSession.stream`.
+
+    ``stdout`` and ``stderr`` hold only the last bytes of each stream; the full
+    counts are in :attr:`stdout_tail` and :attr:`stderr_tail`. :attr:`signatures` lists
+    the :data:`FAILURE_SIGNATURES` seen, in order, and :attr:`stopped` names the one
+    git was killed for, if any.
+    """
+
+    def __init__(self, args, returncode, stdout_tail, stderr_tail, signatures, stopped):
+        super().__init__(args, returncode, stdout_tail.getvalue(), stderr_tail.getvalue())
+        self.stdout_tail = stdout_tail
+        self.stderr_tail = stderr_tail
+        self.signatures = signatures
+        self.stopped = stopped
+
+
+class _CatFile:
+    """A long-lived ``git cat-file --batch`` or ``--batch-check`` process."""
+
+    def __init__(self, session, option):
+        self.option = option
+        self.lock = threading.Lock()
+        self.process = session.popen(["cat-file", option], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+
+    def _failed(self):
+        # the process only stops early on fatal errors, e.g. when cwd is not a repository
+        self.process.kill()
+        _, stderr = self.process.communicate()
+        return subprocess.CalledProcessError(self.process.returncode, ["git", "cat-file", self.option],
+                                             output=b"", stderr=stderr or b"")
+
+    def query(self, name):
+        if "\n" in name:
+            raise ValueError("Object names cannot contain newlines: %r" % name)
+        with self.lock, tracing.span("git", command="cat-file %s %s" % (self.option, name)) as span:
+            try:
+                self.process.stdin.write(name.encode() + b"\n")
+                self.process.stdin.flush()
+            except BrokenPipeError:
+                raise self._failed()
+            header = self.process.stdout.readline()
+            if not header:
+                raise self._failed()
+            fields = header.decode().split()
+            if fields[-1] in ("missing", "ambiguous"):
+                return None
+            sha, kind, size = fields
+            content = None
+            if self.option == "--batch":
+                content = self.process.stdout.read(int(size) + 1)[:-1]
+            span.set(stdout_bytes=len(header) + (int(size) + 1 if content is not None else 0))
+            return sha, kind, int(size), content
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+
+class GitSession:
+    """All git invocations for one working directory.
+
+    Commands run with one shared environment and working directory, and every process
+    started is counted in :attr:`spawns`. Ref and object lookups go to long-lived
+    ``git cat-file --batch-check``/``--batch`` processes, so asking for many refs costs
+    one spawn rather than one per lookup.
+
+    :param cwd: Working directory; defaults to the current directory at creation time.
+    :param env: Environment for git; defaults to a copy of ``os.environ``.
+    """
+
+    def __init__(self, cwd=None, env=None):
+        self.cwd = os.path.abspath(cwd or os.getcwd())
+        self.env = dict(os.environ if env is None else env)
+        self.spawns = 0
+        self._batch_check = None
+        self._batch = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def popen(self, args, **kwargs):
+        self.spawns += 1
+        return subprocess.Popen(["git"] + list(args), cwd=self.cwd, env=self.env, **kwargs)
+
+    def run(self, args, check=True, input=None):
+        """Run ``git <args>`` to completion, capturing stdout and stderr.
+
+        :param input: Bytes to feed to git's stdin.
+        :raises subprocess.CalledProcessError: If ``check`` and git exits non-zero.
+        """
+        logger.debug("Running command: git %s", " ".join(args))
+        self.spawns += 1
+        with tracing.span("git", command=" ".join(args)) as span:
+            result = subprocess.run(
+                ["git"] + list(args),
+                cwd=self.cwd,
+                env=self.env,
+                input=input,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
+            span.set(returncode=result.returncode, stdout_bytes=len(result.stdout), stderr_bytes=len(result.stderr))
+        if check:
+            result.check_returncode()
+        return result
+
+    def stream(self, args, check=True, input=None, limit=65536, stop_on=()):
+        """Run ``git <args>``, reading its output as it comes instead of buffering all of it.
+
+        Each of stdout and stderr keeps only its last ``limit`` bytes, so memory stays
+        bounded however much git prints. Complete lines are checked against
+        :data:`FAILURE_SIGNATURES` on the way; if one named in ``stop_on`` shows up, git
+        is killed right away instead of being left to finish a doomed operation.
+
+        :param input: Bytes to feed to git's stdin.
+        :param stop_on: Names of signatures that end the command early.
+        :return: :class:`StreamResult`; a command stopped early has a negative return code, and its
+            output ends with the line it was stopped for.
+        :raises subprocess.CalledProcessError: If ``check`` and git exits non-zero or was stopped.
+        """
+        logger.debug("Running command: git %s", " ".join(args))
+        tails = {"stdout": OutputTail(limit), "stderr": OutputTail(limit)}
+        signatures = []
+        stopped = None
+        with tracing.span("git", command=" ".join(args)) as span:
+            try:
+                process = self.popen(args, stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                # what a shell would have said, so callers only need to look at signatures
+                tails["stderr"].write(b"Command 'git' not found\n")
+                result = StreamResult(["git"] + list(args), 127, tails["stdout"], tails["stderr"], ["git_not_found"],
+                                      None)
+                span.set(returncode=127)
+                if check:
+                    result.check_returncode()
+                return result
+            if input is not None:
+                threading.Thread(target=self._feed, args=(process.stdin, input), daemon=True).start()
+            partial = {}
+            with selectors.DefaultSelector() as selector:
+                selector.register(process.stdout, selectors.EVENT_READ, "stdout")
+                selector.register(process.stderr, selectors.EVENT_READ, "stderr")
+                while stopped is None and selector.get_map():
+                    for key, _ in selector.select():
+                        data = os.read(key.fd, 65536)
+                        held = partial.get(key.data, b"")
+                        if data:
+                            text = held + data
+                            end = text.rfind(b"\n") + 1
+                            complete, partial[key.data] = text[:end], text[end:][-_MAX_LINE:]
+                        else:
+                            selector.unregister(key.fileobj)
+                            complete, partial[key.data] = held, b""
+                        if any(trigger in complete for trigger in _TRIGGERS):
+                            for match in _SIGNATURES.finditer(complete):
+                                if match.lastgroup not in signatures:
+                                    signatures.append(match.lastgroup)
+                                if match.lastgroup in stop_on:
+                                    stopped = match.lastgroup
+                                    # the output ends with the line git is stopped for
+                                    line_end = complete.find(b"\n", match.end()) + 1 or len(complete)
+                                    data = data[:max(line_end - len(held), 0)]
+                                    break
+                        tails[key.data].write(data)
+                        if stopped is not None:
+                            break
+            if stopped is not None:
+                logger.debug("Stopping git %s: %s", args[0], stopped)
+                process.kill()
+            process.stdout.close()
+            process.stderr.close()
+            process.wait()
+            span.set(returncode=process.returncode, stdout_bytes=tails["stdout"].total,
+                     stderr_bytes=tails["stderr"].total, stopped=stopped)
+        result = StreamResult(process.args, process.returncode, tails["stdout"], tails["stderr"], signatures, stopped)
+        if check:
+            result.check_returncode()
+        return result
+
+    @staticmethod
+    def _feed(pipe, data):
+        try:
+            pipe.write(data)
+            pipe.close()
+        except BrokenPipeError:
+            # git stopped reading: it failed, or was stopped on purpose
+            pass
+
+    def object_info(self, name):
+        """``(sha, type, size)`` of the object ``name`` resolves to, or None if it does not exist."""
+        if self._batch_check is None:
+            self._batch_check = _CatFile(self, "--batch-check")
+        try:
+            info = self._batch_check.query(name)
+        except subprocess.CalledProcessError:
+            self._batch_check = None
+            raise
+        return info[:3] if info else None
+
+    def read_object(self, name):
+        """``(sha, type, content)`` of the object ``name`` resolves to, or None if it does not exist."""
+        if self._batch is None:
+            self._batch = _CatFile(self, "--batch")
+        try:
+            info = self._batch.query(name)
+        except subprocess.CalledProcessError:
+            self._batch = None
+            raise
+        return (info[0], info[1], info[3]) if info else None
+
+    def rev_parse(self, name):
+        """Object id ``name`` resolves to, or None."""
+        info = self.object_info(name)
+        return info[0] if info else None
+
+    def ref_exists(self, ref):
+        """Whether ``ref`` resolves to an existing object.
+
+        :raises subprocess.CalledProcessError: If git cannot look anything up here, e.g. outside a repository.
+        """
+        return self.object_info(ref) is not None
+
+    def close(self):
+        for batch in (self._batch_check, self._batch):
+            if batch is not None:
+                batch.close()
+        self._batch_check = self._batch = None
+
+
+_sessions = {}
+
+
+def get_session(cwd=None):
+    """Shared :class:`GitSession` for ``cwd`` (default: the current directory)."""
+    cwd = os.path.abspath(cwd or os.getcwd())
+    session = _sessions.get(cwd)
+    if session is None:
+        session = _sessions[cwd] = GitSession(cwd)
+    return session
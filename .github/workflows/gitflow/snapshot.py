@@ -0,0 +1,248 @@
+"""Dependency graphs loaded from a binary snapshot that is memory-mapped instead of parsed.
+
+Parsing a fleet-wide manifest and indexing it costs every worker the same work on
+every run. :func:`load_graph` does it once per manifest version: it writes a snapshot
+next to the manifest and afterwards only maps that file, so startup no longer grows
+with the size of the graph. The snapshot records the SHA-256 of the manifest it was
+built from and is rebuilt as soon as the manifest's content changes::
+
+    graph = load_graph("dependencies.yaml")
+    graph.downstream("org/lib")              # same queries as DependencyGraph
+    get_release_waves("org/lib", graph, downstream_scope=-1)
+
+Layout (native byte order, every array ``uint32``)::
+
+    header       magic, version, nodes, edges, SHA-256 of the manifest
+    name_offsets nodes + 1 offsets into the name blob
+    name_order   node ids sorted by name, for binary search
+    forward      nodes + 1 offsets, then edges dependency ids     (CSR)
+    reverse      nodes + 1 offsets, then edges dependant ids      (CSR)
+    names        UTF-8 names, back to back
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+from .dependencies import DependencyGraph
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+_MAGIC = b"GFDG"
+_VERSION = 1
+_HEADER = struct.Struct("=4sIII32s")
+
+
+class SnapshotError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+
+def parse_manifest(path, content=None):
+    """``{repo: [dependencies]}`` from a JSON or YAML file (chosen by extension).
+
+    :param content: The file's bytes, if already read.
+    """
+    if content is None:
+        with open(path, "rb") as f:
+            content = f.read()
+    if path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            raise SnapshotError("Reading %s needs PyYAML: pip install pyyaml" % path)
+        dependencies = yaml.safe_load(content)
+    else:
+        dependencies = json.loads(content)
+    if not isinstance(dependencies, dict):
+        raise SnapshotError("%s must map each repository to the list of repositories it depends on" % path)
+    for repo, deps in dependencies.items():
+        if deps is not None and (not isinstance(deps, list) or not all(isinstance(dep, str) for dep in deps)):
+            raise SnapshotError("%s: the dependencies of %s must be a list of repository names, not %r"
+                                % (path, repo, deps))
+    return {repo: list(deps or ()) for repo, deps in dependencies.items()}
+
+
+def write_snapshot(dependencies, path, digest=b"\0" * 32):
+    """Write the snapshot of ``dependencies`` (a mapping or :class:`DependencyGraph`) to ``path`` atomically."""
+    graph = dependencies if isinstance(dependencies, DependencyGraph) else DependencyGraph(dependencies)
+    names = [name.encode() for name in graph._names]
+    name_offsets = array("I", [0])
+    for name in names:
+        name_offsets.append(name_offsets[-1] + len(name))
+    name_order = array("I", sorted(range(len(names)), key=names.__getitem__))
+    sections = [name_offsets, name_order]
+    edges = 0
+    for adjacency in (graph._forward, graph._reverse):
+        offsets = array("I", [0])
+        targets = array("I")
+        for neighbours in adjacency:
+            targets.extend(neighbours)
+            offsets.append(len(targets))
+        sections += [offsets, targets]
+        edges = len(targets)
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(handle, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(names), edges, digest))
+            for section in sections:
+                section.tofile(f)
+            f.write(b"".join(names))
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class _Names:
+    """Sequence of the names in the snapshot, decoded on access."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, node):
+        return self.encoded(node).decode()
+
+    def __iter__(self):
+        return (self[node] for node in range(len(self)))
+
+    def encoded(self, node):
+        return bytes(self._blob[self._offsets[node]:self._offsets[node + 1]])
+
+
+class _NameIndex:
+    """Name to node id, by binary search over the sorted order stored in the snapshot."""
+
+    def __init__(self, names, order):
+        self._names = names
+        self._order = order
+
+    def get(self, repo, default=None):
+        key = repo.encode()
+        low, high = 0, len(self._order)
+        while low < high:
+            middle = (low + high) // 2
+            name = self._names.encoded(self._order[middle])
+            if name < key:
+                low = middle + 1
+            elif name > key:
+                high = middle
+            else:
+                return self._order[middle]
+        return default
+
+    def __contains__(self, repo):
+        return self.get(repo) is not None
+
+
+class _Adjacency:
+    """CSR adjacency: the neighbours of ``node`` are ``targets[offsets[node]:offsets[node + 1]]``."""
+
+    def __init__(self, offsets, targets):
+        self._offsets = offsets
+        self._targets = targets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, node):
+        # a copy, so that no caller holds on to the mapping and keeps it from being closed
+        return self._targets[self._offsets[node]:self._offsets[node + 1]].tolist()
+
+
+class CompactGraph(DependencyGraph):
+    """Read-only :class:`~gitflow.dependencies.DependencyGraph` over a memory-mapped snapshot.
+
+    Opening one reads nothing but the header; pages of the file are loaded as queries
+    touch them. Every query of the dict-based graph works unchanged, including in
+    :class:`~gitflow.dependencies.ClosureCache` and the scheduling helpers.
+
+    :param path: Snapshot written by :func:`write_snapshot`.
+    :raises SnapshotError: If the file is not a snapshot of this version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                raise SnapshotError("%s is not a dependency snapshot" % path)
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, nodes, edges, self.digest = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            self._mmap.close()
+            raise SnapshotError("%s is not a version %d dependency snapshot" % (path, _VERSION))
+        lengths = (nodes + 1, nodes, nodes + 1, edges, nodes + 1, edges)
+        position = _HEADER.size
+        if position + 4 * sum(lengths) > size:
+            self._mmap.close()
+            raise SnapshotError("%s is truncated" % path)
+        self._view = memoryview(self._mmap)
+        self._arrays = []
+        for length in lengths:
+            self._arrays.append(self._view[position:position + 4 * length].cast("I"))
+            position += 4 * length
+        self._arrays.append(self._view[position:])
+        if position + self._arrays[0][-1] != size:
+            self.close()
+            raise SnapshotError("%s is truncated" % path)
+        name_offsets, name_order, forward_offsets, forward, reverse_offsets, reverse, blob = self._arrays
+        self._names = _Names(name_offsets, blob)
+        self._ids = _NameIndex(self._names, name_order)
+        self._forward = _Adjacency(forward_offsets, forward)
+        self._reverse = _Adjacency(reverse_offsets, reverse)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add_edge(self, repo, dependency):
+        raise TypeError("A snapshot is read-only; change the manifest instead")
+
+    def remove_edge(self, repo, dependency):
+        raise TypeError("A snapshot is read-only; change the manifest instead")
+
+    def close(self):
+        """Unmap the snapshot; the graph cannot be queried afterwards. Closing again does nothing."""
+        self._names = self._ids = self._forward = self._reverse = None
+        # views of the mapping go first: the casts, then the view they were cast from
+        for view in getattr(self, "_arrays", ()):
+            view.release()
+        self._arrays = []
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        self._mmap.close()
+
+
+def load_graph(manifest, snapshot=None):
+    """:class:`CompactGraph` of ``manifest``, building its snapshot first if it is missing or stale.
+
+    :param manifest: JSON or YAML file mapping each repository to its dependencies.
+    :param snapshot: Where to keep the snapshot; defaults to ``<manifest>.graph``.
+    """
+    with open(manifest, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha256(content).digest()
+    snapshot = snapshot or manifest + ".graph"
+    try:
+        graph = CompactGraph(snapshot)
+    except (FileNotFoundError, SnapshotError):
+        pass
+    else:
+        if graph.digest == digest:
+            return graph
+        graph.close()
+    write_snapshot(parse_manifest(manifest, content), snapshot, digest)
+    return CompactGraph(snapshot)
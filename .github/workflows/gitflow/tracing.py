@@ -0,0 +1,163 @@
+"""Timing spans for git invocations, HTTP requests and the operations around them.
+
+Tracing is off until :func:`enable` is called, and while it is off :func:`span` hands
+out a shared do-nothing span, so instrumented code costs one global lookup per call.
+When on, every finished span is appended to a JSON-lines file (if one was given)
+and folded into per-name totals for :meth:`Tracer.summary`; spans themselves are not
+kept, so a long-running worker does not grow::
+
+    tracer = tracing.enable("trace.jsonl")
+    with tracing.span("finish_release_branch", release="1.0"):
+        ...  # git and HTTP spans started in here get this span as their parent
+    print(tracer.summary())
+
+Nesting follows :mod:`contextvars`, so spans started on worker threads need the
+submitting context copied over (see ``RepositoryDispatcher.trigger_many``).
+"""
+import contextvars
+import functools
+import itertools
+import json
+import threading
+import time
+
+_tracer = None
+_current = contextvars.ContextVar("gitflow_span", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed step; attributes added with :meth:`set` end up in its record."""
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.id = next(tracer._ids)
+        self.parent = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.parent = parent.id if parent is not None else None
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self._started
+        _current.reset(self._token)
+        record = {"id": self.id, "parent": self.parent, "name": self.name, "start": self.start,
+                  "duration": duration, "thread": threading.current_thread().name}
+        record.update(self.attributes)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        self.tracer._finish(record)
+        return False
+
+
+class Tracer:
+    """Collects finished spans into per-name totals and optionally a JSON-lines file.
+
+    :param path: File to append one JSON object per finished span to; None for none.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.totals = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = open(path, "a") if path else None
+
+    def _finish(self, record):
+        key = record["name"]
+        if "command" in record:
+            # one row per git subcommand or HTTP method rather than per full command line
+            key = "%s %s" % (key, record["command"].split(" ", 1)[0])
+        line = json.dumps(record) + "\n" if self._file else None
+        with self._lock:
+            total = self.totals.get(key)
+            if total is None:
+                total = self.totals[key] = [0, 0.0, 0.0, 0]
+            total[0] += 1
+            total[1] += record["duration"]
+            total[2] = max(total[2], record["duration"])
+            total[3] += "error" in record or bool(record.get("returncode"))
+            if self._file:
+                self._file.write(line)
+
+    def summary(self):
+        """Table of span count, total, mean and max duration and failures per name, slowest first."""
+        with self._lock:
+            rows = sorted(self.totals.items(), key=lambda item: -item[1][1])
+        lines = ["%-32s %7s %10s %10s %10s %7s" % ("span", "count", "total s", "mean ms", "max ms", "failed")]
+        for key, (count, total, longest, failed) in rows:
+            lines.append("%-32s %7d %10.3f %10.2f %10.2f %7d" % (key[:32], count, total, total / count * 1000,
+                                                                  longest * 1000, failed))
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def enable(path=None):
+    """Start tracing into a new :class:`Tracer` (closing any previous one) and return it."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def disable():
+    """Stop tracing; returns the tracer that was active, if any, with its file closed."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **attributes):
+    """Context manager timing the block as a span called ``name``, nested under the current one."""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, attributes)
+
+
+def traced(function):
+    """Decorator running each call of ``function`` in a span named after it."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return function(*args, **kwargs)
+        with Span(tracer, name, {}):
+            return function(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,233 @@
+"""Cheap checks that a ``repository_dispatch`` event can succeed, before anything is set up for it.
+
+Two stages, both meant to run in milliseconds:
+
+* the payload against the inputs each action needs (:func:`validate_payload`), and
+* the branches and tags the action relies on or would create, all looked up with a
+  single ``git ls-remote`` (or ``git for-each-ref`` for a local repository)
+  (:func:`check_refs`).
+
+``main.py`` runs both before configuring git. A sender can run them before
+``trigger_repository_dispatch`` so that an impossible event never starts a run::
+
+    validate_dispatch("org/app", "finish_release", {"inputs": {"release_name": "1.4.0"}}, token)
+"""
+import base64
+import os
+import re
+
+from . import logger
+from .run import GitSession
+
+# the gitflow config main.py sets up
+DEFAULT_BRANCHES = {
+    "master": "main",
+    "develop": "develop",
+    "feature": "feature/",
+    "release": "release/",
+    "hotfix": "hotfix/",
+    "versiontag": "v",
+}
+
+# action -> (input holding the target name, whether it may list several, kind)
+ACTIONS = {
+    "start_feature": ("feature_name", True, "feature"),
+    "finish_feature": ("feature_name", True, "feature"),
+    "start_release": ("release_name", False, "release"),
+    "finish_release": ("release_name", False, "release"),
+    "unstable_release": (None, False, "release"),
+    "start_hotfix": ("hotfix_name", False, "hotfix"),
+    "finish_hotfix": ("hotfix_name", False, "hotfix"),
+}
+BUMPS = ("major", "minor", "patch")
+
+# what git check-ref-format refuses in a branch name component, minus the rare corner cases
+_BAD_NAME = re.compile(r"\.\.|@\{|[\x00-\x20\x7f~^:?*\[\\]|^[./-]|[./]$|\.lock$|//|/\.")
+
+
+class PayloadError(Exception):
+    """Raised if an event cannot succeed; ``problems`` lists every reason found."""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        self.message = "Invalid event: %s" % "; ".join(problem.rstrip(".") for problem in self.problems)
+        super().__init__(self.message)
+
+
+def parse_names(value):
+    """Target names from an input: a list of strings, or a string separated by commas.
+
+    Names are stripped of surrounding whitespace and empty ones are dropped, so
+    ``"a, b,"`` and ``["a", " b", ""]`` both name ``a`` and ``b``.
+    """
+    names = value if isinstance(value, list) else value.split(",")
+    return [name.strip() for name in names if name.strip()]
+
+
+def validate_payload(action, client_payload):
+    """Problems with the shape of an event: unknown action, missing or malformed inputs.
+
+    :param action: The event type, e.g. ``"finish_feature"``.
+    :param client_payload: The event's ``client_payload``; its ``inputs`` are checked.
+    :return: List of problem descriptions; empty if the payload is fine.
+    """
+    if action not in ACTIONS:
+        return ["Unknown action %r. Known actions: %s" % (action, ", ".join(sorted(ACTIONS)))]
+    if not isinstance(client_payload, dict):
+        return ["client_payload must be an object"]
+    inputs = client_payload.get("inputs", {})
+    if not isinstance(inputs, dict):
+        return ["client_payload.inputs must be an object"]
+    problems = []
+    key, several, _ = ACTIONS[action]
+    if key is not None:
+        value = inputs.get(key)
+        if isinstance(value, list) and not all(isinstance(name, str) for name in value):
+            problems.append("%s must be a list of strings" % key)
+        elif not isinstance(value, (str, list)) or not parse_names(value):
+            problems.append("%s is required" % key)
+        else:
+            names = parse_names(value)
+            if len(names) > 1 and not several:
+                problems.append("%s takes a single name, not %d" % (key, len(names)))
+            if len(set(names)) != len(names):
+                problems.append("%s lists a name more than once" % key)
+            for name in names:
+                if _BAD_NAME.search(name):
+                    problems.append("%s %r is not a valid branch name" % (key, name))
+    if action == "unstable_release" and inputs.get("bump") not in (None, "") + BUMPS:
+        problems.append("bump must be one of %s, not %r" % (", ".join(BUMPS), inputs.get("bump")))
+    for key in ("upstream_scope", "downstream_scope"):
+        value = inputs.get(key)
+        if value not in (None, "") and not re.fullmatch(r"-?\d+", str(value)):
+            problems.append("%s must be an integer, not %r" % (key, value))
+    return problems
+
+
+def _expectations(action, inputs, branches):
+    """``(must exist, prefixes that must be empty, targets)`` as full ref names.
+
+    Each entry of ``must exist`` is a tuple of refs of which one is enough. ``targets``
+    maps each target name to the ``(must exist, must not exist)`` refs of that target.
+    """
+    key, _, kind = ACTIONS[action]
+    master = "refs/heads/%s" % branches["master"]
+    # git flow init creates a missing develop from master
+    develop = ("refs/heads/%s" % branches["develop"], master)
+    present = [(master,) if action.endswith("_hotfix") else develop]
+    if action in ("finish_release", "finish_hotfix"):
+        present = [(master,), develop]
+    empty = []
+    if action in ("start_release", "unstable_release", "start_hotfix"):
+        # git flow allows one release and one hotfix at a time
+        empty.append("refs/heads/%s" % branches[kind])
+    targets = {}
+    for name in parse_names(inputs[key]) if key else []:
+        branch = "refs/heads/%s%s" % (branches[kind], name)
+        targets[name] = ([], [branch]) if action.startswith("start_") else ([branch], [])
+        if kind != "feature":
+            targets[name][1].append("refs/tags/%s%s" % (branches["versiontag"], name))
+    return present, empty, targets
+
+
+def _list_refs(patterns, session, remote):
+    if remote is None:
+        output = session.run(["for-each-ref", "--format=%(refname)"] + patterns).stdout.decode()
+        return set(output.split())
+    # ls-remote matches patterns against the end of ref names, so the result is filtered exactly below
+    output = session.run(["ls-remote", "--heads", "--tags", remote] + patterns).stdout.decode()
+    return {line.partition("\t")[2] for line in output.splitlines() if not line.endswith("^{}")}
+
+
+def check_refs(action, inputs, session=None, remote="origin", branches=None):
+    """Problems with the branches and tags ``action`` needs, found with one git call.
+
+    The targets of a batch succeed or fail on their own (see :mod:`gitflow.batch`), so
+    targets that cannot succeed are only problems if none of the others can either;
+    otherwise they are logged as warnings and the rest go ahead.
+
+    :param inputs: The event's ``client_payload.inputs``; must have passed :func:`validate_payload`.
+    :param session: :class:`~gitflow.run.GitSession` to run git in; defaults to one in the current directory.
+    :param remote: Remote name or URL to ask with ``git ls-remote``; None to look at the local refs instead.
+    :param branches: Branch names and prefixes, as in :data:`DEFAULT_BRANCHES` (the default).
+    :return: List of problem descriptions; empty if the action can go ahead.
+    """
+    branches = dict(DEFAULT_BRANCHES, **(branches or {}))
+    session = session or GitSession()
+    present, empty, targets = _expectations(action, inputs, branches)
+    patterns = sorted({ref for alternatives in present for ref in alternatives})
+    for target_present, target_absent in targets.values():
+        patterns += target_present + target_absent
+    refs = _list_refs(patterns + [prefix + "*" for prefix in empty], session, remote)
+    where = "locally" if remote is None else "on %s" % (remote if "://" not in remote else "the remote")
+    problems = []
+    for alternatives in present:
+        if not refs.intersection(alternatives):
+            problems.append("Branch '%s' does not exist %s." % (alternatives[0][len("refs/heads/"):], where))
+    failing = {}
+    for name, (target_present, target_absent) in targets.items():
+        target_problems = ["Branch '%s' does not exist %s." % (ref[len("refs/heads/"):], where)
+                           for ref in target_present if ref not in refs]
+        for ref in target_absent:
+            if ref in refs:
+                kind, ref_name = ("Tag", ref[len("refs/tags/"):]) if ref.startswith("refs/tags/") else \
+                    ("Branch", ref[len("refs/heads/"):])
+                target_problems.append("%s '%s' already exists %s." % (kind, ref_name, where))
+        if target_problems:
+            failing[name] = target_problems
+    if failing and len(failing) < len(targets):
+        for name, target_problems in failing.items():
+            logger.warning("%s %s will fail, the other targets can go ahead: %s", action, name,
+                           " ".join(target_problems))
+    else:
+        problems += [problem for target_problems in failing.values() for problem in target_problems]
+    for prefix in empty:
+        existing = sorted(ref for ref in refs if ref.startswith(prefix))
+        if existing:
+            problems.append("There is an existing %s branch '%s'. Finish that one first."
+                            % (prefix[len("refs/heads/"):].rstrip("/"), existing[0][len("refs/heads/"):]))
+    return problems
+
+
+def validate_event(payload, session=None, remote="origin", branches=None):
+    """Check a full ``repository_dispatch`` event (as in ``GITHUB_EVENT_PATH``) and its refs.
+
+    :raises PayloadError: If the event cannot succeed.
+    """
+    if not isinstance(payload, dict):
+        raise PayloadError(["The event must be a JSON object"])
+    action = payload.get("action")
+    client_payload = payload.get("client_payload", {})
+    problems = validate_payload(action, client_payload)
+    if not problems:
+        problems = check_refs(action, client_payload.get("inputs", {}), session, remote, branches)
+    if problems:
+        raise PayloadError(problems)
+
+
+def github_session(access_token, cwd=None):
+    """:class:`~gitflow.run.GitSession` that authenticates to GitHub over HTTPS with ``access_token``.
+
+    The token goes to git through the environment, so it shows up neither in process
+    listings nor in any config file.
+    """
+    env = dict(os.environ)
+    count = int(env.get("GIT_CONFIG_COUNT", 0))
+    credentials = base64.b64encode(("x-access-token:%s" % access_token).encode()).decode()
+    env.update({
+        "GIT_CONFIG_COUNT": str(count + 1),
+        "GIT_CONFIG_KEY_%d" % count: "http.https://github.com/.extraheader",
+        "GIT_CONFIG_VALUE_%d" % count: "AUTHORIZATION: basic %s" % credentials,
+        "GIT_TERMINAL_PROMPT": "0",
+    })
+    return GitSession(cwd or os.getcwd(), env)
+
+
+def validate_dispatch(repository, event_type, payload, access_token, branches=None):
+    """Check an event before sending it to ``repository`` (``OWNER/REPO``) on GitHub.
+
+    :param payload: The ``client_payload`` that would be sent.
+    :raises PayloadError: If the event cannot succeed.
+    """
+    validate_event({"action": event_type, "client_payload": payload or {}},
+                   github_session(access_token), "https://github.com/%s.git" % repository, branches)
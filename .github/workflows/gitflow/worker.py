@@ -0,0 +1,283 @@
+"""Long-running consumer of dispatch events from a local queue.
+
+One process handles event after event, so imports, git config and the shared
+:class:`~gitflow.run.GitSession` processes stay warm instead of being rebuilt by a
+fresh interpreter per event. Events are JSON documents in the format GitHub writes
+to ``GITHUB_EVENT_PATH``, taken from either
+
+* a directory (:class:`DirectoryQueue`): producers write ``<name>.json`` elsewhere
+  on the same file system and rename it in, so the worker never sees half a file, or
+* a Unix socket (:class:`SocketQueue`): producers connect, send one document and
+  close their side.
+"""
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque, namedtuple
+
+from . import logger, tracing
+
+
+class Event(namedtuple("Event", ["id", "payload", "received"])):
+    """One queued event; ``received`` is the ``time.time()`` it entered the queue."""
+
+
+class DirectoryQueue:
+    """Event files in ``directory``, oldest first.
+
+    A worker claims a file by renaming it into ``.processing/``, so several workers can
+    share the directory. Handled events are deleted; failed ones are kept in ``failed/``.
+    """
+
+    def __init__(self, directory, poll_interval=0.05):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._processing = os.path.join(directory, ".processing")
+        self._failed = os.path.join(directory, "failed")
+        os.makedirs(self._processing, exist_ok=True)
+        os.makedirs(self._failed, exist_ok=True)
+
+    def _pending(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(".json") and entry.is_file():
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.name))
+                    except FileNotFoundError:
+                        pass
+        return sorted(entries)
+
+    def depth(self):
+        """Number of events waiting."""
+        return len(self._pending())
+
+    def get(self, timeout=None):
+        """Next event, or None if none arrived within ``timeout`` seconds."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            for received, name in self._pending():
+                claimed = os.path.join(self._processing, name)
+                try:
+                    os.rename(os.path.join(self.directory, name), claimed)
+                except FileNotFoundError:
+                    # another worker was faster
+                    continue
+                try:
+                    with open(claimed) as f:
+                        payload = json.load(f)
+                except ValueError as error:
+                    logger.error("Discarding unreadable event %s: %s", name, error)
+                    os.replace(claimed, os.path.join(self._failed, name))
+                    continue
+                return Event(name, payload, received)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def done(self, event, error=None):
+        claimed = os.path.join(self._processing, event.id)
+        if error is None:
+            os.unlink(claimed)
+        else:
+            os.replace(claimed, os.path.join(self._failed, event.id))
+
+    def requeue(self):
+        """Put the failed events back in the queue, e.g. once what made them fail is fixed.
+
+        :return: Number of events requeued.
+        """
+        count = 0
+        for name in sorted(os.listdir(self._failed)):
+            if name.endswith(".json"):
+                os.replace(os.path.join(self._failed, name), os.path.join(self.directory, name))
+                count += 1
+        return count
+
+    def close(self):
+        pass
+
+
+class SocketQueue:
+    """Events sent to a Unix socket at ``path``, one JSON document per connection.
+
+    A connection is answered with ``queued`` once the document has been read and
+    parsed, or with ``error: <reason>`` otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._events = queue.Queue()
+        self._count = 0
+        if os.path.exists(path):
+            os.unlink(path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(path)
+        self._socket.listen(64)
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                # closed
+                return
+            with connection:
+                try:
+                    self._receive(connection)
+                except OSError:
+                    # the client went away; keep serving the others
+                    pass
+
+    def _receive(self, connection):
+        received = time.time()
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        try:
+            payload = json.loads(b"".join(chunks))
+        except ValueError as error:
+            connection.sendall(b"error: %s\n" % str(error).encode())
+            return
+        self._count += 1
+        self._events.put(Event("socket-%d" % self._count, payload, received))
+        connection.sendall(b"queued\n")
+
+    def depth(self):
+        return self._events.qsize()
+
+    def get(self, timeout=None):
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def done(self, event, error=None):
+        pass
+
+    def close(self):
+        self._socket.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def send_event(path, payload):
+    """Send ``payload`` to the :class:`SocketQueue` listening at ``path``; returns its answer."""
+    document = json.dumps(payload).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(document)
+        client.shutdown(socket.SHUT_WR)
+        return client.makefile().readline().strip()
+
+
+class WorkerMetrics:
+    """Counters and recent timings of an :class:`EventWorker`.
+
+    Latency is from the event entering the queue to its handler returning, so it
+    includes the wait in the queue; ``service`` is the handler alone.
+    """
+
+    def __init__(self, samples=1000):
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.depth = 0
+        self._latency = deque(maxlen=samples)
+        self._service = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(self, event, started, finished, ok):
+        with self._lock:
+            self.processed += 1
+            if not ok:
+                self.failed += 1
+            self._latency.append(finished - event.received)
+            self._service.append(finished - started)
+
+    def observe_depth(self, depth):
+        with self._lock:
+            self.depth = depth
+            self.max_depth = max(self.max_depth, depth)
+
+    @staticmethod
+    def _percentiles(samples):
+        if not samples:
+            return {"p50": None, "p95": None, "max": None}
+        ordered = sorted(samples)
+        return {"p50": ordered[len(ordered) // 2], "p95": ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)],
+                "max": ordered[-1]}
+
+    def snapshot(self):
+        """Current counters plus latency and service-time percentiles (seconds) of recent events."""
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "failed": self.failed,
+                "queue_depth": self.depth,
+                "max_queue_depth": self.max_depth,
+                "latency": self._percentiles(self._latency),
+                "service": self._percentiles(self._service),
+            }
+
+
+class EventWorker:
+    """Feeds events from ``queue`` to ``handler`` one at a time until stopped.
+
+    A handler exception marks the event as failed and is logged; the worker carries on.
+
+    :param queue: :class:`DirectoryQueue`, :class:`SocketQueue` or anything with the same
+        ``get``/``done``/``depth`` methods.
+    :param handler: Called with each event's payload.
+    :param report_interval: Seconds between metric reports in the log; None for none.
+    """
+
+    def __init__(self, queue, handler, report_interval=60.0):
+        self.queue = queue
+        self.handler = handler
+        self.report_interval = report_interval
+        self.metrics = WorkerMetrics()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Make :meth:`run` return after the event in progress."""
+        self._stopping.set()
+
+    def report(self):
+        logger.info("Worker metrics: %s", json.dumps(self.metrics.snapshot()))
+
+    def run(self, drain=False):
+        """Handle events until :meth:`stop` is called, or until the queue is empty if ``drain``."""
+        last_report = time.monotonic()
+        while not self._stopping.is_set():
+            self.metrics.observe_depth(self.queue.depth())
+            event = self.queue.get(timeout=0 if drain else 0.5)
+            if event is None:
+                if drain:
+                    break
+            else:
+                self._handle(event)
+            if self.report_interval is not None and time.monotonic() - last_report >= self.report_interval:
+                self.report()
+                last_report = time.monotonic()
+        self.report()
+
+    def _handle(self, event):
+        started = time.time()
+        error = None
+        try:
+            with tracing.span("event", event=event.id, queued=started - event.received):
+                self.handler(event.payload)
+        except Exception as exception:
+            error = getattr(exception, "message", None) or str(exception) or type(exception).__name__
+            logger.exception("Event %s failed: %s", event.id, error)
+        self.queue.done(event, error)
+        self.metrics.record(event, started, time.time(), error is None)
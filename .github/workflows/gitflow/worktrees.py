@@ -0,0 +1,180 @@
+"""Concurrent gitflow operations on one clone.
+
+A :class:`WorktreePool` hands out ``git worktree`` checkouts that share the clone's
+object store and refs, so a long-running worker can run several operations at once
+without a full clone for each. Operations that write the same branch are serialized
+by :class:`BranchLocks`::
+
+    with WorktreePool("/path/to/clone", size=4) as pool:
+        engine = GitFlowEngine(pool.repository)
+        with pool.checkout(*engine.branches("finish_feature", "login")) as session:
+            GitFlowEngine(session).finish_feature("login")
+"""
+import contextlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from . import logger
+from .run import GitSession
+
+
+class BranchLocks:
+    """One lock per branch name, created on demand and dropped when nobody needs it.
+
+    :meth:`hold` takes all the locks of a call in sorted order, so callers asking for
+    overlapping sets of branches cannot deadlock each other.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    def __contains__(self, branch):
+        """Whether ``branch`` is held or waited for."""
+        with self._guard:
+            return branch in self._locks
+
+    @contextlib.contextmanager
+    def hold(self, *branches):
+        """Hold the locks of ``branches`` for the duration of the ``with`` block."""
+        names = sorted(set(branches))
+        with self._guard:
+            entries = []
+            for name in names:
+                entry = self._locks.setdefault(name, [threading.Lock(), 0])
+                entry[1] += 1
+                entries.append(entry)
+        acquired = []
+        try:
+            for lock, _ in entries:
+                lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+            with self._guard:
+                for name in names:
+                    entry = self._locks[name]
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._locks[name]
+
+
+class WorktreePool:
+    """Up to ``size`` worktrees of the repository at ``repository``, reused between operations.
+
+    Worktrees are created lazily with a detached HEAD. When an operation is done, its
+    worktree is recycled (forced back to a detached, clean checkout) instead of being
+    removed, so the next operation only pays for the files that differ. A worktree
+    that cannot be recycled is removed and replaced on demand.
+
+    :param repository: Path of the clone; defaults to the current directory.
+    :param size: Maximum number of worktrees; :meth:`checkout` waits when all are in use.
+    :param directory: Where to put the worktrees; defaults to a new temporary directory.
+    :param env: Environment for git; defaults to a copy of ``os.environ``.
+    """
+
+    def __init__(self, repository=None, size=4, directory=None, env=None):
+        self.repository = GitSession(repository, env)
+        self.size = size
+        self._owns_directory = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix="gitflow-worktrees-")
+        self.locks = BranchLocks()
+        self.created = 0
+        self.recycled = 0
+        self._idle = []
+        self._count = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextlib.contextmanager
+    def checkout(self, *branches):
+        """A :class:`~gitflow.run.GitSession` on a free worktree, holding the locks of ``branches``.
+
+        The locks are taken before a worktree is, so operations waiting for a branch do
+        not keep worktrees from others.
+        """
+        with self.locks.hold(*branches):
+            session = self._take()
+            try:
+                yield session
+            finally:
+                self._give_back(session)
+
+    def _take(self):
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Worktree pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._count < self.size:
+                    self._count += 1
+                    break
+                self._condition.wait()
+        try:
+            return self._create()
+        except BaseException:
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            raise
+
+    def _create(self):
+        path = tempfile.mkdtemp(prefix="worktree-", dir=self.directory)
+        os.rmdir(path)
+        self.repository.run(["worktree", "add", "-q", "--detach", path])
+        with self._condition:
+            self.created += 1
+        return GitSession(path, self.repository.env)
+
+    def _give_back(self, session):
+        try:
+            # -f discards whatever the operation left in the index and working tree,
+            # --detach releases a branch it may have checked out
+            session.run(["checkout", "-q", "-f", "--detach"])
+            session.run(["clean", "-q", "-ffdx"])
+        except subprocess.CalledProcessError as error:
+            logger.warning("Removing worktree %s that could not be reset: %s", session.cwd,
+                           error.stderr.decode().strip())
+            self._remove(session)
+            with self._condition:
+                self._count -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            if not self._closed:
+                self.recycled += 1
+                self._idle.append(session)
+                self._condition.notify()
+                return
+            self._count -= 1
+        self._remove(session)
+
+    def _remove(self, session):
+        session.close()
+        self.repository.run(["worktree", "remove", "--force", session.cwd], check=False)
+
+    def close(self):
+        """Remove the idle worktrees and stop handing out new ones."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+            self._condition.notify_all()
+        for session in idle:
+            self._remove(session)
+        self.repository.run(["worktree", "prune"], check=False)
+        self.repository.close()
+        if self._owns_directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -1,26 +1,26 @@
 import json
 import logging
 import os
+import sys
 
-from gitflow.gitflow import (git_flow_init, start_feature_branch, finish_feature_branch, git_configure,
-                             start_release_branch,
-                             finish_release_branch)
+from gitflow import configure_logging, tracing
+from gitflow.router import ActionRouter
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# Get environment variables
-github_token = os.environ['GH_TOKEN']
-github_workspace = os.environ['GITHUB_WORKSPACE']
-github_repository = os.environ['GITHUB_REPOSITORY']
-github_event_path = os.environ['GITHUB_EVENT_PATH']
-github_event_name = os.environ['GITHUB_EVENT_NAME']
+# Handlers are imported when their action is first dispatched
+ROUTES = {
+    "start_feature": "gitflow.handlers:start_feature",
+    "finish_feature": "gitflow.handlers:finish_feature",
+    "start_release": "gitflow.handlers:start_release",
+    "finish_release": "gitflow.handlers:finish_release",
+    "unstable_release": "gitflow.handlers:unstable_release",
+    "start_hotfix": "gitflow.handlers:start_hotfix",
+    "finish_hotfix": "gitflow.handlers:finish_hotfix",
+}
 
-# print environment variables
-print(f"GITHUB_WORKSPACE: {github_workspace}")
-print(f"GITHUB_REPOSITORY: {github_repository}")
-print(f"GITHUB_EVENT_PATH: {github_event_path}")
-print(f"GITHUB_EVENT_NAME: {github_event_name}")
+router = ActionRouter(ROUTES)
 
 
 # TODO: Add enforcement of commit message format.
@@ -31,55 +31,118 @@ print(f"GITHUB_EVENT_NAME: {github_event_name}")
 
 # TODO: Add re-render actions.
 
+def configure_git():
+    from gitflow.gitflow import GITFLOW_PREFIXES, git_configure_many
+
+    config = {
+        'user.name': 'github-actions[bot]',
+        'user.email': 'github-actions@github.com',
+        'gitflow.branch.master': 'main',
+        'gitflow.branch.develop': 'develop',
+    }
+    # every prefix git flow looks for, or an initialized clone would never be recognized as one
+    for kind in GITFLOW_PREFIXES:
+        config[f'gitflow.prefix.{kind}'] = 'v' if kind == 'versiontag' else f'{kind}/'
+    git_configure_many(config)
+
+
+def handle_repository_dispatch(payload, github_workspace, setup=None):
+    from gitflow.validation import validate_event
+
+    # change chdir to github_workspace
+    os.chdir(github_workspace)
+    # Reject events that cannot succeed (one ls-remote) before paying for any setup
+    validate_event(payload)
+    if setup:
+        setup()
+    router.dispatch(payload)
+
+
 def main():
-    # Handle repository dispatch events
-    if github_event_name == "repository_dispatch":
-        # Read in payload
-        with open(github_event_path, 'r') as f:
-            payload = json.load(f)
-            # pretty print
-            print(json.dumps(payload, indent=4, sort_keys=True))
-
-        inputs = payload['client_payload']['inputs']
-
-        # Configure git
-        git_configure(key='user.name', value='github-actions[bot]')
-        git_configure(key='user.email', value='github-actions@github.com')
-        git_configure(key='gitflow.branch.master', value='main')
-        git_configure(key='gitflow.branch.develop', value='develop')
-        git_configure(key='gitflow.prefix.feature', value='feature/')
-        git_configure(key='gitflow.prefix.release', value='release/')
-        git_configure(key='gitflow.prefix.hotfix', value='hotfix/')
-        git_configure(key='gitflow.prefix.support', value='support/')
-        git_configure(key='gitflow.prefix.versiontag', value='v')
-
-        # change chdir to github_workspace
-        os.chdir(github_workspace)
-
-        # Handle start_feature event
-        if payload['action'] == "start_feature":
-            logger.info(f"Creating feature branch feature/{inputs['feature_name']} from develop")
-            git_flow_init()
-            start_feature_branch(inputs['feature_name'])
-
-        # Handle finish_feature event
-        elif payload['action'] == "finish_feature":
-            logger.info(f"Merging feature/{inputs['feature_name']} into develop, then deleting feature")
-            git_flow_init()
-            finish_feature_branch(inputs['feature_name'])
-
-        # Handle start_release event
-        elif payload['action'] == "start_release":
-            logger.info(f"Creating release branch release/{inputs['release_name']} from develop")
-            git_flow_init()
-            start_release_branch(inputs['release_name'])
-
-        # Handle finish_release event
-        elif payload['action'] == "finish_release":
-            logger.info(f"Merging release/{inputs['release_name']} into develop and main, then deleting release")
-            git_flow_init()
-            finish_release_branch(inputs['release_name'])
+    configure_logging()
+
+    # The token itself reaches git through the checkout; a run without one would only fail at the first push
+    if 'GH_TOKEN' not in os.environ:
+        sys.exit("GH_TOKEN is not set")
+
+    # Get environment variables
+    github_workspace = os.environ['GITHUB_WORKSPACE']
+    github_repository = os.environ['GITHUB_REPOSITORY']
+    github_event_path = os.environ['GITHUB_EVENT_PATH']
+    github_event_name = os.environ['GITHUB_EVENT_NAME']
+
+    # print environment variables
+    print(f"GITHUB_WORKSPACE: {github_workspace}")
+    print(f"GITHUB_REPOSITORY: {github_repository}")
+    print(f"GITHUB_EVENT_PATH: {github_event_path}")
+    print(f"GITHUB_EVENT_NAME: {github_event_name}")
+
+    # Spans of every git and HTTP call go to this JSON-lines file, with a summary at the end
+    trace_path = os.environ.get('GITFLOW_TRACE')
+    tracer = tracing.enable(trace_path) if trace_path else None
+    try:
+        # Handle repository dispatch events
+        if github_event_name == "repository_dispatch":
+            # Read in payload
+            with open(github_event_path, 'r') as f:
+                payload = json.load(f)
+                # pretty print
+                print(json.dumps(payload, indent=4, sort_keys=True))
+
+            # Configure git once the event is known to be valid
+            handle_repository_dispatch(payload, github_workspace, setup=configure_git)
+    finally:
+        if tracer:
+            tracing.disable()
+            print(tracer.summary())
+
+
+def serve(argv=None):
+    """Handle repository_dispatch payloads from a local queue until SIGTERM/SIGINT."""
+    import argparse
+    import signal
+
+    from gitflow.worker import DirectoryQueue, EventWorker, SocketQueue
+
+    parser = argparse.ArgumentParser(prog="main.py worker", description=serve.__doc__)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--queue-dir", help="directory that event JSON files are renamed into")
+    source.add_argument("--socket", help="Unix socket to accept event JSON documents on")
+    parser.add_argument("--workspace", default=os.environ.get('GITHUB_WORKSPACE'),
+                        help="repository to act on (default: $GITHUB_WORKSPACE)")
+    parser.add_argument("--report-interval", type=float, default=60.0, help="seconds between metric reports")
+    parser.add_argument("--drain", action="store_true", help="exit once the queue is empty")
+    parser.add_argument("--requeue-failed", action="store_true",
+                        help="put the events that failed before back in the queue first (--queue-dir only)")
+    parser.add_argument("--trace", help="JSON-lines file to write timing spans to; a summary is printed on exit")
+    args = parser.parse_args(argv)
+    if not args.workspace:
+        parser.error("--workspace is required when GITHUB_WORKSPACE is not set")
+    if args.requeue_failed and not args.queue_dir:
+        parser.error("--requeue-failed needs --queue-dir")
+    workspace = os.path.abspath(args.workspace)
+    configure_logging()
+
+    tracer = tracing.enable(args.trace) if args.trace else None
+    queue = DirectoryQueue(args.queue_dir) if args.queue_dir else SocketQueue(args.socket)
+    if args.requeue_failed:
+        logger.info("Requeued %d failed events", queue.requeue())
+    configure_git()
+    worker = EventWorker(queue, lambda payload: handle_repository_dispatch(payload, workspace),
+                         args.report_interval)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    try:
+        worker.run(drain=args.drain)
+    finally:
+        queue.close()
+        if tracer:
+            tracing.disable()
+            print(tracer.summary())
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["worker"]:
+        serve(sys.argv[2:])
+    else:
+        main()
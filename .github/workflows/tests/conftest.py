@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+# the package is imported from .github/workflows, like main.py does, and so are the benchmark fixtures
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import GITFLOW_CONFIG, gitflow_repository, isolated_env  # noqa: E402
+from gitflow.run import GitSession  # noqa: E402
+
+
+@pytest.fixture
+def env(tmp_path):
+    return isolated_env(str(tmp_path))
+
+
+@pytest.fixture
+def make_origin(tmp_path, env):
+    """Factory for bare remotes with main (and develop, unless ``develop=False``)."""
+
+    def make(name="origin", develop=True):
+        seed = gitflow_repository(str(tmp_path / ("%s-seed" % name)), env)
+        if not develop:
+            seed.run(["branch", "-D", "develop"])
+        path = str(tmp_path / ("%s.git" % name))
+        seed.run(["clone", "-q", "--bare", seed.cwd, path])
+        return GitSession(path, env)
+
+    return make
+
+
+@pytest.fixture
+def origin(make_origin):
+    return make_origin()
+
+
+@pytest.fixture
+def make_clone(tmp_path, env):
+    """Factory for clones of a remote, configured the way main.py configures git."""
+
+    def make(remote, name="work", checkout=False, configure=True):
+        # checkout: like actions/checkout, only the tip of the default branch and no tags
+        path = str(tmp_path / name)
+        args = ["clone", "-q"] + (["--depth", "1", "--no-tags"] if checkout else [])
+        GitSession(str(tmp_path), env).run(args + ["file://%s" % remote.cwd, path])
+        session = GitSession(path, env)
+        if configure:
+            for key, value in GITFLOW_CONFIG.items():
+                session.run(["config", key, value])
+        return session
+
+    return make
+
+
+@pytest.fixture
+def clone(origin, make_clone):
+    return make_clone(origin)
@@ -0,0 +1,80 @@
+import subprocess
+
+import pytest
+
+from benchmarks.fixtures import commit_files
+from gitflow.batch import run_batch
+from gitflow.engine import GitFlowEngine
+
+
+def _refs(session):
+    output = session.run(["for-each-ref", "--format=%(refname) %(objectname)"]).stdout.decode()
+    return dict(line.split() for line in output.splitlines())
+
+
+@pytest.fixture
+def engine(clone):
+    engine = GitFlowEngine(clone)
+    engine.init()
+    return engine
+
+
+def _start_features(engine, features):
+    """Start and push ``{name: files}`` features, each with one commit of ``files``."""
+    for name, files in features.items():
+        engine.start_feature(name)
+        commit_files(engine.session, "refs/heads/feature/%s" % name, files)
+    engine.session.run(["push", "-q", "origin"] + ["feature/%s" % name for name in features])
+
+
+def _decline_pushes(origin):
+    hook = origin.cwd + "/hooks/pre-receive"
+    with open(hook, "w") as f:
+        f.write("#!/bin/sh\necho declined >&2\nexit 1\n")
+    subprocess.run(["chmod", "+x", hook], check=True)
+
+
+def test_failed_targets_do_not_stop_the_others(engine, origin):
+    _start_features(engine, {"login": {"shared.txt": "login\n"}, "search": {"shared.txt": "search\n"},
+                             "billing": {"billing.txt": "billing\n"}})
+    results = run_batch("finish_feature", ["login", "search", "missing", "billing"], engine.session)
+    errors = {result.name: result.error for result in results}
+    assert [result.name for result in results] == ["login", "search", "missing", "billing"]
+    assert errors["login"] is None and errors["billing"] is None
+    assert "merge conflicts" in errors["search"]
+    assert "feature/missing" in errors["missing"]
+    remote = _refs(origin)
+    assert "refs/heads/feature/login" not in remote and "refs/heads/feature/billing" not in remote
+    assert remote["refs/heads/feature/search"] == _refs(engine.session)["refs/heads/feature/search"]
+    assert engine.session.rev_parse("refs/remotes/origin/feature/login") is None
+    assert origin.run(["show", "develop:billing.txt"]).stdout == b"billing\n"
+    assert origin.run(["show", "develop:shared.txt"]).stdout == b"login\n"
+
+
+def test_rejected_push_restores_every_local_ref(engine, origin):
+    _start_features(engine, {"login": {"login.txt": "login\n"}, "search": {"search.txt": "search\n"}})
+    before, remote_before = _refs(engine.session), _refs(origin)
+    _decline_pushes(origin)
+    results = run_batch("finish_feature", ["login", "search"], engine.session)
+    assert all(not result.ok for result in results)
+    assert _refs(engine.session) == before
+    assert _refs(origin) == remote_before
+
+
+def test_rejected_push_leaves_no_tracking_config(engine, origin):
+    _decline_pushes(origin)
+    before = _refs(engine.session)
+    results = run_batch("start_feature", ["login", "search"], engine.session)
+    assert all(not result.ok for result in results)
+    assert _refs(engine.session) == before
+    config = engine.session.run(["config", "--get-regexp", r"^branch\.feature/"], check=False).stdout
+    assert config == b""
+
+
+def test_started_branches_track_the_remote(engine, origin):
+    results = run_batch("start_feature", ["login", "search"], engine.session)
+    assert all(result.ok for result in results)
+    for name in ("login", "search"):
+        assert "refs/heads/feature/%s" % name in _refs(origin)
+        remote = engine.session.run(["config", "--get", "branch.feature/%s.remote" % name]).stdout
+        assert remote.decode().strip() == "origin"
@@ -0,0 +1,203 @@
+import time
+
+import pytest
+
+from benchmarks.stubserver import StubDispatchServer
+from gitflow import dispatch
+from gitflow.dispatch import (DispatchCoalescer, DispatchTriggerError, RateLimiter, RateLimitExceededError,
+                              RepositoryDispatcher, replace_payload, update_payload)
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=20)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.19
+
+
+def test_rate_limiter_block_for_holds_back_callers():
+    limiter = RateLimiter()
+    limiter.block_for(0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.19
+
+
+def test_exhausted_quota_blocks_until_reset_instead_of_failing():
+    with StubDispatchServer(quota=2, window=0.5) as server:
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=0) as dispatcher:
+            start = time.monotonic()
+            for index in range(4):
+                dispatcher.trigger("owner/repo-%d" % index, "start_feature")
+            elapsed = time.monotonic() - start
+    assert server.rejected == 0
+    assert len(server.requests) == 4
+    assert elapsed >= 0.3
+
+
+def test_403_rate_limit_is_retried_after_reset():
+    with StubDispatchServer(quota=1, window=0.3) as server:
+        # a fresh limiter per dispatcher, so the second one does not know the quota is used up
+        with RepositoryDispatcher("token", api_url=server.url) as first:
+            first.trigger("owner/repo", "start_feature")
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=3, backoff=0.01) as second:
+            second.trigger("owner/repo", "start_feature")
+    assert server.rejected == 1
+    assert len(server.requests) == 3
+
+
+def test_429_waits_for_retry_after():
+    with StubDispatchServer(statuses={"owner/repo": [429, 204]}, retry_after=1) as server:
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=3, backoff=0.01) as dispatcher:
+            start = time.monotonic()
+            dispatcher.trigger("owner/repo", "start_feature")
+            elapsed = time.monotonic() - start
+    assert len(server.requests) == 2
+    assert elapsed >= 0.95
+
+
+def test_retry_after_holds_back_other_requests_of_the_limiter():
+    limiter = RateLimiter()
+    with StubDispatchServer(statuses={"owner/slow": [429, 204]}, retry_after=1) as server:
+        with RepositoryDispatcher("token", api_url=server.url, rate_limiter=limiter, backoff=0.01) as dispatcher:
+            start = time.monotonic()
+            results = dispatcher.trigger_many([("owner/slow", "start_feature", None)])
+            dispatcher.trigger("owner/other", "start_feature")
+            elapsed = time.monotonic() - start
+    assert all(result.ok for result in results)
+    assert elapsed >= 0.95
+
+
+def test_rate_limit_exceeded_after_max_retries():
+    with StubDispatchServer(statuses={"owner/repo": 429}, retry_after=0) as server:
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=2, backoff=0.01) as dispatcher:
+            with pytest.raises(RateLimitExceededError):
+                dispatcher.trigger("owner/repo", "start_feature")
+    assert len(server.requests) == 3
+
+
+def test_plain_403_is_not_retried():
+    with StubDispatchServer(statuses={"owner/repo": 403}) as server:
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=3, backoff=0.01) as dispatcher:
+            with pytest.raises(DispatchTriggerError) as error:
+                dispatcher.trigger("owner/repo", "start_feature")
+    assert not isinstance(error.value, RateLimitExceededError)
+    assert len(server.requests) == 1
+
+
+def test_5xx_is_retried():
+    with StubDispatchServer(statuses={"owner/repo": [502, 503, 204]}) as server:
+        with RepositoryDispatcher("token", api_url=server.url, max_retries=3, backoff=0.01) as dispatcher:
+            dispatcher.trigger("owner/repo", "start_feature")
+    assert len(server.requests) == 3
+
+
+def test_dispatcher_reuses_connections():
+    with StubDispatchServer() as server:
+        with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+            for index in range(5):
+                dispatcher.trigger("owner/repo-%d" % index, "start_feature")
+    assert len(server.requests) == 5
+    assert server.connections == 1
+
+
+def test_dispatcher_without_keep_alive_reconnects():
+    with StubDispatchServer() as server:
+        with RepositoryDispatcher("token", api_url=server.url, keep_alive=False) as dispatcher:
+            for index in range(3):
+                dispatcher.trigger("owner/repo-%d" % index, "start_feature")
+    assert server.connections == 3
+
+
+def test_shared_dispatcher_is_reused(monkeypatch):
+    monkeypatch.setattr(dispatch, "_dispatchers", {})
+    first = dispatch.get_dispatcher("token")
+    assert dispatch.get_dispatcher("token") is first
+    assert dispatch.get_dispatcher("other") is not first
+    for dispatcher in dispatch._dispatchers.values():
+        dispatcher.close()
+
+
+def test_trigger_many_reports_partial_failure():
+    events = [("owner/repo-%d" % index, "start_feature", {"index": index}) for index in range(6)]
+    events.insert(3, ("owner/gone", "start_feature", None))
+    with StubDispatchServer(statuses={"owner/gone": 404}, latency=0.05) as server:
+        with RepositoryDispatcher("token", api_url=server.url, pool_size=4) as dispatcher:
+            results = dispatcher.trigger_many(events)
+    assert [result.repository for result in results] == [repository for repository, _, _ in events]
+    failed = [result for result in results if not result.ok]
+    assert [result.repository for result in failed] == ["owner/gone"]
+    assert isinstance(failed[0].error, dispatch.RepositoryNotFoundError)
+    assert len(server.requests) == len(events)
+    assert server.connections <= 4
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_coalescer_merges_events_within_the_window():
+    with StubDispatchServer() as server:
+        with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+            coalescer = DispatchCoalescer(dispatcher, window=0.3)
+            coalescer.submit("owner/app", "start_feature", {"a": 1})
+            coalescer.submit("owner/app", "start_feature", {"b": 2})
+            coalescer.submit("owner/app", "finish_feature", {"c": 3})
+            coalescer.submit("owner/lib", "start_feature", {"d": 4})
+            assert server.requests == []
+            _wait_for(lambda: len(coalescer.results) == 3)
+            # a submit after the window closed opens a new one
+            coalescer.submit("owner/app", "start_feature", {"e": 5})
+            coalescer.close()
+    assert all(result.ok for result in coalescer.results)
+    sent = sorted(((repository, body["event_type"], body["client_payload"]) for repository, body in server.requests),
+                  key=str)
+    assert sent == [("owner/app", "finish_feature", {"c": 3}), ("owner/app", "start_feature", {"a": 1, "b": 2}),
+                    ("owner/app", "start_feature", {"e": 5}), ("owner/lib", "start_feature", {"d": 4})]
+    assert coalescer.stats() == {"submitted": 5, "coalesced": 1, "dispatched": 4, "pending": 0}
+
+
+@pytest.mark.parametrize("merge, expected", [
+    (update_payload, {"name": "b", "bump": "patch", "scope": 1}),
+    (replace_payload, {"name": "b", "scope": 1}),
+    (lambda pending, incoming: pending, {"name": "a", "bump": "patch"}),
+])
+def test_coalescer_merge_policies(merge, expected):
+    with StubDispatchServer() as server:
+        with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+            with DispatchCoalescer(dispatcher, window=60, merge=merge) as coalescer:
+                coalescer.submit("owner/app", "unstable_release", {"name": "a", "bump": "patch"})
+                coalescer.submit("owner/app", "unstable_release", {"name": "b", "scope": 1})
+    assert [body["client_payload"] for _, body in server.requests] == [expected]
+
+
+def test_coalescer_flush_reports_failures():
+    with StubDispatchServer(statuses={"owner/gone": 404}) as server:
+        with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+            coalescer = DispatchCoalescer(dispatcher, window=60)
+            coalescer.submit("owner/app", "start_feature")
+            coalescer.submit("owner/gone", "start_feature")
+            coalescer.submit("owner/gone", "start_feature")
+            assert coalescer.stats() == {"submitted": 3, "coalesced": 1, "dispatched": 0, "pending": 2}
+            results = {result.repository: result for result in coalescer.flush()}
+    assert results["owner/app"].ok
+    assert isinstance(results["owner/gone"].error, dispatch.RepositoryNotFoundError)
+    assert coalescer.stats()["pending"] == 0 and len(server.requests) == 2
+
+
+def test_trigger_repository_dispatch_can_coalesce(monkeypatch):
+    with StubDispatchServer() as server:
+        with RepositoryDispatcher("token", api_url=server.url) as dispatcher:
+            monkeypatch.setitem(dispatch._dispatchers, "token", dispatcher)
+            monkeypatch.setattr(dispatch, "_coalescers", {})
+            for name in ("login", "search"):
+                dispatch.trigger_repository_dispatch("owner/app", "start_feature", "token", {name: True},
+                                                     coalesce=True)
+            assert server.requests == []
+            coalescer = dispatch.get_coalescer("token")
+            coalescer.flush()
+    assert [body["client_payload"] for _, body in server.requests] == [{"login": True, "search": True}]
@@ -0,0 +1,240 @@
+import subprocess
+
+import pytest
+
+from benchmarks.fixtures import commit_files
+from gitflow.engine import GitFlowEngine
+from gitflow.gitflow import (BranchAlreadyExistsError, FeatureBranchMergeError, HotfixBranchMergeError,
+                             ReleaseBranchMergeError, TagAlreadyExistsError)
+
+
+def _ref(session, ref):
+    return session.rev_parse(ref)
+
+
+def _refs(session):
+    output = session.run(["for-each-ref", "--format=%(refname) %(objectname)"]).stdout.decode()
+    return dict(line.split() for line in output.splitlines())
+
+
+@pytest.fixture
+def engine(clone):
+    engine = GitFlowEngine(clone)
+    engine.init()
+    return engine
+
+
+def _publish_commits(engine, branch, count=1, files=None):
+    """Commit on ``branch`` locally and push it, like work done on the branch elsewhere."""
+    for index in range(count):
+        name = "%s-%d.txt" % (branch.replace("/", "-"), index)
+        commit_files(engine.session, "refs/heads/%s" % branch, files or {name: "work %d\n" % index})
+    engine.session.run(["push", "-q", "origin", branch])
+
+
+def _move_develop_elsewhere(origin, make_clone):
+    other = make_clone(origin, "other")
+    other.run(["branch", "develop", "origin/develop"])
+    commit_files(other, "refs/heads/develop", {"other.txt": "other\n"})
+    other.run(["push", "-q", "origin", "develop"])
+
+
+def test_init_creates_and_publishes_develop(make_origin, make_clone):
+    origin = make_origin(develop=False)
+    clone = make_clone(origin, configure=False)
+    engine = GitFlowEngine(clone)
+    assert engine.init()
+    assert clone.run(["config", "gitflow.branch.master"]).stdout.decode().strip() == "main"
+    assert _ref(origin, "refs/heads/develop") == _ref(origin, "refs/heads/main")
+    assert _ref(clone, "refs/heads/develop") == _ref(origin, "refs/heads/main")
+    assert not GitFlowEngine(clone).init()
+
+
+def test_start_feature_publishes_branch(engine, origin):
+    engine.start_feature("login")
+    assert _ref(origin, "refs/heads/feature/login") == _ref(origin, "refs/heads/develop")
+    config = engine.session.run(["config", "--get", "branch.feature/login.remote"]).stdout.decode().strip()
+    assert config == "origin"
+    with pytest.raises(BranchAlreadyExistsError):
+        engine.start_feature("login")
+
+
+def test_finish_feature_fast_forwards_a_single_commit(engine, origin):
+    engine.start_feature("login")
+    _publish_commits(engine, "feature/login")
+    tip = _ref(origin, "refs/heads/feature/login")
+    engine.finish_feature("login")
+    assert _ref(origin, "refs/heads/develop") == tip
+    assert _ref(origin, "refs/heads/feature/login") is None
+    assert _ref(engine.session, "refs/heads/feature/login") is None
+
+
+def test_finish_feature_merges_several_commits(engine, origin):
+    engine.start_feature("login")
+    _publish_commits(engine, "feature/login", count=2)
+    tip = _ref(origin, "refs/heads/feature/login")
+    engine.finish_feature("login")
+    develop = _ref(origin, "refs/heads/develop")
+    parents = origin.run(["rev-list", "--parents", "-n", "1", develop]).stdout.decode().split()[1:]
+    assert len(parents) == 2 and tip in parents
+    assert _ref(engine.session, "refs/heads/develop") == develop
+
+
+@pytest.mark.parametrize("kind, base", [("release", "develop"), ("hotfix", "main")])
+def test_finish_tagged_branch(engine, origin, kind, base):
+    getattr(engine, "start_" + kind)("1.0.0")
+    assert _ref(origin, "refs/heads/%s/1.0.0" % kind) == _ref(origin, "refs/heads/%s" % base)
+    _publish_commits(engine, "%s/1.0.0" % kind)
+    tip = _ref(origin, "refs/heads/%s/1.0.0" % kind)
+    getattr(engine, "finish_" + kind)("1.0.0")
+    main = _ref(origin, "refs/heads/main")
+    assert _ref(origin, "refs/tags/v1.0.0^{commit}") == main
+    assert origin.run(["cat-file", "-t", "v1.0.0"]).stdout.decode().strip() == "tag"
+    assert origin.run(["merge-base", "--is-ancestor", tip, main], check=False).returncode == 0
+    assert origin.run(["merge-base", "--is-ancestor", main, "develop"], check=False).returncode == 0
+    assert _ref(origin, "refs/heads/%s/1.0.0" % kind) is None
+    assert _refs(engine.session)["refs/tags/v1.0.0"] == _ref(origin, "refs/tags/v1.0.0")
+
+
+def test_release_notes_start_at_the_remote_tag(origin, make_clone):
+    setup = make_clone(origin, "setup")
+    commit_files(setup, "refs/heads/main", {"old.txt": "old\n"}, "feat: old work")
+    setup.run(["tag", "-a", "-m", "Release 1.0.0", "v1.0.0", "main"])
+    setup.run(["push", "-q", "origin", "main:main", "main:develop", "v1.0.0"])
+    commit_files(setup, "refs/heads/main", {"new.txt": "new\n"}, "fix: new work")
+    setup.run(["push", "-q", "origin", "main:develop"])
+    # a checkout like CI's: no tags, only the tip
+    engine = GitFlowEngine(make_clone(origin, checkout=True))
+    engine.init()
+    engine.start_release("1.1.0")
+    engine.finish_release("1.1.0")
+    message = origin.run(["tag", "-l", "--format=%(contents)", "v1.1.0"]).stdout.decode()
+    assert "Bug fixes:\n- new work" in message
+    assert "old work" not in message
+
+
+def test_fetching_tags_keeps_a_differing_local_tag(engine, origin):
+    origin.run(["tag", "v0.9.0", "main"])
+    commit_files(engine.session, "refs/heads/develop", {"local.txt": "local\n"})
+    engine.session.run(["tag", "v0.9.0", "develop"])
+    local = _ref(engine.session, "refs/tags/v0.9.0")
+    with pytest.raises(TagAlreadyExistsError, match="Tag 'v0.9.0' differs from origin"):
+        engine.fetch_tags()
+    assert _ref(engine.session, "refs/tags/v0.9.0") == local
+
+
+def test_finish_release_refuses_existing_tag(engine):
+    engine.start_release("1.0.0")
+    engine.session.run(["tag", "v1.0.0", "main"])
+    with pytest.raises(TagAlreadyExistsError):
+        engine.finish_release("1.0.0")
+
+
+def test_one_release_at_a_time(engine):
+    engine.start_release("1.0.0")
+    with pytest.raises(BranchAlreadyExistsError):
+        engine.start_release("1.1.0")
+
+
+def test_rejected_push_leaves_clone_untouched(engine, origin, make_clone):
+    engine.start_feature("login")
+    _publish_commits(engine, "feature/login", count=2)
+    engine.fetch(["develop", "feature/login"], FeatureBranchMergeError)
+    # someone else moves develop after this clone fetched it
+    _move_develop_elsewhere(origin, make_clone)
+    before = _refs(engine.session)
+    with pytest.raises(FeatureBranchMergeError, match="updated on origin in the meantime"):
+        engine.finish_feature("login")
+    assert _refs(engine.session) == before
+    assert _ref(origin, "refs/heads/feature/login") == before["refs/heads/feature/login"]
+
+
+def test_push_declined_by_remote_changes_nothing(engine, origin):
+    engine.start_hotfix("1.0.1")
+    _publish_commits(engine, "hotfix/1.0.1")
+    remote_before = _refs(origin)
+    hook = origin.cwd + "/hooks/pre-receive"
+    with open(hook, "w") as f:
+        f.write("#!/bin/sh\necho declined >&2\nexit 1\n")
+    subprocess.run(["chmod", "+x", hook], check=True)
+    before = _refs(engine.session)
+    with pytest.raises(subprocess.CalledProcessError):
+        engine.finish_hotfix("1.0.1")
+    assert _refs(engine.session) == before
+    assert _refs(origin) == remote_before
+
+
+def test_diverged_develop_is_refused(engine, origin, make_clone):
+    engine.start_feature("login")
+    _publish_commits(engine, "feature/login")
+    _move_develop_elsewhere(origin, make_clone)
+    commit_files(engine.session, "refs/heads/develop", {"local.txt": "local\n"})
+    # a new run, which fetches develop again
+    with pytest.raises(FeatureBranchMergeError, match="have diverged"):
+        GitFlowEngine(engine.session).finish_feature("login")
+    assert _ref(origin, "refs/heads/feature/login") is not None
+
+
+def test_merge_conflict_is_reported_and_changes_nothing(engine, origin):
+    engine.start_release("1.0.0")
+    _publish_commits(engine, "release/1.0.0", files={"version.txt": "1.0.0\n"})
+    commit_files(engine.session, "refs/heads/main", {"version.txt": "0.9.1\n"})
+    engine.session.run(["push", "-q", "origin", "main"])
+    remote_before = _refs(origin)
+    with pytest.raises(ReleaseBranchMergeError, match="merge conflicts in: version.txt"):
+        engine.finish_release("1.0.0")
+    assert _refs(origin) == remote_before
+    assert _ref(engine.session, "refs/tags/v1.0.0") is None
+
+
+def test_finish_missing_branch(engine):
+    with pytest.raises(HotfixBranchMergeError, match="does not exist"):
+        engine.finish_hotfix("9.9.9")
+
+
+@pytest.fixture
+def streams(engine, monkeypatch):
+    """Results of the commands the engine streamed, in order."""
+    results = []
+    stream = engine.session.stream
+
+    def recording(*args, **kwargs):
+        results.append(stream(*args, **kwargs))
+        return results[-1]
+
+    monkeypatch.setattr(engine.session, "stream", recording)
+    return results
+
+
+def test_merge_conflict_stops_merge_tree_and_counts_every_file(engine, streams):
+    # long names, so the list of conflicting paths outgrows the kept tail
+    names = ["conflicting-file-with-a-rather-long-name-%04d.txt" % index for index in range(300)]
+    engine.start_feature("wide")
+    _publish_commits(engine, "feature/wide", files={name: "feature\n" for name in names})
+    commit_files(engine.session, "refs/heads/develop", {name: "develop\n" for name in names})
+    engine.session.run(["push", "-q", "origin", "develop"])
+    with pytest.raises(FeatureBranchMergeError) as error:
+        engine.finish_feature("wide")
+    merge = [result for result in streams if result.args[1] == "merge-tree"][-1]
+    assert merge.stopped == "conflict"
+    listed = error.value.message.partition("in: ")[2].partition(" and ")[0].split(", ")
+    assert listed and listed == names[-len(listed):]
+    assert " and %d more files." % (len(names) - len(listed)) in error.value.message
+
+
+def test_rejected_push_is_stopped_on_its_signature(engine, origin, make_clone, streams):
+    engine.start_feature("login")
+    _publish_commits(engine, "feature/login", count=2)
+    engine.fetch(["develop", "feature/login"], FeatureBranchMergeError)
+    _move_develop_elsewhere(origin, make_clone)
+    with pytest.raises(FeatureBranchMergeError):
+        engine.finish_feature("login")
+    assert streams[-1].args[1] == "push" and streams[-1].stopped == "diverged"
+
+
+def test_tag_only_on_the_remote_is_stopped_on_its_signature(engine, origin, streams):
+    engine.start_release("1.0.0")
+    origin.run(["tag", "v1.0.0", "develop"])
+    with pytest.raises(TagAlreadyExistsError, match="already exists on origin"):
+        engine.finish_release("1.0.0", notes=False)
+    assert streams[-1].args[1] == "push" and streams[-1].stopped == "tag_exists"
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from gitflow.gitflow import GitConfigError, git_configure_many
+from gitflow.run import GitSession
+
+
+@pytest.fixture
+def config(tmp_path, env):
+    """Path of a config file, and a function reading it back with git."""
+    path = str(tmp_path / "gitconfig")
+    session = GitSession(str(tmp_path), env)
+
+    def read():
+        output = session.run(["config", "--file", path, "--null", "--list"]).stdout.decode()
+        return dict(entry.split("\n", 1) for entry in output.split("\0") if entry)
+
+    return path, session, read
+
+
+def _write(path, content):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_creates_sections_and_subsections(config):
+    path, session, read = config
+    changed = git_configure_many({"user.name": "bot", 'url.https://x/"y".insteadOf': "git://x/",
+                                  "gitflow.prefix.feature": "feature/"}, session, path)
+    assert changed == ["user.name", 'url.https://x/"y".insteadOf', "gitflow.prefix.feature"]
+    assert read() == {"user.name": "bot", 'url.https://x/"y".insteadof': "git://x/",
+                      "gitflow.prefix.feature": "feature/"}
+
+
+def test_quoted_values(config):
+    path, session, read = config
+    _write(path, '[alias]\n\tlg = "log --format=\\"%h #%s\\"" ; comment\n\tst = status\n')
+    value = 'log --oneline; echo "#done"\t'
+    git_configure_many({"alias.lg": value, "alias.co": " checkout "}, session, path)
+    assert read() == {"alias.st": "status", "alias.lg": value, "alias.co": " checkout "}
+
+
+def test_replaces_continued_values(config):
+    path, session, read = config
+    _write(path, '[core]\n\teditor = vim \\\n  -n\n\tpager = "less \\\n -R ; not a comment \\\n -S"\n'
+                 '\tcomment = x # not continued \\\n[user]\n\tname = someone\n')
+    git_configure_many({"core.editor": "nano", "core.pager": "more"}, session, path)
+    assert read() == {"core.editor": "nano", "core.pager": "more", "core.comment": "x",
+                      "user.name": "someone"}
+    git_configure_many({"user.name": "bot", "user.email": "bot@example.com"}, session, path)
+    assert read()["user.name"] == "bot"
+
+
+def test_keeps_continued_values_of_other_keys(config):
+    path, session, read = config
+    _write(path, "[core]\n\teditor = vim \\\n[user] \\\n\tname = x\n")
+    git_configure_many({"user.name": "bot"}, session, path)
+    assert read() == {"core.editor": "vim [user]  name = x", "user.name": "bot"}
+
+
+def test_skips_unchanged_keys(config):
+    path, session, read = config
+    git_configure_many({"user.name": "bot", "user.email": "bot@example.com"}, session, path)
+    before = os.stat(path).st_mtime_ns
+    assert git_configure_many({"user.name": "bot", "user.email": "bot@example.com"}, session, path) == []
+    assert os.stat(path).st_mtime_ns == before
+    assert git_configure_many({"user.name": "bot", "user.email": "other@example.com"}, session, path) == \
+        ["user.email"]
+
+
+def test_existing_lock_is_left_alone(config):
+    path, session, read = config
+    _write(path, "[user]\n\tname = someone\n")
+    _write(path + ".lock", "held by another git\n")
+    with pytest.raises(GitConfigError, match="exists"):
+        git_configure_many({"user.name": "bot"}, session, path)
+    with open(path + ".lock") as f:
+        assert f.read() == "held by another git\n"
+    assert read() == {"user.name": "someone"}
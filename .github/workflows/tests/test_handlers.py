@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from benchmarks.fixtures import commit_files
+from gitflow import handlers
+from gitflow.gitflow import git_flow_initialized
+from gitflow.run import GitSession
+
+
+@pytest.fixture
+def checkout(origin, make_clone, env, monkeypatch):
+    """A CI-style clone as the current directory, where the handlers act."""
+    origin.run(["tag", "-a", "-m", "Release 0.1.0", "v0.1.0", "main"])
+    session = make_clone(origin, checkout=True)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.chdir(session.cwd)
+    return session
+
+
+def test_importing_main_sets_up_no_logging():
+    code = "import logging, main; root = logging.getLogger(); print(len(root.handlers), root.level)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            stdout=subprocess.PIPE, check=True).stdout.decode().split()
+    assert output == ["0", str(30)]
+
+
+def test_main_requires_a_token():
+    env = {key: value for key, value in os.environ.items() if key != "GH_TOKEN"}
+    result = subprocess.run([sys.executable, "main.py"], cwd=os.path.dirname(os.path.dirname(__file__)), env=env,
+                            stderr=subprocess.PIPE)
+    assert result.returncode == 1
+    assert result.stderr.decode().strip() == "GH_TOKEN is not set"
+
+
+def test_configured_clone_counts_as_initialized(origin, make_clone, env, monkeypatch):
+    session = make_clone(origin, configure=False)
+    session.run(["branch", "develop", "origin/develop"])
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.chdir(session.cwd)
+    main.configure_git()
+    assert git_flow_initialized(GitSession(session.cwd, env))
+
+
+def test_unstable_release_counts_tags_on_the_remote(checkout, origin):
+    assert checkout.rev_parse("refs/tags/v0.1.0") is None
+    handlers.unstable_release({"bump": "patch"})
+    assert origin.rev_parse("refs/heads/release/0.1.1") == origin.rev_parse("refs/heads/develop")
+
+
+def test_unstable_release_defaults_to_minor(checkout, origin):
+    handlers.unstable_release({})
+    assert origin.rev_parse("refs/heads/release/0.2.0") is not None
+
+
+def test_hotfix_start_and_finish(checkout, origin):
+    handlers.start_hotfix({"hotfix_name": "0.1.1"})
+    assert origin.rev_parse("refs/heads/hotfix/0.1.1") == origin.rev_parse("refs/heads/main")
+    commit_files(checkout, "refs/heads/hotfix/0.1.1", {"fix.txt": "fixed\n"})
+    checkout.run(["push", "-q", "origin", "hotfix/0.1.1"])
+    handlers.finish_hotfix({"hotfix_name": "0.1.1"})
+    assert origin.rev_parse("refs/tags/v0.1.1^{commit}") == origin.rev_parse("refs/heads/main")
+    assert origin.rev_parse("refs/heads/hotfix/0.1.1") is None
+    assert origin.run(["merge-base", "--is-ancestor", "main", "develop"], check=False).returncode == 0
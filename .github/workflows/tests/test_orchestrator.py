@@ -0,0 +1,35 @@
+import os
+
+from benchmarks.fixtures import release_clones
+from gitflow.orchestrator import FAILED, OK, SKIPPED, orchestrate
+from gitflow.run import GitSession
+
+DEPENDENCIES = {
+    "core": [],
+    "lib": ["core"],
+    "tool": ["core"],
+    "app": ["lib"],
+}
+
+
+def test_failure_skips_only_dependants(tmp_path, env):
+    clones = release_clones(str(tmp_path), env, DEPENDENCIES, conflicting=("lib",))
+    results = orchestrate("finish_release", "core", DEPENDENCIES, clones, "1.0", downstream_scope=-1,
+                          processes=2, env=env)
+    statuses = {result.repository: result.status for result in results}
+    assert statuses == {"core": OK, "lib": FAILED, "tool": OK, "app": SKIPPED}
+    assert [result.repository for result in results].index("core") == 0
+    errors = {result.repository: result.error for result in results}
+    assert errors["core"] is None
+    assert "merge conflicts" in errors["lib"]
+    assert errors["app"] == "Dependency 'lib' failed"
+    for repo, released in (("core", True), ("tool", True), ("lib", False), ("app", False)):
+        remote = GitSession(os.path.join(str(tmp_path), "remotes", repo + ".git"), env)
+        assert (remote.rev_parse("refs/tags/v1.0") is not None) == released
+
+
+def test_scope_limits_repositories(tmp_path, env):
+    clones = release_clones(str(tmp_path), env, DEPENDENCIES)
+    results = orchestrate("finish_release", "lib", DEPENDENCIES, clones, "1.0", upstream_scope=-1, processes=1,
+                          env=env)
+    assert [(result.repository, result.status) for result in results] == [("core", OK), ("lib", OK)]
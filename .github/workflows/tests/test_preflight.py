@@ -0,0 +1,38 @@
+from benchmarks.fixtures import commit_files
+from gitflow.engine import GitFlowEngine
+from gitflow.preflight import preflight, preflight_many
+
+
+def _feature(session, name, files):
+    session.run(["branch", "feature/%s" % name, "origin/develop"])
+    commit_files(session, "refs/heads/feature/%s" % name, files)
+    session.run(["push", "-q", "origin", "feature/%s" % name])
+
+
+def test_preflight_reports_conflicts_and_clean_merges(clone):
+    engine = GitFlowEngine(clone)
+    engine.init()
+    _feature(clone, "clean", {"clean.txt": "clean\n"})
+    _feature(clone, "clash", {"shared.txt": "feature\n", "other.txt": "other\n"})
+    commit_files(clone, "refs/heads/develop", {"shared.txt": "develop\n"})
+    clone.run(["push", "-q", "origin", "develop"])
+    before = clone.run(["for-each-ref"]).stdout
+    reports = {report.name: report for report in preflight_many("finish_feature", engine=GitFlowEngine(clone))}
+    assert sorted(reports) == ["clash", "clean"]
+    assert reports["clean"].ok
+    assert reports["clash"].merges[0].conflicts == ["shared.txt"]
+    assert reports["clash"].merges[0].conflict_count == 1
+    assert "conflicts in shared.txt" in reports["clash"].describe()
+    assert clone.run(["for-each-ref"]).stdout == before
+
+
+def test_preflight_release_checks_both_merges(clone):
+    engine = GitFlowEngine(clone)
+    engine.init()
+    engine.start_release("1.0.0")
+    commit_files(clone, "refs/heads/release/1.0.0", {"version.txt": "1.0.0\n"})
+    clone.run(["push", "-q", "origin", "release/1.0.0"])
+    report = preflight("finish_release", "1.0.0", GitFlowEngine(clone))
+    assert report.ok
+    assert [(merge.source, merge.target) for merge in report.merges] == [("release/1.0.0", "main"),
+                                                                         ("main", "develop")]
@@ -0,0 +1,73 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.fixtures import synthetic_tree
+from gitflow.dependencies import DependencyGraph, get_release_waves
+from gitflow.snapshot import CompactGraph, SnapshotError, load_graph, parse_manifest, write_snapshot
+
+# shared dependencies, a diamond and a repository nothing depends on
+DAG = {
+    "app": ["lib", "ui"],
+    "ui": ["lib", "core"],
+    "lib": ["core"],
+    "core": [],
+    "tool": ["core"],
+    "docs": [],
+}
+
+
+def _manifest(tmp_path, dependencies):
+    path = str(tmp_path / "dependencies.json")
+    with open(path, "w") as f:
+        json.dump(dependencies, f)
+    return path
+
+
+@pytest.mark.parametrize("dependencies", [DAG, synthetic_tree(300, seed=3)], ids=["dag", "tree"])
+def test_queries_match_dependency_graph(tmp_path, dependencies):
+    expected = DependencyGraph(dependencies)
+    with load_graph(_manifest(tmp_path, dependencies)) as graph:
+        assert sorted(graph.repos) == sorted(expected.repos)
+        for repo in expected.repos:
+            for depth in (-1, 0, 1, 2):
+                assert sorted(graph.upstream(repo, depth)) == sorted(expected.upstream(repo, depth))
+                assert sorted(graph.downstream(repo, depth)) == sorted(expected.downstream(repo, depth))
+            assert get_release_waves(repo, graph, -1, -1) == get_release_waves(repo, expected, -1, -1)
+            assert get_release_waves(repo, graph, 1, 2) == get_release_waves(repo, expected, 1, 2)
+
+
+def test_close_while_adjacency_is_held(tmp_path):
+    graph = load_graph(_manifest(tmp_path, DAG))
+    dependencies = graph._forward[graph._ids.get("app")]
+    names = sorted(graph._names[node] for node in dependencies)
+    graph.close()
+    graph.close()
+    assert names == ["lib", "ui"]
+    assert len(dependencies) == 2
+
+
+def test_rejects_dependencies_that_are_not_lists(tmp_path):
+    with pytest.raises(SnapshotError, match="dependencies of app must be a list"):
+        parse_manifest(_manifest(tmp_path, {"app": "lib", "lib": []}))
+    with pytest.raises(SnapshotError, match="dependencies of app must be a list"):
+        parse_manifest(_manifest(tmp_path, {"app": [["lib"]], "lib": []}))
+    assert parse_manifest(_manifest(tmp_path, {"app": None})) == {"app": []}
+
+
+def test_rebuilt_when_manifest_changes(tmp_path):
+    manifest = _manifest(tmp_path, DAG)
+    with load_graph(manifest) as graph:
+        assert graph.downstream("tool") == []
+    _manifest(tmp_path, dict(DAG, app=["tool"]))
+    with load_graph(manifest) as graph:
+        assert graph.downstream("tool") == ["app"]
+
+
+def test_truncated_snapshot(tmp_path):
+    path = str(tmp_path / "dependencies.graph")
+    write_snapshot(DAG, path)
+    os.truncate(path, os.path.getsize(path) - 1)
+    with pytest.raises(SnapshotError, match="truncated"):
+        CompactGraph(path)
@@ -0,0 +1,127 @@
+import contextvars
+import json
+import threading
+
+import pytest
+
+from gitflow import tracing
+from gitflow.run import GitSession
+
+
+@pytest.fixture
+def trace(tmp_path):
+    """The active tracer and a function reading back the records in its file."""
+    path = str(tmp_path / "trace.jsonl")
+    tracer = tracing.enable(path)
+
+    def records():
+        tracer._file.flush()
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    yield tracer, records
+    tracing.disable()
+
+
+def test_nested_spans_record_their_parent(trace):
+    tracer, records = trace
+    with tracing.span("outer") as outer:
+        with tracing.span("inner") as inner:
+            with tracing.span("innermost") as innermost:
+                pass
+        with tracing.span("sibling") as sibling:
+            pass
+    with tracing.span("next") as following:
+        pass
+    assert (outer.parent, inner.parent, innermost.parent) == (None, outer.id, inner.id)
+    assert (sibling.parent, following.parent) == (outer.id, None)
+    # finished innermost first
+    assert [(record["name"], record["parent"]) for record in records()] == [
+        ("innermost", inner.id), ("inner", outer.id), ("sibling", outer.id), ("outer", None), ("next", None)]
+
+
+def test_threads_inherit_the_parent_only_from_a_copied_context(trace):
+    tracer, records = trace
+    spans = {}
+
+    def work(name):
+        with tracing.span(name) as span:
+            spans[name] = span
+
+    with tracing.span("submit") as submit:
+        copied = threading.Thread(target=contextvars.copy_context().run, args=(work, "copied"))
+        plain = threading.Thread(target=work, args=("plain",))
+        for thread in (copied, plain):
+            thread.start()
+            thread.join()
+    assert spans["copied"].parent == submit.id
+    assert spans["plain"].parent is None
+    threads = {record["name"]: record["thread"] for record in records()}
+    assert threads["copied"] != threads["submit"]
+
+
+def test_jsonl_records_are_well_formed(trace, tmp_path, env):
+    tracer, records = trace
+    session = GitSession(str(tmp_path), env)
+    with pytest.raises(ValueError):
+        with tracing.span("action", action="start_feature") as span:
+            span.set(feature="login")
+            session.run(["init", "-q", "repository"])
+            session.run(["rev-parse", "--verify", "HEAD"], check=False)
+            raise ValueError("stop")
+    git, failed, action = records()
+    with open(tracer.path) as f:
+        assert f.read().count("\n") == 3
+    for record in (git, failed, action):
+        assert {"id", "parent", "name", "start", "duration", "thread"} <= set(record)
+        assert record["duration"] >= 0
+    assert (git["name"], git["command"], git["returncode"], git["parent"]) == \
+        ("git", "init -q repository", 0, action["id"])
+    assert failed["returncode"] != 0 and failed["stderr_bytes"] > 0
+    assert (action["action"], action["feature"], action["error"]) == ("start_feature", "login", "ValueError")
+    assert "error" not in git
+
+
+def test_summary_totals_match_the_records(trace, tmp_path, env):
+    tracer, records = trace
+    session = GitSession(str(tmp_path), env)
+    session.run(["init", "-q", "repository"])
+    for _ in range(3):
+        session.run(["rev-parse", "--verify", "HEAD"], check=False)
+    for _ in range(2):
+        with tracing.span("batch"):
+            pass
+    expected = {}
+    for record in records():
+        key = record["name"] if "command" not in record else "git " + record["command"].split()[0]
+        count, total, longest, failed = expected.get(key, (0, 0.0, 0.0, 0))
+        expected[key] = (count + 1, total + record["duration"], max(longest, record["duration"]),
+                         failed + bool(record.get("returncode")))
+    assert set(tracer.totals) == {"git init", "git rev-parse", "batch"}
+    for key, (count, total, longest, failed) in expected.items():
+        assert tracer.totals[key][0] == count and tracer.totals[key][3] == failed
+        assert tracer.totals[key][1] == pytest.approx(total)
+        assert tracer.totals[key][2] == longest
+    assert expected["git rev-parse"][0] == expected["git rev-parse"][3] == 3
+    # the name takes the first 32 columns, then count, total, mean, max and failed
+    rows = {line[:32].strip(): line[32:].split() for line in tracer.summary().splitlines()[1:]}
+    assert list(rows) == sorted(expected, key=lambda key: -tracer.totals[key][1])
+    for key, (count, total, longest, failed) in expected.items():
+        assert (int(rows[key][0]), int(rows[key][4])) == (count, failed)
+        assert float(rows[key][1]) == pytest.approx(total, abs=0.001)
+
+
+def test_disabled_tracing_records_nothing(tmp_path):
+    tracer = tracing.enable(str(tmp_path / "trace.jsonl"))
+    assert tracing.disable() is tracer
+    assert not tracing.enabled()
+    with tracing.span("ignored") as span:
+        span.set(x=1)
+
+    @tracing.traced
+    def operation():
+        return "done"
+
+    assert operation() == "done"
+    assert tracer.totals == {}
+    assert tracing.disable() is None
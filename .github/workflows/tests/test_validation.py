@@ -0,0 +1,75 @@
+import logging
+
+import pytest
+
+from gitflow.validation import PayloadError, check_refs, parse_names, validate_event, validate_payload
+
+
+def test_parse_names():
+    assert parse_names("login, search,") == ["login", "search"]
+    assert parse_names(["login", " search", ""]) == ["login", "search"]
+    assert parse_names(" , ") == []
+
+
+@pytest.mark.parametrize("inputs, problem", [
+    ({"feature_name": ["login", ""]}, None),
+    ({"feature_name": ""}, "feature_name is required"),
+    ({"feature_name": [""]}, "feature_name is required"),
+    ({"feature_name": ["login", 1]}, "feature_name must be a list of strings"),
+    ({"feature_name": "login, login"}, "feature_name lists a name more than once"),
+    ({"feature_name": "log..in"}, "feature_name 'log..in' is not a valid branch name"),
+])
+def test_validate_payload(inputs, problem):
+    assert validate_payload("finish_feature", {"inputs": inputs}) == ([problem] if problem else [])
+
+
+def test_validate_payload_single_name():
+    assert validate_payload("start_release", {"inputs": {"release_name": "1.0.0,1.1.0"}}) == \
+        ["release_name takes a single name, not 2"]
+
+
+@pytest.fixture
+def checkout(origin, make_clone):
+    origin.run(["branch", "feature/login", "develop"])
+    origin.run(["tag", "v1.0.0", "main"])
+    return make_clone(origin, checkout=True)
+
+
+def test_missing_develop_is_created_by_init(make_origin, make_clone):
+    checkout = make_clone(make_origin(develop=False), checkout=True)
+    assert check_refs("start_feature", {"feature_name": "login"}, checkout) == []
+    assert check_refs("start_release", {"release_name": "1.0.0"}, checkout) == []
+
+
+def test_missing_master(make_clone, origin):
+    origin.run(["symbolic-ref", "HEAD", "refs/heads/develop"])
+    origin.run(["branch", "-D", "main"])
+    checkout = make_clone(origin, checkout=True)
+    assert check_refs("finish_hotfix", {"hotfix_name": "1.0.1"}, checkout) == \
+        ["Branch 'main' does not exist on origin.", "Branch 'hotfix/1.0.1' does not exist on origin."]
+
+
+def test_finish_features_some_missing(checkout, caplog):
+    with caplog.at_level(logging.WARNING):
+        assert check_refs("finish_feature", {"feature_name": "login, missing"}, checkout) == []
+    assert "finish_feature missing will fail" in caplog.text
+    assert check_refs("finish_feature", {"feature_name": ["missing", "gone"]}, checkout) == \
+        ["Branch 'feature/missing' does not exist on origin.", "Branch 'feature/gone' does not exist on origin."]
+
+
+def test_finish_release(checkout, origin):
+    origin.run(["branch", "release/1.0.0", "develop"])
+    origin.run(["branch", "release/1.1.0", "develop"])
+    assert check_refs("finish_release", {"release_name": "1.1.0"}, checkout) == []
+    assert check_refs("finish_release", {"release_name": "1.0.0"}, checkout) == \
+        ["Tag 'v1.0.0' already exists on origin."]
+    assert check_refs("start_release", {"release_name": "1.2.0"}, checkout) == \
+        ["There is an existing release branch 'release/1.0.0'. Finish that one first."]
+
+
+def test_validate_event_lists_every_problem(checkout):
+    with pytest.raises(PayloadError) as error:
+        validate_event({"action": "start_feature", "client_payload": {"inputs": {"feature_name": "login"}}},
+                       checkout)
+    assert error.value.problems == ["Branch 'feature/login' already exists on origin."]
+    validate_event({"action": "start_feature", "client_payload": {"inputs": {"feature_name": "search"}}}, checkout)
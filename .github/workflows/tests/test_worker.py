@@ -0,0 +1,111 @@
+import json
+import os
+import socket
+
+import pytest
+
+import main
+from gitflow.worker import DirectoryQueue, EventWorker, SocketQueue, send_event
+
+
+def _enqueue(directory, name, payload):
+    # written elsewhere and renamed in, like a producer does
+    path = os.path.join(str(directory), "." + name)
+    with open(path, "w") as f:
+        f.write(payload if isinstance(payload, str) else json.dumps(payload))
+    os.rename(path, os.path.join(str(directory), name))
+
+
+def test_directory_queue_claims_and_acknowledges(tmp_path):
+    queue = DirectoryQueue(str(tmp_path))
+    _enqueue(tmp_path, "1.json", {"action": "start_feature"})
+    assert queue.depth() == 1
+    event = queue.get(timeout=0)
+    assert (event.id, event.payload) == ("1.json", {"action": "start_feature"})
+    assert queue.depth() == 0
+    assert os.listdir(str(tmp_path / ".processing")) == ["1.json"]
+    queue.done(event)
+    assert os.listdir(str(tmp_path / ".processing")) == []
+    assert queue.get(timeout=0) is None
+
+
+def test_directory_queue_sets_unreadable_events_aside(tmp_path):
+    queue = DirectoryQueue(str(tmp_path))
+    _enqueue(tmp_path, "broken.json", "{not json")
+    _enqueue(tmp_path, "good.json", {"action": "start_feature"})
+    assert queue.get(timeout=0).id == "good.json"
+    assert os.listdir(str(tmp_path / "failed")) == ["broken.json"]
+
+
+def test_failed_event_is_kept_and_requeued(tmp_path):
+    queue = DirectoryQueue(str(tmp_path))
+    _enqueue(tmp_path, "1.json", {"attempt": 1})
+    handled = []
+
+    def failing(payload):
+        raise RuntimeError("remote unreachable")
+
+    worker = EventWorker(queue, failing, report_interval=None)
+    worker.run(drain=True)
+    assert os.listdir(str(tmp_path / "failed")) == ["1.json"]
+    assert worker.metrics.snapshot()["failed"] == 1
+
+    assert queue.requeue() == 1
+    worker = EventWorker(queue, handled.append, report_interval=None)
+    worker.run(drain=True)
+    assert handled == [{"attempt": 1}]
+    assert os.listdir(str(tmp_path / "failed")) == []
+    assert worker.metrics.snapshot()["processed"] == 1
+
+
+def test_socket_round_trip(tmp_path):
+    path = str(tmp_path / "events.sock")
+    queue = SocketQueue(path)
+    try:
+        assert send_event(path, {"action": "start_feature"}) == "queued"
+        event = queue.get(timeout=5)
+        assert event.payload == {"action": "start_feature"}
+        assert event.id == "socket-1"
+        with pytest.raises(TypeError):
+            send_event(path, object())
+        assert queue.get(timeout=0.1) is None
+    finally:
+        queue.close()
+    assert not os.path.exists(path)
+
+
+def test_socket_rejects_unreadable_documents(tmp_path):
+    path = str(tmp_path / "events.sock")
+    queue = SocketQueue(path)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.sendall(b"{not json")
+            client.shutdown(socket.SHUT_WR)
+            assert client.makefile().readline().startswith("error: ")
+        # a client hanging up before the answer does not stop the queue
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+        assert queue.depth() == 0
+        assert send_event(path, {"action": "start_feature"}) == "queued"
+    finally:
+        queue.close()
+
+
+def test_serve_dispatches_to_the_handler(tmp_path, origin, make_clone, env, monkeypatch):
+    checkout = make_clone(origin, checkout=True, configure=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    # serve() would otherwise install its logging and signal handlers into the test process
+    monkeypatch.setattr(main, "configure_logging", lambda: None)
+    monkeypatch.setattr("signal.signal", lambda *args: None)
+    queue = tmp_path / "queue"
+    (queue / "failed").mkdir(parents=True)
+    _enqueue(queue, "1.json", {"action": "start_feature", "client_payload": {"inputs": {"feature_name": "login"}}})
+    _enqueue(queue / "failed", "2.json",
+             {"action": "start_hotfix", "client_payload": {"inputs": {"hotfix_name": "1.0.1"}}})
+    main.serve(["--queue-dir", str(queue), "--workspace", checkout.cwd, "--drain", "--report-interval", "60",
+                "--requeue-failed"])
+    assert origin.rev_parse("refs/heads/feature/login") == origin.rev_parse("refs/heads/develop")
+    assert origin.rev_parse("refs/heads/hotfix/1.0.1") == origin.rev_parse("refs/heads/main")
+    assert os.listdir(str(queue / "failed")) == [] and os.listdir(str(queue / ".processing")) == []
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+
+from gitflow.worktrees import BranchLocks, WorktreePool
+
+
+@pytest.fixture
+def pool(clone, tmp_path, env):
+    directory = tmp_path / "worktrees"
+    directory.mkdir()
+    with WorktreePool(clone.cwd, size=2, directory=str(directory), env=env) as pool:
+        yield pool
+
+
+def test_worktree_is_recycled_and_reset(pool):
+    with pool.checkout("develop") as session:
+        first = session.cwd
+        session.run(["checkout", "-q", "-b", "scratch"])
+        for name in ("staged.txt", "untracked.txt"):
+            with open(os.path.join(session.cwd, name), "w") as f:
+                f.write("left behind\n")
+        session.run(["add", "staged.txt"])
+    with pool.checkout("develop") as session:
+        assert session.cwd == first
+        assert session.run(["status", "--porcelain"]).stdout == b""
+        assert session.run(["symbolic-ref", "-q", "HEAD"], check=False).returncode == 1
+    # the branch the operation checked out is free again
+    pool.repository.run(["branch", "-D", "scratch"])
+    assert (pool.created, pool.recycled) == (1, 2)
+
+
+def _overlap(pool, first, second):
+    """Whether operations holding ``first`` and ``second`` ran at the same time."""
+    inside = []
+    overlapped = threading.Event()
+
+    def operation(branches):
+        with pool.checkout(*branches):
+            inside.append(branches)
+            if len(inside) == 2:
+                overlapped.set()
+            overlapped.wait(0.3)
+            inside.remove(branches)
+
+    threads = [threading.Thread(target=operation, args=(branches,)) for branches in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return overlapped.is_set()
+
+
+def test_same_branch_is_serialized(pool):
+    assert not _overlap(pool, ("develop", "feature/a"), ("develop", "feature/b"))
+
+
+def test_different_branches_run_in_parallel(pool):
+    assert _overlap(pool, ("develop", "feature/a"), ("main", "hotfix/1.0.1"))
+
+
+def test_worktree_is_released_when_the_operation_raises(pool):
+    with pytest.raises(RuntimeError):
+        with pool.checkout("develop") as session:
+            path = session.cwd
+            raise RuntimeError("operation failed")
+    assert "develop" not in pool.locks
+    with pool.checkout("develop") as session:
+        assert session.cwd == path
+    assert pool.created == 1
+
+
+def test_branch_locks_are_dropped_when_released():
+    locks = BranchLocks()
+    with locks.hold("develop", "feature/a", "develop"):
+        assert "develop" in locks and "feature/a" in locks
+    assert "develop" not in locks and "feature/a" not in locks
+
+
+def test_checkout_waits_for_a_free_worktree(pool):
+    started = time.monotonic()
+
+    def hold(branch):
+        with pool.checkout(branch):
+            time.sleep(0.2)
+
+    threads = [threading.Thread(target=hold, args=(branch,)) for branch in ("feature/a", "feature/b")]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    with pool.checkout("feature/c"):
+        waited = time.monotonic()
+    for thread in threads:
+        thread.join()
+    assert waited - started >= 0.19
+    assert pool.created == 2